@@ -0,0 +1,215 @@
+from stl import mesh
+import numpy as np
+import datetime
+import os
+import struct
+from setting import __version__, __title__
+
+# The size of the header of a binary STL file, it is followed by the uint32 count of the triangles
+STL_HEADER_SIZE = 80
+
+# The triangles whose normals are calculated at once when an STL file is written
+STL_BLOCK_ROWS = 1 << 20
+
+
+def triangles(vertices, faces):
+    """
+    Gather the corners of the faces
+    :param numpy.ndarray vertices: the (n, 3) vertices
+    :param numpy.ndarray faces: the (m, 3) vertex indices of the faces
+    :return: the (m, 3, 3) corners of each face
+    :rtype numpy.ndarray
+    """
+    return np.asarray(vertices)[np.asarray(faces, dtype=np.intp)]
+
+
+def face_normals(vectors):
+    """
+    Get the unit normals of the faces, the normal of a degenerate face stays zero
+    :param numpy.ndarray vectors: the (m, 3, 3) corners of each face
+    :return: the (m, 3) normals
+    :rtype numpy.ndarray
+    """
+    normals = np.cross(vectors[:, 1] - vectors[:, 0], vectors[:, 2] - vectors[:, 0])
+    norms = np.sqrt((normals * normals).sum(axis=1))
+
+    nonzero = norms != 0
+    normals[nonzero] /= norms[nonzero, np.newaxis]
+    return normals
+
+
+def unique_rows(rows):
+    """
+    Number the distinct rows in the order of their first appearance, -0.0 and 0.0 are the same value
+    :param numpy.ndarray rows: the (n, k) rows
+    :return: (unique, indices), the (m, k) distinct rows and the index of each row into them
+    :rtype tuple
+    """
+    rows = np.ascontiguousarray(rows + rows.dtype.type(0))
+    keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).reshape(-1)
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rows[first[order]], rank[inverse]
+
+
+def stl_mesh(vertices, faces):
+    """
+    Build the STL mesh of the faces, the normals are left to the STL writer
+    :param numpy.ndarray vertices: the (n, 3) vertices
+    :param numpy.ndarray faces: the (m, 3) vertex indices of the faces
+    :return: the mesh
+    :rtype mesh.Mesh
+    """
+    data = np.zeros(len(faces), dtype=mesh.Mesh.dtype)
+    data['vectors'] = triangles(vertices, faces)
+
+    return mesh.Mesh(data, calculate_normals=False)
+
+
+def write_stl(filename, data, faces=None, memmap=False):
+    """
+    Write a binary STL file: the 80 byte header, the count and the records of the triangles, whose normals are
+    calculated here. The records are one buffer of mesh.Mesh.dtype written at once.
+    :param str filename: the output filename
+    :param numpy.ndarray data: the triangles of mesh.Mesh.dtype, the (m, 3, 3) corners of the faces or the (n, 3)
+                               vertices of the faces. The normals of the triangles are updated in place unless
+                               memmap is set.
+    :param numpy.ndarray faces: the (m, 3) vertex indices of the faces, None when data are the triangles or the
+                                corners
+    :param bool memmap: write the records into the memory mapped file instead of a buffer of all of them, for the
+                        meshes which are too large to be copied in memory
+    :return:
+    """
+    if faces is not None:
+        count = len(faces)
+    else:
+        count = len(data)
+
+    header = '{} ({}) {} {}'.format(__title__, __version__, datetime.datetime.now(), os.path.basename(filename))
+    header = header[:STL_HEADER_SIZE].ljust(STL_HEADER_SIZE) + struct.pack('<I', count)
+
+    if memmap:
+        with open(filename, 'wb') as fh:
+            fh.write(header)
+            fh.truncate(len(header) + count * mesh.Mesh.dtype.itemsize)
+        if not count:
+            return
+
+        records = np.memmap(filename, dtype=mesh.Mesh.dtype, mode='r+', offset=len(header), shape=(count,))
+        for start in xrange(0, count, STL_BLOCK_ROWS):
+            block = records[start:start + STL_BLOCK_ROWS]
+            block['vectors'] = _stl_vectors(data, faces, start, start + len(block))
+            block['normals'] = face_normals(block['vectors'])
+            block['attr'] = 0
+        records.flush()
+        del records
+        return
+
+    if data.dtype == mesh.Mesh.dtype:
+        records = data
+    else:
+        records = np.zeros(count, dtype=mesh.Mesh.dtype)
+        records['vectors'] = _stl_vectors(data, faces, 0, count)
+
+    for start in xrange(0, count, STL_BLOCK_ROWS):
+        vectors = records['vectors'][start:start + STL_BLOCK_ROWS]
+        records['normals'][start:start + STL_BLOCK_ROWS] = face_normals(vectors)
+
+    with open(filename, 'wb') as fh:
+        fh.write(header)
+        records.tofile(fh)
+
+
+def _stl_vectors(data, faces, start, stop):
+    """
+    Get the corners of some faces for write_stl
+    :return: the (stop - start, 3, 3) corners
+    :rtype numpy.ndarray
+    """
+    if faces is not None:
+        return triangles(data, faces[start:stop])
+
+    if data.dtype == mesh.Mesh.dtype:
+        return data['vectors'][start:stop]
+
+    return data[start:stop]
+
+
+class MeshAccumulator(object):
+    def __init__(self, dtype=mesh.Mesh.dtype):
+        """
+        Collect the chunks of a mesh and join them once, instead of growing one array by concatenating every
+        chunk to it
+        :param numpy.dtype dtype: the record type of the triangles
+        """
+        self._dtype = dtype
+        self._chunks = []
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, data):
+        """
+        Append the triangles of a chunk, the chunk is kept until it is joined so it shouldn't be changed
+        :param numpy.ndarray data: the triangles, e.g. the data of a mesh.Mesh
+        :return:
+        """
+        if data is not None and len(data):
+            self._chunks.append(data)
+            self._size += len(data)
+
+    def data(self):
+        """
+        Get all the triangles in one contiguous array, the chunks are released
+        :return: the triangles, None when nothing was appended
+        :rtype numpy.ndarray
+        """
+        if not self._chunks:
+            return None
+
+        if len(self._chunks) > 1:
+            joined = np.empty(self._size, dtype=self._dtype)
+            np.concatenate(self._chunks, out=joined)
+            self._chunks = [joined]
+
+        return self._chunks[0]
+
+
+def place_instances(instances):
+    """
+    Place the instances of meshes into one mesh. An instance is mirrored by a half turn about the y axis,
+    rotated counterclockwise about the z axis and then moved. The instances of a mesh with the same orientation are
+    rotated once and moved together.
+    :param list instances: the (triangles, mirror, rotation in degrees, (x, y, z)) of each instance
+    :return: the triangles of the instances in the order of the instances
+    :rtype numpy.ndarray
+    """
+    sizes = np.array([len(instance[0]) for instance in instances], dtype=np.intp)
+    starts = np.cumsum(sizes) - sizes
+    placed = np.zeros(sizes.sum(), dtype=mesh.Mesh.dtype)
+
+    groups = {}
+    for i, (data, mirror, rotation, offset) in enumerate(instances):
+        groups.setdefault((id(data), mirror, rotation), []).append(i)
+
+    for indices in groups.itervalues():
+        data, mirror, rotation, _ = instances[indices[0]]
+        if not len(data):
+            continue
+
+        oriented = mesh.Mesh(data.copy(), calculate_normals=False)
+        if mirror:
+            oriented.rotate([0, 1, 0], np.radians(180))
+
+        if rotation > 0:
+            oriented.rotate([0, 0, 1], np.radians(-rotation))
+
+        offsets = np.array([instances[i][3] for i in indices], dtype=np.float32)
+        rows = (starts[indices][:, np.newaxis] + np.arange(len(data))).reshape(-1)
+        placed['vectors'][rows] = (oriented.vectors + offsets[:, np.newaxis, np.newaxis, :]).reshape(-1, 3, 3)
+
+    return placed
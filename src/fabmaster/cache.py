@@ -0,0 +1,489 @@
+import cPickle
+import gc
+import hashlib
+import os
+import tempfile
+import numpy as np
+from itertools import izip
+
+import setting
+import shape
+from componet import Component
+from copper import Copper
+from outline import OutLine
+from package import Package
+from pad import Pad
+from pin import ComponentPin, PackagePin
+from table import Categorical
+from setting import CACHE_PATH, CACHE_SIZE
+
+# Bump it when the parsed model changes, so the entries of an older parser are never loaded
+CACHE_VERSION = 4
+
+
+class BoardCache(object):
+    def __init__(self, path=CACHE_PATH, max_size=CACHE_SIZE):
+        """
+        The cache of the parsed boards, an entry is keyed by the content of the FabMaster file, the parser
+        version and the settings. The least recently used entries are removed beyond max_size.
+        :param str path: the directory of the entries
+        :param int max_size: the total size of the entries in bytes
+        """
+        self.path = path
+        self.max_size = max_size
+
+    def key(self, filename):
+        """
+        Get the key of a FabMaster file
+        :param str filename: the FabMaster file
+        :return: the key
+        :rtype str
+        """
+        return '%s-%s' % (_content_digest(filename), _settings_digest())
+
+    def load(self, key, fab):
+        """
+        Load an entry into the board
+        :param str key: the key of the entry
+        :param FabMaster fab: the board to fill
+        :return: whether the entry was loaded
+        :rtype bool
+        """
+        filename = self._entry(key)
+        if not os.path.isfile(filename):
+            return False
+
+        try:
+            load_board(fab, filename)
+        except Exception:
+            # a broken or incompatible entry is parsed again
+            self._remove(filename)
+            return False
+
+        # the modification time orders the entries for the eviction
+        os.utime(filename, None)
+        return True
+
+    def store(self, key, fab):
+        """
+        Store the board as an entry
+        :param str key: the key of the entry
+        :param FabMaster fab: the parsed board
+        :return:
+        """
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                dump_board(fab, f)
+            os.rename(tmp, self._entry(key))
+        except:
+            self._remove(tmp)
+            raise
+
+        self._evict()
+
+    def invalidate(self, filename=None):
+        """
+        Remove the entries of a FabMaster file whatever the settings were, or all entries
+        :param str filename: the FabMaster file, None for all entries
+        :return:
+        """
+        prefix = _content_digest(filename) if filename else ''
+
+        for name in self._entries():
+            if name.startswith(prefix):
+                self._remove(os.path.join(self.path, name))
+
+    def _entry(self, key):
+        return os.path.join(self.path, key + '.npz')
+
+    def _entries(self):
+        if not os.path.isdir(self.path):
+            return []
+
+        return [name for name in os.listdir(self.path) if name.endswith('.npz')]
+
+    def _evict(self):
+        entries = []
+        for name in self._entries():
+            filename = os.path.join(self.path, name)
+            stat = os.stat(filename)
+            entries.append((stat.st_mtime, stat.st_size, filename))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in entries:
+            if total <= self.max_size:
+                break
+
+            self._remove(filename)
+            total -= size
+
+    @staticmethod
+    def _remove(filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+
+def _content_digest(filename):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), ''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def _settings_digest():
+    values = [(k, getattr(setting, k)) for k in sorted(dir(setting)) if k.isupper() and not k.startswith('CACHE_')]
+    return hashlib.sha1(repr((CACHE_VERSION, setting.__version__, values))).hexdigest()[:16]
+
+
+def dump_board(fab, f):
+    """
+    Write the parsed model of a board as arrays: the points of all rings are in one contiguous array and the
+    fields of the records are typed columns, the strings as Categorical codes, so nothing is pickled
+    :param FabMaster fab: the parsed board
+    :param file f: the output file
+    :return:
+    """
+    arrays = dict()
+    rings = Rings()
+
+    refs = fab.components.keys()
+    components = [fab.components[ref] for ref in refs]
+    store_columns(arrays, 'component', components, Component._fields)
+    store_column(arrays, 'component.key', refs)
+    dump_pins(arrays, 'component_pin', ComponentPin, [component.pin for component in components])
+
+    packages = [(i, component.package) for i, component in enumerate(components) if component.package]
+    arrays['package.owner'] = np.array([i for i, _ in packages], dtype=np.int32)
+    dump_packages(arrays, [package for _, package in packages], rings)
+
+    dump_pads(arrays, fab.pads)
+    dump_copper(arrays, fab.copper, rings)
+
+    arrays['outline.rings'] = np.array(rings.append_polygon(fab.outline.geometry), dtype=np.int64)
+    rings.store(arrays)
+
+    np.savez(f, **arrays)
+
+
+class Rings(object):
+    def __init__(self, data=None):
+        """
+        The points of the rings of the polygons in one contiguous array, a ring is a range of the offsets and
+        a polygon is the index of its first ring and the number of rings
+        :param data: the arrays stored by store to read the rings from, None to collect the rings
+        """
+        if data is None:
+            self._rings = []
+        else:
+            self._points = data['points']
+            self._offsets = data['offsets'].tolist()
+
+    def append(self, points):
+        """
+        Append a ring
+        :param points: the flat points
+        :return: the index of the ring
+        :rtype int
+        """
+        self._rings.append(np.asarray(points if points is not None else [], dtype=np.float64).reshape(-1))
+        return len(self._rings) - 1
+
+    def append_polygon(self, geometry):
+        """
+        Append the rings of a polygon, the outer ring first and then the holes
+        :param shape.Polygon geometry: the polygon
+        :return: (first, count)
+        :rtype tuple
+        """
+        first = self.append(geometry.points)
+        for hole in geometry.holes:
+            self.append(hole.points)
+        return first, len(self._rings) - first
+
+    def store(self, arrays):
+        rings = self._rings
+        arrays['points'] = np.concatenate(rings) if rings else np.zeros(0)
+        arrays['offsets'] = np.cumsum([0] + [len(points) for points in rings])
+
+    def ring(self, i):
+        return self._points[self._offsets[i]:self._offsets[i + 1]]
+
+    def polygon(self, first, count):
+        return shape.Polygon.from_points(self.ring(first), [self.ring(i) for i in xrange(first + 1, first + count)])
+
+
+def dump_pins(arrays, name, cls, owners):
+    """
+    Store the pins of several owners as the table name, the owner column is the index into owners
+    :param dict arrays: the arrays of the entry
+    :param str name: the name of the table
+    :param type cls: the Record class of the pins
+    :param list owners: the pin dict of each owner
+    :return:
+    """
+    pins = [(i, num, pin) for i, owner in enumerate(owners) for num, pin in owner.iteritems()]
+    store_columns(arrays, name, [pin for _, _, pin in pins], cls._fields)
+    arrays[name + '.owner'] = np.array([i for i, _, _ in pins], dtype=np.int32)
+    store_column(arrays, name + '.key', [num for _, num, _ in pins])
+
+
+def load_pins(data, name, cls, owners):
+    """
+    Add the pins stored by dump_pins to their owners, in the order the owners had them
+    :param data: the arrays
+    :param str name: the name of the table
+    :param type cls: the Record class of the pins
+    :param list owners: the pin dict of each owner
+    :return:
+    """
+    owner_column = data[name + '.owner'].tolist()
+    pins = load_records(data, name, cls, len(owner_column))
+    for owner, num, pin in izip(owner_column, load_column(data, name + '.key'), pins):
+        owners[owner][num] = pin
+
+
+def dump_packages(arrays, packages, rings):
+    """
+    Store the packages with their body center lines, geometries and pins
+    :param dict arrays: the arrays of the entry
+    :param list packages: the packages
+    :param Rings rings: the rings of the entry
+    :return:
+    """
+    for key in ['SYM_NAME', 'REFDES', 'LAYER']:
+        store_column(arrays, 'package.' + key, [getattr(package, key) for package in packages])
+    arrays['package.center'] = np.array([len(package._center) if package._center else -1
+                                         for package in packages], dtype=np.int32)
+    arrays['package_center.line'] = np.array([line.start + line.end for package in packages
+                                              for line in package._center or []], dtype=np.float64).reshape(-1, 4)
+
+    geometries = [(k, g) for k, package in enumerate(packages) for g in package.geometries]
+    arrays['package_geometry.owner'] = np.array([k for k, _ in geometries], dtype=np.int32)
+    arrays['package_geometry.rings'] = np.array([rings.append_polygon(g) for _, g in geometries],
+                                                dtype=np.int64).reshape(-1, 2)
+
+    dump_pins(arrays, 'package_pin', PackagePin, [package.pin for package in packages])
+
+
+def load_packages(data, rings):
+    """
+    Create the packages stored by dump_packages
+    :param data: the arrays
+    :param Rings rings: the rings of the arrays
+    :return: the packages
+    :rtype list
+    """
+    packages = []
+    lines = data['package_center.line'].tolist()
+    line = 0
+    columns = [load_column(data, 'package.' + key) for key in ['SYM_NAME', 'REFDES', 'LAYER']]
+    for centers, sym_name, refdes, layer in izip(data['package.center'].tolist(), *columns):
+        package = Package()
+        package.SYM_NAME = sym_name
+        package.REFDES = refdes
+        package.LAYER = layer
+        if centers >= 0:
+            package._center = [shape.Line(l[:2], l[2:]) for l in lines[line:line + centers]]
+            line += centers
+        packages.append(package)
+
+    for owner, (first, count) in izip(data['package_geometry.owner'].tolist(),
+                                      data['package_geometry.rings'].tolist()):
+        packages[owner].geometries.append(rings.polygon(first, count))
+    for package in packages:
+        package.geometry = package.geometries[-1] if package.geometries else None
+
+    load_pins(data, 'package_pin', PackagePin, [package.pin for package in packages])
+    return packages
+
+
+def dump_pads(arrays, pads):
+    """
+    Store the pads of each pad name
+    :param dict arrays: the arrays of the entry
+    :param dict pads: the list of pads of each pad name
+    :return:
+    """
+    rows = [(name, pad) for name in pads for pad in pads[name]]
+    store_columns(arrays, 'pad', [pad for _, pad in rows], Pad._fields)
+    store_column(arrays, 'pad.key', [name for name, _ in rows])
+
+
+def load_pads(data):
+    """
+    Create the pads stored by dump_pads, a pad builds its geometry from its fields
+    :param data: the arrays
+    :return: the list of pads of each pad name
+    :rtype dict
+    """
+    pads = dict()
+    keys = load_column(data, 'pad.key')
+    columns = dict((key, load_column(data, 'pad.' + key)) for key in Pad._fields)
+    for k, name in enumerate(keys):
+        pads.setdefault(name, []).append(Pad(dict((key, columns[key][k]) for key in Pad._fields)))
+
+    return pads
+
+
+def dump_copper(arrays, copper, rings):
+    """
+    Store the copper shapes of each layer and net
+    :param dict arrays: the arrays of the entry
+    :param dict copper: the copper of the board, see FabMaster.copper
+    :param Rings rings: the rings of the entry
+    :return:
+    """
+    rows = [(layer, net, kind, c) for layer in copper for net in copper[layer]
+            for kind in ['POLYGON', 'LINE'] for c in copper[layer][net][kind]]
+    for k, key in enumerate(['layer', 'net', 'kind']):
+        store_column(arrays, 'copper.' + key, [row[k] for row in rows])
+    store_column(arrays, 'copper.type', [c.type for _, _, _, c in rows])
+    arrays['copper.width'] = np.array([c.width for _, _, _, c in rows], dtype=np.float64)
+    arrays['copper.rings'] = np.array([rings.append_polygon(c.geometry) if c.geometry else (-1, 0)
+                                       for _, _, _, c in rows], dtype=np.int64).reshape(-1, 2)
+
+
+def load_copper(data, rings):
+    """
+    Create the copper shapes stored by dump_copper
+    :param data: the arrays
+    :param Rings rings: the rings of the arrays
+    :return: the copper of each layer and net
+    :rtype dict
+    """
+    copper = dict()
+    columns = [load_column(data, 'copper.' + key) for key in ['layer', 'net', 'kind', 'type']]
+    for layer, net, kind, copper_type, width, (first, count) in izip(*(columns + [
+            data['copper.width'].tolist(), data['copper.rings'].tolist()])):
+        c = Copper()
+        c.type = copper_type
+        c.width = width
+        c.geometry = rings.polygon(first, count) if first >= 0 else None
+        copper.setdefault(layer, dict()).setdefault(net, {'POLYGON': [], 'LINE': []})[kind].append(c)
+
+    return copper
+
+
+def store_column(arrays, name, values):
+    """
+    Store a column with the type of its values: the strings as the Categorical codes into the categories, -1 for
+    None, the floats and the bools as they are with the mask of the None values. A column of other values is
+    pickled.
+    :param dict arrays: the arrays of the entry
+    :param str name: the name of the column
+    :param list values: the values
+    :return:
+    """
+    types = set(type(v) for v in values) - set([type(None)])
+
+    if types <= set([str]):
+        categorical = Categorical(values)
+        categories = categorical.categories
+        codes = categorical.codes
+        if None in categories:
+            none = categories.index(None)
+            categories = categories[:none] + categories[none + 1:]
+            codes = np.where(codes == none, -1, codes - (codes > none)).astype(np.int32)
+        arrays[name + '.codes'] = codes
+        arrays[name + '.categories'] = np.array(categories, dtype=np.str_)
+    elif types == set([float]) or types == set([bool]):
+        none = np.array([v is None for v in values], dtype=bool)
+        arrays[name + '.values'] = np.array([v or 0 for v in values], dtype=types.pop())
+        if none.any():
+            arrays[name + '.none'] = none
+    else:
+        arrays[name + '.pickle'] = np.frombuffer(cPickle.dumps(values, cPickle.HIGHEST_PROTOCOL), dtype=np.uint8)
+
+
+def store_columns(arrays, name, records, fields):
+    for key in fields:
+        store_column(arrays, '%s.%s' % (name, key), [getattr(record, key, None) for record in records])
+
+
+def load_column(data, name):
+    """
+    Load a column stored by _store_column
+    :param NpzFile data: the entry
+    :param str name: the name of the column
+    :return: the values
+    :rtype list
+    """
+    if name + '.codes' in data:
+        categories = [intern(v) for v in data[name + '.categories'].tolist()] + [None]
+        return np.array(categories, dtype=object)[data[name + '.codes']].tolist()
+
+    if name + '.values' in data:
+        values = data[name + '.values'].tolist()
+        if name + '.none' in data:
+            for i in np.flatnonzero(data[name + '.none']).tolist():
+                values[i] = None
+        return values
+
+    return cPickle.loads(data[name + '.pickle'].tostring())
+
+
+def load_records(data, name, cls, count, **slots):
+    """
+    Create the records of a table without their __init__, the fields are set column by column
+    :param NpzFile data: the entry
+    :param str name: the name of the table
+    :param type cls: the Record class
+    :param int count: the number of records
+    :param slots: the value of the other slots of each record
+    :return: the records
+    :rtype list
+    """
+    records = [cls.__new__(cls) for _ in xrange(count)]
+    for key in cls._fields:
+        map(setattr, records, [key] * count, load_column(data, '%s.%s' % (name, key)))
+    for key, value in slots.iteritems():
+        for record in records:
+            setattr(record, key, value() if callable(value) else value)
+
+    return records
+
+
+def load_board(fab, filename):
+    """
+    Read the parsed model of a board written by dump_board
+    :param FabMaster fab: the board to fill
+    :param str filename: the entry file
+    :return:
+    """
+    # Only new objects are created below, don't let the garbage collector rescan them again and again
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        _load_board(fab, filename)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def _load_board(fab, filename):
+    data = np.load(filename)
+    rings = Rings(data)
+
+    refs = load_column(data, 'component.key')
+    components = load_records(data, 'component', Component, len(refs), pin=dict, package=None, center=None,
+                              _height=0)
+    load_pins(data, 'component_pin', ComponentPin, [component.pin for component in components])
+
+    packages = load_packages(data, rings)
+    for owner, package in izip(data['package.owner'].tolist(), packages):
+        components[owner].package = package
+
+    fab.components = dict(izip(refs, components))
+    fab.pads = load_pads(data)
+    fab.copper = load_copper(data, rings)
+    fab.outline = OutLine()
+    fab.outline.geometry = rings.polygon(*data['outline.rings'].tolist())
@@ -1,38 +1,53 @@
 from pin import ComponentPin
+from record import Record
+import instrument
 from setting import SCALE_RATE, BOARD_HEIGHT, DEFAULT_COMPONENT_HEIGHT
 
 import os
 import svgwrite
 
 
-class Component(object):
-    center = None
-    REFDES = ""
-    package = None
+class Component(Record):
+    # 1 components             'REFDES', 'COMP_CLASS', 'COMP_PART_NUMBER', 'COMP_HEIGHT', 'COMP_DEVICE_LABEL',
+    #                          'COMP_INSERTION_CODE', 'SYM_TYPE', 'SYM_NAME', 'SYM_MIRROR', 'SYM_ROTATE',
+    #                          'SYM_X', 'SYM_Y', 'COMP_VALUE', 'COMP_TOL', 'COMP_VOLTAGE'
+    _fields = (
+        'REFDES', 'COMP_CLASS', 'COMP_PART_NUMBER', 'COMP_HEIGHT', 'COMP_DEVICE_LABEL', 'COMP_INSERTION_CODE',
+        'SYM_TYPE', 'SYM_NAME', 'SYM_MIRROR', 'SYM_ROTATE', 'SYM_X', 'SYM_Y', 'COMP_VALUE', 'COMP_TOL',
+        'COMP_VOLTAGE'
+    )
+    _interned = frozenset([
+        'COMP_CLASS', 'COMP_PART_NUMBER', 'COMP_HEIGHT', 'COMP_DEVICE_LABEL', 'COMP_INSERTION_CODE', 'SYM_TYPE',
+        'SYM_NAME', 'COMP_VALUE', 'COMP_TOL', 'COMP_VOLTAGE'
+    ])
+    __slots__ = _fields + ('pin', 'package', 'center', '_height')
+
+    # the method which gets the height of each type of component
+    _height_func = {
+        'DEFAULT': '_default_height',
+        'RESISTOR': '_resistor_height',
+        'CAPACITOR': '_capacitor_height',
+        'DIODE': '_diode_height',
+        'DISCRETE': '_discrete_height',
+        'INDUCTOR': '_inductor_height',
+        'ZENER': '_zener_height',
+        'FUSE': '_fuse_height',
+        'IC': '_ic_height',
+        'IO': '_io_height'
+    }
 
     def __init__(self, data=None):
         self.pin = dict()
+        self.package = None
+        self.center = None
         self._height = 0
+        self._set_fields(data or {})
 
         if data:
-            for key in data:
-                self.__dict__[key] = data[key]
-
-            self.__dict__['SYM_MIRROR'] = True if data['SYM_MIRROR'] == 'YES' else False
-            self.__dict__['SYM_ROTATE'] = float(data['SYM_ROTATE'])
-
-        self.height_func = {
-            'DEFAULT': self._default_height,
-            'RESISTOR': self._resistor_height,
-            'CAPACITOR': self._capacitor_height,
-            'DIODE': self._diode_height,
-            'DISCRETE': self._discrete_height,
-            'INDUCTOR': self._inductor_height,
-            'ZENER': self._zener_height,
-            'FUSE': self._fuse_height,
-            'IC': self._ic_height,
-            'IO': self._io_height
-        }
+            self.SYM_MIRROR = True if data['SYM_MIRROR'] == 'YES' else False
+            self.SYM_ROTATE = float(data['SYM_ROTATE'])
+        else:
+            self.REFDES = ""
 
     def add_pin(self, data):
         """
@@ -50,41 +65,41 @@ class Component(object):
         if self.package:
             self.package.bind_pads(pads)
 
-    def export_package(self, path, sim=False):
+    def export_package(self, path, sim=False, save=True, library=None):
         """
         Export the package of this component.
         :param str path: the target path to export
         :param bool simulate: the flag of output the model files
+        :param bool save: write the files of the package, otherwise only place the package
+        :param PackageLibrary library: reuse the meshes of the packages which were already built, the files are
+                                       written when the library is flushed
         :return:
         """
-        cx, cy = self.package.center()
-
-        self.package.scale(SCALE_RATE)
-        self.package.translate([-cx * SCALE_RATE, -cy * SCALE_RATE])
-
-        if self.SYM_ROTATE > 0:
-            self.package.rotate(self.SYM_ROTATE)
+        self.package.canonicalize(self.SYM_ROTATE, self.SYM_MIRROR)
+        if not save:
+            return
 
-        if self.SYM_MIRROR:
-            self.package.mirror()
+        self.package.remove_lines()
+        if library is not None:
+            library.save(self.package, self.height, sim)
+            return
 
-        self.package.ccw()
         self.package.save(path, self.height)
 
         if sim:
             self.package.sdf(path)
 
     def export_svg_model(self, path):
-        pads = {}
-        svg_model_dir = os.path.join(path, 'svg')
-
-        if not os.path.exists(svg_model_dir):
-            os.makedirs(svg_model_dir)
+        write_svg_model(path, *self.svg_model_args())
 
-        svg_file = os.path.join(path, 'svg', self.REFDES + '.svg')
-        dwg = svgwrite.Drawing(svg_file, debug=False)
-        group = dwg.g(id=self.REFDES, footprint=self.SYM_NAME)
-        pins = dwg.g(id="component-pins")
+    def svg_model_args(self):
+        """
+        Get what the SVG model is built from as plain values, see write_svg_model
+        :return: the REFDES, the SYM_NAME, the pins, the points of the bodies and the points of the pads
+        :rtype tuple
+        """
+        pins = []
+        pads = {}
 
         # pin info
         for num in self.package.pin:
@@ -95,61 +110,14 @@ class Component(object):
             pad_name = pin.PAD_STACK_NAME
 
             if pad_name not in pads:
-                pads[pad_name] = self.package.pads[pad_name]
-
-            insert_center = (pin.PIN_X * 3543.307, pin.PIN_Y * 3543.307)
-            svg_use = dwg.use(
-                href='#' + pad_name,
-                insert=insert_center,
-                pin_name=pin.PIN_NAME,
-                pin_num=num,
-                pin_net=self.pin[num].NET_NAME
-            )
-            svg_use.rotate(pin.PIN_ROTATION, center=insert_center)
-            pins.add(svg_use)
-
-        # body info
-        body = dwg.g(id="component-body")
-        _min_x_arr = []
-        _min_y_arr = []
-        _max_x_arr = []
-        _max_y_arr = []
-        for geometry in self.package.geometries:
-            if len(geometry.points) > 0:
-                _min_x_arr.append(min(geometry.points[::2]))
-                _min_y_arr.append(min(geometry.points[1::2]))
-                _max_x_arr.append(max(geometry.points[::2]))
-                _max_y_arr.append(max(geometry.points[1::2]))
-
-                points = (geometry.points.reshape(-1, 2) * 3543.307).tolist()
-                svg_shape = dwg.polygon(points, fill="#000")
-                body.add(svg_shape)
-
-        if len(_min_x_arr):
-            min_x = min(_min_x_arr) * 3543.307
-            max_x = max(_max_x_arr) * 3543.307
-            min_y = min(_min_y_arr) * 3543.307
-            max_y = max(_max_y_arr) * 3543.307
-
-            body.translate((max_x - min_x) / 2, (max_y - min_y) / 2)
-            pins.translate((max_x - min_x) / 2, (max_y - min_y) / 2)
-            dwg.viewbox(0, 0, (max_x - min_x), (max_y - min_y))
-
-        for pad_name in pads:
-            sym = dwg.symbol(id=pad_name)
-            pad = pads[pad_name][0]
-
-            if pad.geometry:
-                points = (pad.geometry.points.reshape(-1, 2) * 3543.307).tolist()
-                sym.add(dwg.polygon(points, fill="#999999"))
-
-                dwg.defs.add(sym)
-
-        group.add(body)
-        group.add(pins)
-        dwg.add(group)
-        dwg.save()
+                geometry = self.package.pads[pad_name][0].geometry
+                pads[pad_name] = geometry.points if geometry else None
+
+            pins.append((num, pad_name, pin.PIN_X, pin.PIN_Y, pin.PIN_ROTATION, pin.PIN_NAME, self.pin[num].NET_NAME))
 
+        bodies = [geometry.points for geometry in self.package.geometries if len(geometry.points) > 0]
+
+        return self.REFDES, self.SYM_NAME, pins, bodies, pads.items()
 
     @property
     def height(self):
@@ -164,8 +132,8 @@ class Component(object):
         if self.COMP_HEIGHT:
             return float(self.COMP_HEIGHT) * SCALE_RATE
 
-        if self.type in self.height_func:
-            return self.height_func[self.type]()
+        if self.type in self._height_func:
+            return getattr(self, self._height_func[self.type])()
         else:
             return self._default_height()
 
@@ -322,3 +290,79 @@ class Component(object):
                 return height_table[key]
 
         return default
+
+
+def write_svg_model(path, refdes, sym_name, pins, bodies, pads):
+    """
+    Write the SVG model of a component, it runs in the export workers as well
+    :param str path: the target path to export
+    :param str refdes: the REFDES of the component
+    :param str sym_name: the SYM_NAME of the component
+    :param list pins: the (number, PAD_STACK_NAME, x, y, rotation, PIN_NAME, NET_NAME) of each pin
+    :param list bodies: the points of each body geometry
+    :param list pads: the (PAD_STACK_NAME, points) of each pad, the points are None without geometry
+    :return:
+    """
+    begin = instrument.now()
+    svg_model_dir = os.path.join(path, 'svg')
+
+    if not os.path.exists(svg_model_dir):
+        os.makedirs(svg_model_dir)
+
+    svg_file = os.path.join(path, 'svg', refdes + '.svg')
+    dwg = svgwrite.Drawing(svg_file, debug=False)
+    group = dwg.g(id=refdes, footprint=sym_name)
+    pins_group = dwg.g(id="component-pins")
+
+    # pin info
+    for num, pad_name, x, y, rotation, pin_name, net_name in pins:
+        insert_center = (x * 3543.307, y * 3543.307)
+        svg_use = dwg.use(
+            href='#' + pad_name,
+            insert=insert_center,
+            pin_name=pin_name,
+            pin_num=num,
+            pin_net=net_name
+        )
+        svg_use.rotate(rotation, center=insert_center)
+        pins_group.add(svg_use)
+
+    # body info
+    body = dwg.g(id="component-body")
+    _min_x_arr = []
+    _min_y_arr = []
+    _max_x_arr = []
+    _max_y_arr = []
+    for points in bodies:
+        _min_x_arr.append(min(points[::2]))
+        _min_y_arr.append(min(points[1::2]))
+        _max_x_arr.append(max(points[::2]))
+        _max_y_arr.append(max(points[1::2]))
+
+        svg_shape = dwg.polygon((points.reshape(-1, 2) * 3543.307).tolist(), fill="#000")
+        body.add(svg_shape)
+
+    if len(_min_x_arr):
+        min_x = min(_min_x_arr) * 3543.307
+        max_x = max(_max_x_arr) * 3543.307
+        min_y = min(_min_y_arr) * 3543.307
+        max_y = max(_max_y_arr) * 3543.307
+
+        body.translate((max_x - min_x) / 2, (max_y - min_y) / 2)
+        pins_group.translate((max_x - min_x) / 2, (max_y - min_y) / 2)
+        dwg.viewbox(0, 0, (max_x - min_x), (max_y - min_y))
+
+    for pad_name, points in pads:
+        sym = dwg.symbol(id=pad_name)
+
+        if points is not None:
+            sym.add(dwg.polygon((points.reshape(-1, 2) * 3543.307).tolist(), fill="#999999"))
+
+            dwg.defs.add(sym)
+
+    group.add(body)
+    group.add(pins_group)
+    dwg.add(group)
+    dwg.save()
+    instrument.add_span('svg.export', begin, ref=refdes)
+    instrument.count_file(svg_file)
@@ -1,12 +1,15 @@
 import os
 import zipfile
 
+import instrument
+
 
 def compress(path):
     """
     Compress files to a zip file
     :param str path: the path of files which will be compressed.
     """
+    begin = instrument.now()
     orig_work_path = os.getcwd()
 
     try:
@@ -33,7 +36,9 @@ def compress(path):
         zf.write(os.path.join('.', 'meshes', '_outline_.jpg'))
         zf.write(os.path.join('.', 'ComponentConfigs.json'))
 
+    instrument.count_file('data.zip')
     os.chdir(orig_work_path)
+    instrument.add_span('compress', begin)
 
 
 if __name__ == '__main__':
@@ -5,6 +5,8 @@ class Copper(object):
     def __init__(self, data=None):
         self.geometry = None
         self.type = ''
+        # the width of a LINE, the trace is stroked along the points of the geometry
+        self.width = 0.0
 
         if data:
             self.append(data)
@@ -16,14 +18,25 @@ class Copper(object):
         :return:
         """
         self._identify_type(data)
+        self._prepare_geometry()
+        self._append_polygon_data(data)
+
+    def append_shape(self, line):
+        """
+        Append a parsed Line or Arc to the copper
+        :param line: the Line or Arc, None for the unsupported records
+        :return:
+        """
+        self.type = 'LINE' if line is not None and line.width > 0 else 'POLYGON'
         if self.type == 'LINE':
-            self.geometry = shape.Polygon()
-            self._append_polygon_data(data)
-        else:
-            if not self.geometry:
-                self.geometry = shape.Polygon()
+            self.width = line.width
+        self._prepare_geometry()
+        if line is not None:
+            self.geometry.append(line)
 
-            self._append_polygon_data(data)
+    def _prepare_geometry(self):
+        if self.type == 'LINE' or not self.geometry:
+            self.geometry = shape.Polygon()
 
     def add_hole(self):
         """
@@ -59,6 +72,17 @@ class Copper(object):
             # self.hole.append(arc)
             self.geometry.append_hole_data(arc)
 
+    def append_hole_shape(self, line):
+        """
+        Append a parsed Line or Arc to the last hole
+        :param line: the Line or Arc, None for the unsupported records
+        :return:
+        """
+        if self.type == 'LINE' or line is None:
+            return
+
+        self.geometry.append_hole_data(line)
+
     def _identify_type(self, data):
         """
         Identify the current data is a Line or a Polygon
@@ -73,6 +97,7 @@ class Copper(object):
 
         if width > 0:
             self.type = 'LINE'
+            self.width = width
         else:
             self.type = 'POLYGON'
 
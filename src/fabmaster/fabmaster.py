@@ -1,17 +1,27 @@
 from pad import Pad
-from componet import Component
+from componet import Component, write_svg_model
 from copper import Copper
-from package import Package
+from package import Package, PackageLibrary
+from assembly import place_instances, face_normals, write_stl
 from via import VIA
+import shape
 from compress import *
 from outline import OutLine
+from table import SectionTable, Categorical, graphic_shapes
+from index import SECTION_NAMES, open_mapped, scan_sections, name_sections, mapped_lines
+from index import stream_sections, stream_ranges
+from source import compression, open_source
+from parallel import parse_parallel, JobPool
+from manifest import Manifest
+from gltf import GlbWriter, indexed_mesh, placement_rotation
+import instrument
 from setting import SCALE_RATE
-from setting import BOARD_HEIGHT, PAD_HEIGHT
+from setting import BOARD_HEIGHT, PAD_HEIGHT, UV_MAP_NAME, GLB_PACKAGE_COLOR
 import logging
+import gc
 
 import json
 import numpy as np
-from stl import mesh
 
 try:
     import xml.etree.cElementTree as ET
@@ -32,40 +42,194 @@ class FabMaster(object):
         self._package_assembly_id = -1
         self._etch_id = ""
         self._etch_sub_id = ""
-        self._meshes = {'TOP': None, 'BOTTOM': None}
 
         if os.path.isfile(filename):
             self._filename = filename
 
+        # [name, row reader, columnar loader]
         self._sections = [
-            ['components', self._read_components],
-            ['component_pin', self._read_component_pin],
-            ['geometry_classes', self._read_geometry_classes],
-            ['pad_definition', self._read_pad_definition],
-            ['package_geometry', self._read_package_geometry],
-            ['package_pins', self._read_package_pins],
-            ['vias', self._read_vias],
-            ['copper_etch', self._read_copper_etch],
-            ['misc_pkg_lines', self._read_misc_pkg_lines],
-            ['misc_pkg_lines2', self._read_misc_pkg_lines2],
+            ['components', self._read_components, self._load_components],
+            ['component_pin', self._read_component_pin, self._load_component_pin],
+            ['geometry_classes', self._read_geometry_classes, None],
+            ['pad_definition', self._read_pad_definition, self._load_pad_definition],
+            ['package_geometry', self._read_package_geometry, self._load_package_geometry],
+            ['package_pins', self._read_package_pins, self._load_package_pins],
+            ['vias', self._read_vias, None],
+            ['copper_etch', self._read_copper_etch, self._load_copper_etch],
+            ['misc_pkg_lines', self._read_misc_pkg_lines, None],
+            ['misc_pkg_lines2', self._read_misc_pkg_lines2, None],
         ]
+        # the sections whose records refer to the model built by other sections
+        self._section_requires = {
+            'component_pin': ['components'],
+            'package_geometry': ['components'],
+            'package_pins': ['components', 'package_geometry'],
+        }
+        self._section_index = None
+        self._loaded_sections = set()
+        self._compression = None
+
+        if self._filename:
+            self._compression = compression(self._filename)
 
-    def parse(self):
+    def parse(self, columnar=False, sections=None, workers=1, cache=None):
         """
         Parse the FabMaster file
+        :param bool columnar: load each section into a SectionTable and build the model from its columns,
+                              instead of dispatching a dict per row
+        :param list sections: only load these sections (and the sections they depend on) through the section
+                              index, None for all. The sections loaded before are never read again.
+        :param int workers: the number of processes, more than one parses the sections in chunks with a
+                            process pool and merges the chunks in the order of the file, a compressed file
+                            is always parsed by this process
+        :param BoardCache cache: load the board from the cache when the file was parsed before, and store
+                                 it after parsing, only for the full parse of a board which has nothing loaded
         :return:
         """
         if not self._filename:
             logging.error("Filename is not existing")
 
+        # after some sections were loaded, a full parse only loads the others
+        if sections is None and self._loaded_sections:
+            sections = [name for name, _, _ in self._sections]
+
+        key = None
+        if cache is not None and sections is None:
+            key = cache.key(self._filename)
+            with instrument.span('parse.cache_load'):
+                hit = cache.load(key, self)
+
+            if hit:
+                self._loaded_sections.update(name for name, _, _ in self._sections)
+                return
+
+        begin = instrument.now()
+
+        # The buffered rows of a section are all tracked by the garbage collector, which would otherwise
+        # rescan them again and again while they grow.
+        gc_enabled = gc.isenabled()
+        if columnar:
+            gc.disable()
+
+        f = open_source(self._filename)
+        try:
+            if workers > 1 and not self._compression:
+                names = self._resolve_sections(sections or [name for name, _, _ in self._sections])
+                parse_parallel(self, self._filename, names - self._loaded_sections, columnar, workers)
+            elif sections is None:
+                self._parse_lines(f, columnar)
+                self._loaded_sections.update(name for name, _, _ in self._sections)
+            else:
+                self._parse_sections(f, self._resolve_sections(sections), columnar)
+        finally:
+            f.close()
+            if gc_enabled:
+                gc.enable()
+
+        instrument.add_span('parse', begin, columnar=columnar, workers=workers)
+
+        if key is not None:
+            with instrument.span('parse.cache_store'):
+                cache.store(key, self)
+
+    def index(self):
+        """
+        Scan the byte range of every section, the result is cached
+        :return: the list of [name, start, end], name is None for the unexpected sections
+        :rtype list
+        """
+        if self._section_index is not None:
+            return self._section_index
+
+        if self._compression:
+            f = open_source(self._filename)
+            try:
+                ranges = stream_ranges(f)
+            finally:
+                f.close()
+        else:
+            f = open(self._filename, 'rb')
+            mm = open_mapped(f)
+            try:
+                ranges = scan_sections(mm)
+            finally:
+                if mm is not None:
+                    mm.close()
+                f.close()
+
+        self._section_index = name_sections(ranges)
+        return self._section_index
+
+    def _resolve_sections(self, sections):
+        """
+        Add the sections which the given sections depend on
+        :param list sections: the section names
+        :return: the names to load
+        :rtype set
+        """
+        known = [name for name, _, _ in self._sections]
+        names = set()
+        pending = list(sections)
+
+        while pending:
+            name = pending.pop()
+            assert name in known, "Unknown section %s" % name
+            if name not in names:
+                names.add(name)
+                pending.extend(self._section_requires.get(name, []))
+
+        return names
+
+    def _parse_sections(self, f, names, columnar=False):
+        """
+        Parse the given sections from the memory-mapped file
+        :param file f: the opened FabMaster file
+        :param set names: the section names
+        :param bool columnar: see parse
+        :return:
+        """
+        if self._compression:
+            # a compressed file can't be mapped, skip the other sections while it is decompressed
+            for sec_index, lines in stream_sections(f):
+                name = SECTION_NAMES[sec_index] if sec_index < len(SECTION_NAMES) else None
+                if name in names and name not in self._loaded_sections:
+                    self._parse_lines(lines, columnar, sec_index)
+                    self._loaded_sections.add(name)
+            return
+
+        index = self.index()
+        mm = open_mapped(f)
+        if mm is None:
+            return
+
+        try:
+            for sec_index, (name, start, end) in enumerate(index):
+                if name not in names or name in self._loaded_sections:
+                    continue
+
+                self._parse_lines(mapped_lines(mm, start, end), columnar, sec_index)
+                self._loaded_sections.add(name)
+        finally:
+            mm.close()
+
+    def _parse_lines(self, lines, columnar=False, sec_index=0):
+        """
+        Parse the records of a FabMaster file
+        :param lines: the iterable of raw lines
+        :param bool columnar: see parse
+        :param int sec_index: the index of the first section in the lines
+        :return:
+        """
         line_num = 1
-        sec_index = 0
         section_name = None
         section_func = None
         section_fields = None
+        section_loader = None
+        section_rows = []
+        section_begin = None
+        section_line = 0
 
-        f = open(self._filename, 'rb')
-        for line in f:
+        for line in lines:
             a = line.split('!')
             a.pop()
 
@@ -74,26 +238,48 @@ class FabMaster(object):
             elif a[0] == 'J':
                 pass
             elif a[0] == 'A':
+                if section_loader:
+                    section_loader(SectionTable(section_name, section_fields, section_rows))
+                    section_rows = []
+
+                if section_begin is not None:
+                    self._end_section_span(section_name, section_begin, line_num - section_line - 1)
+                section_begin = instrument.now()
+                section_line = line_num
+
                 if sec_index < len(self._sections):
                     section_name = self._sections[sec_index][0]
                     section_func = self._sections[sec_index][1]
+                    section_loader = self._sections[sec_index][2] if columnar else None
                     section_fields = a[1:]
                     # print "SECTION %2d %s <%s>" % (sec_index+1,section_name,section_fields)
                 else:
                     section_name = None
                     section_func = None
+                    section_loader = None
                     section_fields = a[1:]
                     print "Unexpected section #%d at line %d" % (sec_index + 1, line_num)
                 sec_index += 1
             elif a[0] == 'S':
-                if section_func:
+                if section_loader:
+                    section_rows.append(a[1:])
+                elif section_func and not columnar:
                     d = dict(zip(section_fields, a[1:]))
                     section_func(d)
             else:
                 logging.error("Unknown record type on line %d" % (line_num))
             line_num += 1
 
-        f.close()
+        if section_loader:
+            section_loader(SectionTable(section_name, section_fields, section_rows))
+
+        if section_begin is not None:
+            self._end_section_span(section_name, section_begin, line_num - section_line - 1)
+
+    @staticmethod
+    def _end_section_span(name, begin, rows):
+        instrument.add_span('parse.' + (name or 'unexpected'), begin, rows=rows)
+        instrument.count('rows.' + (name or 'unexpected'), rows)
 
     # 1 components             'REFDES', 'COMP_CLASS', 'COMP_PART_NUMBER', 'COMP_HEIGHT', 'COMP_DEVICE_LABEL',
     #                          'COMP_INSERTION_CODE', 'SYM_TYPE', 'SYM_NAME', 'SYM_MIRROR', 'SYM_ROTATE',
@@ -311,66 +497,321 @@ class FabMaster(object):
     def _read_misc_pkg_lines2(self, data):
         pass
 
-    def export(self, path):
+    def _load_components(self, table):
+        """
+        Load the components section from its columns
+        :param SectionTable table:
+        :return:
+        """
+        for data in table.records():
+            self.components[data['REFDES']] = Component(data)
+
+    def _load_component_pin(self, table):
+        """
+        Load the component pins from their columns
+        :param SectionTable table:
+        :return:
+        """
+        for data in table.records(['NET_NAME', 'REFDES', 'PIN_NUMBER', 'PIN_NAME']):
+            self.components[data['REFDES']].add_pin(data)
+
+    def _load_pad_definition(self, table):
+        """
+        Load the pads on the TOP and BOTTOM layers from their columns
+        :param SectionTable table:
+        :return:
+        """
+        rows = np.flatnonzero(table.categorical('LAYER').isin(['TOP', 'BOTTOM']))
+
+        for data in table.records(Pad._whitelist, rows):
+            self.pads.setdefault(data['PAD_NAME'], []).append(Pad(data))
+
+    def _load_package_geometry(self, table):
+        """
+        Load the package geometries from their columns, the same grouping as _read_package_geometry
+        :param SectionTable table:
+        :return:
+        """
+        subclass = table.categorical('SUBCLASS')
+        rows = np.flatnonzero(
+            ~table.categorical('GRAPHIC_DATA_NAME').equal('TEXT')
+            & subclass.isin(['ASSEMBLY_TOP', 'ASSEMBLY_BOTTOM', 'BODY_CENTER'])
+            & ~table.categorical('REFDES').isin([None, ''])
+        )
+        if not len(rows):
+            return
+
+        tags = [tag.split(' ')[0] for tag in table.take('RECORD_TAG', rows)]
+        # the assembly id follows every accepted record, so a geometry starts wherever the tag changes
+        codes = Categorical(tags).codes
+        new_geometry = np.concatenate([[tags[0] != self._package_assembly_id], codes[1:] != codes[:-1]]).tolist()
+
+        is_center = subclass.equal('BODY_CENTER')[rows]
+        centers = [None] * len(rows)
+        center_idx = np.flatnonzero(is_center)
+        if len(center_idx):
+            x1, y1, x2, y2 = [table.floats('GRAPHIC_DATA_%d' % n, rows[center_idx]).tolist() for n in range(1, 5)]
+            for k, i in enumerate(center_idx.tolist()):
+                centers[i] = shape.Line([x1[k], y1[k]], [x2[k], y2[k]])
+
+        shapes = [None] * len(rows)
+        shape_idx = np.flatnonzero(~is_center)
+        for i, line in zip(shape_idx.tolist(), graphic_shapes(table, rows[shape_idx])):
+            shapes[i] = line
+
+        layers = subclass.take(rows)
+        sym_names = table.take('SYM_NAME', rows)
+        refdes = table.take('REFDES', rows)
+
+        for k in xrange(len(rows)):
+            component = self.components[refdes[k]]
+            package = component.package
+
+            if not package:
+                package = component.package = Package()
+                if centers[k]:
+                    package.append_body_center(centers[k])
+                    package.REFDES = refdes[k]
+                    package.SYM_NAME = sym_names[k]
+                else:
+                    package.append_geometry_shape(shapes[k], sym_names[k], refdes[k], layers[k])
+            elif centers[k]:
+                package.append_body_center(centers[k])
+            else:
+                if new_geometry[k]:
+                    package.add_geometry()
+                package.append_geometry_shape(shapes[k], sym_names[k], refdes[k], layers[k])
+
+        self._package_assembly_id = tags[-1]
+
+    def _load_package_pins(self, table):
+        """
+        Load the package pins of the components which have the package info
+        :param SectionTable table:
+        :return:
+        """
+        refdes = table.categorical('REFDES')
+        known = [ref for ref in refdes.categories if ref in self.components and self.components[ref].package]
+        rows = np.flatnonzero(refdes.isin(known))
+
+        for data in table.records(rows=rows):
+            self.components[data['REFDES']].package.add_pin(data)
+
+    def _load_copper_etch(self, table):
+        """
+        Load the outline and the etch of the board from the columns of copper_etch
+        :param SectionTable table:
+        :return:
+        """
+        cls = table.categorical('CLASS')
+        subclass = table.categorical('SUBCLASS')
+
+        rows = np.flatnonzero(cls.equal('BOARD GEOMETRY') & subclass.equal('OUTLINE'))
+        for line in graphic_shapes(table, rows):
+            self.outline.append_shape(line)
+
+        rows = np.flatnonzero(
+            cls.equal('ETCH')
+            & subclass.isin(['TOP', 'BOTTOM'])
+            & ~table.categorical('GRAPHIC_DATA_NAME').equal('TEXT')
+        )
+        if len(rows):
+            self._load_etch(table, rows)
+
+    def _load_etch(self, table, rows):
+        """
+        Build the copper of the etch rows, the same grouping as _parse_etch
+        :param SectionTable table:
+        :param rows: the indices of the ETCH rows
+        :return:
+        """
+        shapes = graphic_shapes(table, rows, width=True)
+        layers = table.categorical('SUBCLASS').take(rows)
+        nets = ['###' if net is None else (net or '===') for net in table.take('NET_NAME', rows)]
+        tags = [tag.split() for tag in table.take('RECORD_TAG', rows)]
+
+        for k, line in enumerate(shapes):
+            if layers[k] not in self.copper:
+                self.copper[layers[k]] = dict()
+            if nets[k] not in self.copper[layers[k]]:
+                self.copper[layers[k]][nets[k]] = {'POLYGON': [], 'LINE': []}
+
+            target_object = self.copper[layers[k]][nets[k]]
+
+            # single line
+            if line is not None and line.width > 0:
+                copper = Copper()
+                copper.append_shape(line)
+                target_object['LINE'].append(copper)
+                continue
+
+            tag_id = tags[k][0]
+            sub_id = tags[k][2] if len(tags[k]) == 3 else None
+
+            if tag_id == self._etch_id:
+                copper = target_object['POLYGON'][-1]
+                if not sub_id or sub_id == "0":
+                    copper.append_shape(line)
+                else:
+                    if sub_id != self._etch_sub_id:
+                        copper.add_hole()
+                        self._etch_sub_id = sub_id
+                    copper.append_hole_shape(line)
+            else:
+                copper = Copper()
+                copper.append_shape(line)
+                target_object['POLYGON'].append(copper)
+                self._etch_id = tag_id
+                self._etch_sub_id = "0"
+
+    def export(self, path, incremental=False, workers=1, uv_size=None, format='zip'):
         """
         Export all to the target path
         :param str path: the target path
+        :param bool incremental: compare with the manifest of the previous export in the target path and only
+                                 export again the files whose content changed
+        :param int workers: the number of processes which export the packages and the components
+        :param int uv_size: also render the UV map at this size as tiles, see OutLine.uv_tiles
+        :param str format: 'zip' for the files and their data.zip, 'glb' for the single binary glTF file of
+                           export_glb
+        :return:
+        """
+        assert format in ('zip', 'glb'), "The format should be 'zip' or 'glb'"
+        if format == 'glb':
+            self.export_glb(path, workers)
+            return
+
+        begin = instrument.now()
+
+        # the manifest hashes the parsed model, build it before the export scales and moves anything
+        with instrument.span('export.manifest'):
+            manifest = Manifest.build(self)
+
+        if incremental:
+            self._export_changes(path, manifest, Manifest.load(path), workers, uv_size)
+        else:
+            self.export_outline(path, uv_size, workers)
+            self.export_pads(path)
+            self.export_components(path, workers=workers)
+            compress(path)
+
+        manifest.save(path)
+        instrument.add_span('export', begin, incremental=incremental, workers=workers)
+
+    def _export_changes(self, path, manifest, previous, workers=1, uv_size=None):
+        """
+        Export the files which differ from the previous export and remove the files of the deleted
+        components and packages
+        :param str path: the target path
+        :param Manifest manifest: the manifest of this board
+        :param Manifest previous: the manifest of the previous export
+        :param int workers: the number of processes which export the packages and the components
+        :param int uv_size: the size of the tiled UV map, see export
         :return:
         """
-        self.export_outline(path)
+        meshes_path = os.path.join(path, 'meshes')
+        changed = False
+
+        with instrument.span('outline.scale'):
+            self.outline.scale(SCALE_RATE)
+        if manifest.outline != previous.outline or manifest.settings != previous.settings or \
+                not os.path.isfile(os.path.join(meshes_path, 'outline.obj')):
+            self.outline.save(path)
+            changed = True
+
+        layers = manifest.changed_layers(previous)
+        if layers or set(manifest.layers) != set(previous.layers) or \
+                not os.path.isfile(os.path.join(meshes_path, '_outline_.jpg')):
+            self.outline.uv_map(self.copper, path, reuse_layers=set(manifest.layers) - layers)
+            changed = True
+
+        if uv_size and (changed or _tiles_size(path) != uv_size):
+            with JobPool(workers) as pool:
+                self.outline.uv_tiles(self.copper, path, uv_size, pool)
+
         self.export_pads(path)
-        self.export_components(path)
-        compress(path)
 
-    def main(self):
-        pass
+        refs = manifest.changed_components(previous)
+        packages = manifest.changed_packages(previous)
+        removed_refs = set(previous.components) - set(manifest.components)
+        # the centers in ComponentConfigs.json are relative to the outline
+        configs = bool(refs or removed_refs) or manifest.outline != previous.outline or \
+            not os.path.isfile(os.path.join(path, 'ComponentConfigs.json'))
+        self.export_components(path, refs=refs, packages=packages, workers=workers, configs=configs)
 
-    def _combine_component_meshes(self, component):
-        if self.packages[component.SYM_NAME].mesh is None:
-            return
+        for ref in removed_refs:
+            _remove_file(os.path.join(path, 'svg', ref + '.svg'))
 
-        _mesh_data = self.packages[component.SYM_NAME].mesh.copy()
+        # a SYM_NAME can lose some of its meshes as well
+        removed_packages = set()
+        for sym in previous.packages:
+            removed_packages.update(set(previous.packages[sym]) - set(manifest.packages.get(sym, {})))
+        for name in removed_packages:
+            _remove_file(os.path.join(meshes_path, 'packages', name + '.stl'))
 
-        _mesh = mesh.Mesh(_mesh_data)
-        if component.SYM_MIRROR:
-            _mesh.rotate([0, 1, 0], np.radians(180))
+        changed = changed or refs or packages or removed_refs or removed_packages
+        if changed or not os.path.isfile(os.path.join(path, 'data.zip')):
+            compress(path)
 
-        if component.SYM_ROTATE > 0:
-            _mesh.rotate([0, 0, 1], np.radians(-component.SYM_ROTATE))
+    def main(self):
+        pass
 
-        z = -BOARD_HEIGHT / 2 if component.SYM_MIRROR else BOARD_HEIGHT / 2
-        layer = 'BOTTOM' if component.SYM_MIRROR else 'TOP'
-        _mesh.translate((component.center[0], component.center[1], z))
+    @staticmethod
+    def _placements(components):
+        """
+        Get the placement table of the simulation meshes
+        :param list components: the placed components
+        :return: the (layer, component, (x, y, z)) of each component which has a mesh
+        :rtype list
+        """
+        placements = []
+        for component in components:
+            if component.package.mesh is None:
+                continue
 
-        if self._meshes[layer] is None:
-            self._meshes[layer] = _mesh.data
-        else:
-            self._meshes[layer] = np.concatenate([self._meshes[layer], _mesh.data])
+            z = -BOARD_HEIGHT / 2 if component.SYM_MIRROR else BOARD_HEIGHT / 2
+            layer = 'BOTTOM' if component.SYM_MIRROR else 'TOP'
+            placements.append((layer, component, (component.center[0], component.center[1], z)))
 
-    def _export_component_model(self, path):
+        return placements
+
+    def _export_component_model(self, path, components, instanced=False):
         """
         Export the model file of components for simulation
         :param str path: the target path to export model file
+        :param list components: the placed components
+        :param bool instanced: include the package model of each component at its pose, instead of merging the
+                               components into the TOP and BOTTOM meshes
         :return:
         """
         layers = ['TOP', 'BOTTOM']
+        placements = self._placements(components)
 
         component_model_path = os.path.join(path, 'models', 'Components')
         if not os.path.exists(component_model_path):
             os.makedirs(component_model_path)
 
+        root_node = ET.Element('sdf')
+        root_node.set('version', '1.6')
+        model_node = ET.SubElement(root_node, 'model')
+        model_node.set('name', 'Components')
+
+        if instanced:
+            self._include_packages(path, model_node, placements)
+
+            tree = ET.ElementTree(root_node)
+            tree.write(os.path.join(component_model_path, 'model.sdf'), encoding='utf-8', xml_declaration=True)
+            return
+
         # For simulation, should export the STL files of top and bottom side.
         mesh_files = {
             'TOP': os.path.abspath(os.path.join(path, 'meshes', 'TOP.stl')),
             'BOTTOM': os.path.abspath(os.path.join(path, 'meshes', 'BOTTOM.stl'))
         }
-        mesh.Mesh(self._meshes['TOP']).save(mesh_files['TOP'])
-        mesh.Mesh(self._meshes['BOTTOM']).save(mesh_files['BOTTOM'])
-
-        root_node = ET.Element('sdf')
-        root_node.set('version', '1.6')
-        model_node = ET.SubElement(root_node, 'model')
-        model_node.set('name', 'Components')
+        for layer in layers:
+            instances = [(component.package.mesh, component.SYM_MIRROR, component.SYM_ROTATE, offset)
+                         for placement_layer, component, offset in placements if placement_layer == layer]
+            write_stl(mesh_files[layer], place_instances(instances))
 
         for layer in layers:
             link_node = ET.SubElement(model_node, 'link')
@@ -393,36 +834,68 @@ class FabMaster(object):
         tree = ET.ElementTree(root_node)
         tree.write(os.path.join(component_model_path, 'model.sdf'), encoding='utf-8', xml_declaration=True)
 
-    def export_components(self, path, sim=False):
+    @staticmethod
+    def _include_packages(path, model_node, placements):
+        """
+        Include the package model of each component, the model of a mesh is written once and every component
+        is only its pose
+        :param str path: the target path to export model file
+        :param ET.Element model_node: the model of the components
+        :param list placements: see _placements
+        :return:
+        """
+        for layer, component, offset in placements:
+            include_node = ET.SubElement(model_node, 'include')
+            uri_node = ET.SubElement(include_node, 'uri')
+            uri_node.text = 'file://' + os.path.abspath(os.path.join(path, 'models', component.package.model_name()))
+            name_node = ET.SubElement(include_node, 'name')
+            name_node.text = component.REFDES
+
+            # the same placement as the merged meshes, see place_instances
+            pitch = np.pi if component.SYM_MIRROR else 0
+            yaw = np.radians(component.SYM_ROTATE) if component.SYM_ROTATE > 0 else 0
+            pose_node = ET.SubElement(include_node, 'pose')
+            pose_node.text = "{} {} {} {} {} {}".format(offset[0], offset[1], offset[2], 0, pitch, yaw)
+
+    def export_components(self, path, sim=False, refs=None, packages=None, workers=1, instanced=False,
+                          configs=True):
         """
         Export the components information
         :param str path: the target path to export
         :param bool sim: whether need to output the files for simulation
+        :param set refs: only export the SVG models of these components, None for all
+        :param set packages: only save the files of the packages of these SYM_NAMEs, None for all
+        :param int workers: the number of processes which mesh the packages and write the files
+        :param bool instanced: the simulation model includes the package model of each component instead of the
+                               merged TOP and BOTTOM meshes
+        :param bool configs: write ComponentConfigs.json, an incremental export only writes it again when a
+                             component changed
         :return:
         """
+        begin = instrument.now()
         tx, ty = self.outline.offset()
         component_configs = {}
+        library = PackageLibrary()
+        placed = []
+        svg_jobs = []
 
         for ref in self.components:
             component = self.components[ref]
             if not component.package:
                 continue
 
-            cx, cy = component.package.center()
-            component.center = (cx * SCALE_RATE - tx, cy * SCALE_RATE - ty)
+            self._place_component(component, tx, ty)
             sym = component.SYM_NAME
-            component.bind_pads(self.pads)
 
-            # if sym in self.packages:
-            #     component.package = self.packages[sym]
-            # else:
-            component.export_package(path, sim)
+            export_svg = refs is None or ref in refs
+            save = packages is None or sym in packages
+            if export_svg or save:
+                component.export_package(path, sim, save, library)
             self.packages[sym] = component.package
+            placed.append(component)
 
-            if sim:
-                self._combine_component_meshes(component)
-
-            component.export_svg_model(path)
+            if export_svg:
+                svg_jobs.append((path,) + component.svg_model_args())
             component_configs[component.REFDES] = {
                 "c": component.center,
                 "r": component.SYM_ROTATE,
@@ -430,26 +903,125 @@ class FabMaster(object):
                 "p": component.SYM_NAME
             }
 
-        component_configs_fp = open(os.path.join(path, 'ComponentConfigs.json'), 'w')
-        json.dump(component_configs, component_configs_fp)
-        component_configs_fp.close()
+        with JobPool(workers) as pool:
+            library.build(pool)
+            library.flush(path, pool)
+            pool.map(_svg_job, svg_jobs)
+
+        if configs:
+            component_configs_fp = open(os.path.join(path, 'ComponentConfigs.json'), 'w')
+            json.dump(component_configs, component_configs_fp)
+            component_configs_fp.close()
+            instrument.count_file(os.path.join(path, 'ComponentConfigs.json'))
+        instrument.add_span('export.components', begin, workers=workers)
 
         if sim:
-            self._export_component_model(path)
+            self._export_component_model(path, placed, instanced)
+
+    def _place_component(self, component, tx, ty):
+        """
+        Set the center of a component on the board and bind its pads, before its package is exported
+        :param Component component: the component
+        :param float tx: the x offset of the outline
+        :param float ty: the y offset of the outline
+        :return:
+        """
+        cx, cy = component.package.center()
+        component.center = (cx * SCALE_RATE - tx, cy * SCALE_RATE - ty)
+        component.bind_pads(self.pads)
 
-    def export_outline(self, path):
+    def export_glb(self, path, workers=1):
+        """
+        Export the board as one binary glTF file, path/board.glb. It has the outline mesh with the UV map as its
+        texture, one mesh of each footprint and a node of each component which places that mesh, see
+        place_instances. The scene is Y up.
+        :param str path: the target path to export
+        :param int workers: the number of processes which mesh the packages
+        :return:
+        """
+        begin = instrument.now()
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        with instrument.span('outline.scale'):
+            self.outline.scale(SCALE_RATE)
+        self.outline.uv_map(self.copper, path)
+        self.export_pads(path)
+
+        tx, ty = self.outline.offset()
+        library = PackageLibrary()
+        placed = []
+        for ref in self.components:
+            component = self.components[ref]
+            if not component.package:
+                continue
+
+            self._place_component(component, tx, ty)
+            component.export_package(path, library=library)
+            self.packages[component.SYM_NAME] = component.package
+            placed.append(component)
+
+        with JobPool(workers) as pool:
+            library.build(pool)
+
+        writer = GlbWriter()
+        with open(os.path.join(path, 'meshes', UV_MAP_NAME + '.jpg'), 'rb') as f:
+            texture = writer.texture(f.read())
+        board_material = writer.material(UV_MAP_NAME, texture=texture)
+        package_material = writer.material('package', GLB_PACKAGE_COLOR)
+
+        # the glTF texcoords start at the top of the picture
+        with instrument.span('glb.outline'):
+            vertices, faces, texcoords, normals = self.outline.build_mesh(BOARD_HEIGHT)
+            texcoords[:, 1] = 1 - texcoords[:, 1]
+            positions, normals, texcoords, indices = indexed_mesh(vertices[faces.reshape(-1)],
+                                                                  np.repeat(normals, 3, axis=0), texcoords)
+
+        # turn the Z up board to the Y up glTF scene
+        root = writer.node('board', rotation=(-np.sqrt(0.5), 0, 0, np.sqrt(0.5)))
+        writer.node('outline', writer.mesh('outline', positions, normals, indices, board_material, texcoords),
+                    parent=root)
+
+        meshes = {}
+        with instrument.span('glb.packages'):
+            for layer, component, offset in self._placements(placed):
+                data = component.package.mesh
+                if not len(data):
+                    continue
+
+                if id(data) not in meshes:
+                    vectors = data['vectors']
+                    positions, normals, _, indices = indexed_mesh(vectors.reshape(-1, 3),
+                                                                  np.repeat(face_normals(vectors), 3, axis=0))
+                    meshes[id(data)] = writer.mesh(component.package.model_name(), positions, normals, indices,
+                                                   package_material)
+
+                writer.node(component.REFDES, meshes[id(data)], offset,
+                            placement_rotation(component.SYM_MIRROR, component.SYM_ROTATE), root)
+
+        with instrument.span('glb.write'):
+            writer.save(os.path.join(path, 'board.glb'))
+        instrument.add_span('export', begin, format='glb', workers=workers)
+
+    def export_outline(self, path, uv_size=None, workers=1):
         """
         Export the board outline information
         :param str path: the target path to export
+        :param int uv_size: also render the UV map at this size as tiles, see OutLine.uv_tiles
+        :param int workers: the number of processes which render the tiles
         :return:
         """
 
         # Scale the outline
-        self.outline.scale(SCALE_RATE)
+        with instrument.span('outline.scale'):
+            self.outline.scale(SCALE_RATE)
         # Export the STL file of the outline
         self.outline.save(path)
         # Export the UV Map info of the board
         self.outline.uv_map(self.copper, path)
+        if uv_size:
+            with JobPool(workers) as pool:
+                self.outline.uv_tiles(self.copper, path, uv_size, pool)
 
     def export_pads(self, path):
         """
@@ -463,6 +1035,31 @@ class FabMaster(object):
                     pad.scale(SCALE_RATE)
 
 
+def _svg_job(job):
+    write_svg_model(*job)
+
+
+def _remove_file(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def _tiles_size(path):
+    """
+    Get the size of the tiled UV map of a previous export
+    :param str path: the target path
+    :return: the size, None when there are no tiles
+    :rtype int
+    """
+    try:
+        with open(os.path.join(path, 'meshes', 'uv_tiles', 'tiles.json')) as f:
+            return json.load(f)['size']
+    except (IOError, ValueError, KeyError):
+        return None
+
+
 if __name__ == "__main__":
     import datetime
 
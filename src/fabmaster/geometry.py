@@ -1,3 +1,5 @@
+import numpy
+
 try:
     import _geometry as geo
 except:
@@ -48,3 +50,58 @@ def extrude(points, height):
         raise
 
     return result
+
+
+def pack_polygons(polygons):
+    """
+    Pack the rings of many polygons into the flat buffers of triangulate_many and extrude_many
+    :param list polygons: the polygons, each one is the list of its rings (the outer ring first, then the holes),
+                          a ring is the flat array of its points [x0, y0, x1, y1, ...]
+    :return: the coordinates, the point offset of each ring and the ring offset of each polygon
+    :rtype tuple
+    """
+    rings = [ring for polygon in polygons for ring in polygon]
+
+    ring_offsets = numpy.zeros(len(rings) + 1, dtype=numpy.intp)
+    numpy.cumsum([len(ring) // 2 for ring in rings], out=ring_offsets[1:])
+
+    polygon_offsets = numpy.zeros(len(polygons) + 1, dtype=numpy.intp)
+    numpy.cumsum([len(polygon) for polygon in polygons], out=polygon_offsets[1:])
+
+    if rings:
+        coords = numpy.concatenate([numpy.asarray(ring, dtype=numpy.float64).reshape(-1) for ring in rings])
+    else:
+        coords = numpy.zeros(0, dtype=numpy.float64)
+
+    return coords, ring_offsets, polygon_offsets
+
+
+def triangulate_many(polygons):
+    """
+    Triangulate many polygons in one call, the GIL is released while the polygons are triangulated
+    :param list polygons: the polygons, see pack_polygons
+    :return: the faces of each polygon, the faces index the points of the polygon
+    :rtype list
+    """
+    faces, face_offsets = geo.triangulate_many(*pack_polygons(polygons))
+
+    return [faces[face_offsets[i]:face_offsets[i + 1]] for i in range(len(polygons))]
+
+
+def extrude_many(polygons, height):
+    """
+    Extrude many polygons in one call, the GIL is released while the polygons are extruded
+    :param list polygons: the polygons, see pack_polygons
+    :param float height: the height of the 3d objects
+    :return: the faces and the vertices of each polygon, the same as extrude
+    :rtype list
+    """
+    coords, ring_offsets, polygon_offsets = pack_polygons(polygons)
+    vertices, vertex_offsets, faces, face_offsets = geo.extrude_many(coords, ring_offsets, polygon_offsets, height)
+
+    return [
+        {
+            "faces": faces[face_offsets[i]:face_offsets[i + 1]],
+            "vertices": vertices[vertex_offsets[i]:vertex_offsets[i + 1]]
+        } for i in range(len(polygons))
+    ]
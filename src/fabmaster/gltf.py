@@ -0,0 +1,240 @@
+import json
+import struct
+import numpy as np
+
+import assembly
+import instrument
+
+GLB_MAGIC = 0x46546C67
+GLB_VERSION = 2
+GLB_JSON_CHUNK = 0x4E4F534A
+GLB_BIN_CHUNK = 0x004E4942
+
+# The component types and the targets of the accessors, see the glTF 2.0 specification
+COMPONENT_TYPES = {
+    np.dtype(np.int8): 5120,
+    np.dtype(np.uint8): 5121,
+    np.dtype(np.int16): 5122,
+    np.dtype(np.uint16): 5123,
+    np.dtype(np.uint32): 5125,
+    np.dtype(np.float32): 5126,
+}
+ACCESSOR_TYPES = {1: 'SCALAR', 2: 'VEC2', 3: 'VEC3', 4: 'VEC4'}
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+
+class GlbWriter(object):
+    def __init__(self, generator='fabmaster'):
+        """
+        Build a binary glTF file. The arrays of the buffer views are kept as they are given and written straight
+        into the binary chunk when the file is saved, they shouldn't be changed before that.
+        :param str generator: the generator of the asset
+        """
+        self.gltf = {
+            'asset': {'version': '2.0', 'generator': generator},
+            'scene': 0,
+            'scenes': [{'nodes': []}],
+            'nodes': [],
+            'meshes': [],
+            'materials': [],
+            'accessors': [],
+            'bufferViews': [],
+        }
+        self._blobs = []
+        self._size = 0
+
+    def buffer_view(self, data, target=None):
+        """
+        Add a buffer view, each one starts at a multiple of 4 bytes
+        :param data: the numpy array or the string of the view
+        :param int target: ARRAY_BUFFER or ELEMENT_ARRAY_BUFFER, None for the other data
+        :return: the index of the view
+        :rtype int
+        """
+        if isinstance(data, np.ndarray):
+            data = np.ascontiguousarray(data)
+            length = data.nbytes
+        else:
+            length = len(data)
+
+        view = {'buffer': 0, 'byteOffset': self._size, 'byteLength': length}
+        if target is not None:
+            view['target'] = target
+
+        self._blobs.append(data)
+        self._size += length
+        padding = -self._size % 4
+        if padding:
+            self._blobs.append('\0' * padding)
+            self._size += padding
+
+        self.gltf['bufferViews'].append(view)
+        return len(self.gltf['bufferViews']) - 1
+
+    def accessor(self, array, target=ARRAY_BUFFER, bounds=False):
+        """
+        Add an accessor of its own buffer view
+        :param np.ndarray array: the (n,) or (n, k) values
+        :param int target: the target of the view
+        :param bool bounds: record the min and max of each column, the positions need them
+        :return: the index of the accessor
+        :rtype int
+        """
+        columns = array.shape[1] if array.ndim > 1 else 1
+        accessor = {
+            'bufferView': self.buffer_view(array, target),
+            'componentType': COMPONENT_TYPES[array.dtype],
+            'count': len(array),
+            'type': ACCESSOR_TYPES[columns],
+        }
+        if bounds and len(array):
+            values = array.reshape(len(array), columns)
+            accessor['min'] = values.min(axis=0).tolist()
+            accessor['max'] = values.max(axis=0).tolist()
+
+        self.gltf['accessors'].append(accessor)
+        return len(self.gltf['accessors']) - 1
+
+    def material(self, name, color=(1.0, 1.0, 1.0, 1.0), texture=None):
+        """
+        Add a material which isn't metallic
+        :param str name: the name
+        :param tuple color: the RGBA base color
+        :param int texture: the index of the base color texture
+        :return: the index of the material
+        :rtype int
+        """
+        pbr = {'baseColorFactor': list(color), 'metallicFactor': 0.0, 'roughnessFactor': 1.0}
+        if texture is not None:
+            pbr['baseColorTexture'] = {'index': texture}
+
+        self.gltf['materials'].append({'name': name, 'pbrMetallicRoughness': pbr})
+        return len(self.gltf['materials']) - 1
+
+    def texture(self, data, mime_type='image/jpeg'):
+        """
+        Add a texture of an embedded picture
+        :param str data: the content of the picture file
+        :param str mime_type: the type of the picture
+        :return: the index of the texture
+        :rtype int
+        """
+        self.gltf.setdefault('images', []).append({'bufferView': self.buffer_view(data), 'mimeType': mime_type})
+        self.gltf.setdefault('samplers', [{}])
+        self.gltf.setdefault('textures', []).append({'source': len(self.gltf['images']) - 1, 'sampler': 0})
+        return len(self.gltf['textures']) - 1
+
+    def mesh(self, name, positions, normals, indices, material, texcoords=None):
+        """
+        Add a mesh of one triangle primitive
+        :param str name: the name
+        :param np.ndarray positions: the (n, 3) float32 positions
+        :param np.ndarray normals: the (n, 3) float32 normals
+        :param np.ndarray indices: the (m,) uint32 vertex indices, 3 for each triangle
+        :param int material: the index of the material
+        :param np.ndarray texcoords: the (n, 2) float32 texcoords
+        :return: the index of the mesh
+        :rtype int
+        """
+        attributes = {
+            'POSITION': self.accessor(positions, bounds=True),
+            'NORMAL': self.accessor(normals),
+        }
+        if texcoords is not None:
+            attributes['TEXCOORD_0'] = self.accessor(texcoords)
+
+        primitive = {
+            'attributes': attributes,
+            'indices': self.accessor(indices, ELEMENT_ARRAY_BUFFER),
+            'material': material,
+        }
+        self.gltf['meshes'].append({'name': name, 'primitives': [primitive]})
+        return len(self.gltf['meshes']) - 1
+
+    def node(self, name, mesh=None, translation=None, rotation=None, parent=None):
+        """
+        Add a node
+        :param str name: the name
+        :param int mesh: the index of the mesh
+        :param translation: the (x, y, z) translation
+        :param rotation: the (x, y, z, w) unit quaternion of the rotation
+        :param int parent: the index of the parent node, None for a root node of the scene
+        :return: the index of the node
+        :rtype int
+        """
+        node = {'name': name}
+        if mesh is not None:
+            node['mesh'] = mesh
+        if translation is not None:
+            node['translation'] = [float(v) for v in translation]
+        if rotation is not None:
+            node['rotation'] = [float(v) for v in rotation]
+
+        self.gltf['nodes'].append(node)
+        index = len(self.gltf['nodes']) - 1
+        if parent is None:
+            self.gltf['scenes'][0]['nodes'].append(index)
+        else:
+            self.gltf['nodes'][parent].setdefault('children', []).append(index)
+
+        return index
+
+    def save(self, filename):
+        """
+        Write the GLB file
+        :param str filename: the output filename
+        :return:
+        """
+        gltf = dict(self.gltf)
+        gltf['buffers'] = [{'byteLength': self._size}]
+        content = json.dumps(gltf, separators=(',', ':'))
+        content += ' ' * (-len(content) % 4)
+
+        with open(filename, 'wb') as fh:
+            fh.write(struct.pack('<III', GLB_MAGIC, GLB_VERSION, 12 + 8 + len(content) + 8 + self._size))
+            fh.write(struct.pack('<II', len(content), GLB_JSON_CHUNK))
+            fh.write(content)
+            fh.write(struct.pack('<II', self._size, GLB_BIN_CHUNK))
+            for blob in self._blobs:
+                if isinstance(blob, np.ndarray):
+                    blob.tofile(fh)
+                else:
+                    fh.write(blob)
+
+        instrument.count_file(filename)
+
+
+def indexed_mesh(positions, normals, texcoords=None):
+    """
+    Share the vertices of the corners of the triangles which have the same attributes
+    :param np.ndarray positions: the (3m, 3) positions of the corners
+    :param np.ndarray normals: the (3m, 3) normals of the corners
+    :param np.ndarray texcoords: the (3m, 2) texcoords of the corners
+    :return: (positions, normals, texcoords, indices), the float32 attributes of the vertices, texcoords is None
+             when it isn't given, and the uint32 vertex index of each corner
+    :rtype tuple
+    """
+    columns = [positions, normals] if texcoords is None else [positions, normals, texcoords]
+    vertices, indices = assembly.unique_rows(np.hstack(columns).astype(np.float32))
+    texcoords = None if texcoords is None else np.ascontiguousarray(vertices[:, 6:8])
+
+    return (np.ascontiguousarray(vertices[:, 0:3]), np.ascontiguousarray(vertices[:, 3:6]), texcoords,
+            indices.astype(np.uint32))
+
+
+def placement_rotation(mirror, rotation):
+    """
+    Get the quaternion of the placement of a package, the same as place_instances: a half turn about the y
+    axis when mirrored, then the counterclockwise rotation about the z axis
+    :param bool mirror: whether the package is mirrored
+    :param float rotation: the rotation in degrees
+    :return: the (x, y, z, w) quaternion
+    :rtype tuple
+    """
+    pitch = np.pi if mirror else 0.0
+    yaw = np.radians(rotation) if rotation > 0 else 0.0
+    sy, cy = np.sin(pitch / 2), np.cos(pitch / 2)
+    sz, cz = np.sin(yaw / 2), np.cos(yaw / 2)
+
+    return -sz * sy, cz * sy, cy * sz, cz * cy
@@ -0,0 +1,113 @@
+from itertools import groupby
+import mmap
+
+# The sections of a FabMaster file in their order, a section is only known by its position
+SECTION_NAMES = [
+    'components',
+    'component_pin',
+    'geometry_classes',
+    'pad_definition',
+    'package_geometry',
+    'package_pins',
+    'vias',
+    'copper_etch',
+    'misc_pkg_lines',
+    'misc_pkg_lines2',
+]
+
+
+def open_mapped(f):
+    """
+    Memory-map an opened file for reading
+    :param file f: the file opened in binary mode
+    :return: the map, None for an empty file
+    :rtype mmap.mmap
+    """
+    f.seek(0, 2)
+    if f.tell() == 0:
+        return None
+
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def scan_sections(mm):
+    """
+    Find the byte range of each section, a section starts at its 'A' record
+    :param mmap.mmap mm: the mapped FabMaster file
+    :return: the list of (start, end) offsets in the order of the file
+    :rtype list
+    """
+    offsets = []
+    if mm is None:
+        return offsets
+
+    pos = 0 if mm[:2] == 'A!' else mm.find('\nA!')
+    while pos >= 0:
+        start = pos + 1 if mm[pos] == '\n' else pos
+        offsets.append(start)
+        pos = mm.find('\nA!', start)
+
+    ends = offsets[1:] + [len(mm)]
+    return zip(offsets, ends)
+
+
+def name_sections(ranges):
+    """
+    Name the ranges of the sections by their position
+    :param list ranges: the list of (start, end) from scan_sections
+    :return: the list of [name, start, end], name is None for the unexpected sections
+    :rtype list
+    """
+    return [
+        [SECTION_NAMES[i] if i < len(SECTION_NAMES) else None, start, end]
+        for i, (start, end) in enumerate(ranges)
+    ]
+
+
+def mapped_lines(mm, start, end):
+    """
+    Iterate the lines of a range of the mapped file
+    :param mmap.mmap mm: the mapped FabMaster file
+    :param int start: the offset of the first line
+    :param int end: the offset after the last line
+    :return: the generator of lines
+    """
+    mm.seek(start)
+    while mm.tell() < end:
+        yield mm.readline()
+
+
+def stream_sections(lines):
+    """
+    Group the lines of a stream by section, for the files which can't be mapped, e.g. the compressed ones
+    :param lines: the iterable of raw lines
+    :return: the generator of (section position, lines of the section), the lines before the first section
+             are skipped and a group must be consumed before the next one
+    """
+    position = [-1]
+
+    def key(line):
+        if line.startswith('A!'):
+            position[0] += 1
+        return position[0]
+
+    for sec_index, group in groupby(lines, key):
+        if sec_index >= 0:
+            yield sec_index, group
+
+
+def stream_ranges(lines):
+    """
+    Find the byte range of each section in a stream, see scan_sections
+    :param lines: the iterable of raw lines
+    :return: the list of (start, end) offsets in the stream
+    :rtype list
+    """
+    offsets = []
+    pos = 0
+    for line in lines:
+        if line.startswith('A!'):
+            offsets.append(pos)
+        pos += len(line)
+
+    return zip(offsets, offsets[1:] + [pos])
@@ -0,0 +1,264 @@
+from collections import defaultdict
+import json
+import os
+import threading
+import time
+
+# The recorder of the running instrumentation, None when it is off
+_recorder = None
+
+
+class Recorder(object):
+    def __init__(self):
+        """
+        The spans and counters of a run, it records only while it is started:
+
+            with Recorder() as recorder:
+                fab.parse()
+                fab.export(path)
+            recorder.save_chrome_trace('trace.json')
+        """
+        self.spans = []
+        self.counters = defaultdict(int)
+        self._origin = time.time()
+
+    def __enter__(self):
+        start(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        stop()
+
+    def add_span(self, name, begin, end, args=None):
+        """
+        Record a span
+        :param str name: the name, the part before the first '.' is the category
+        :param float begin: the start time in seconds, see time.time
+        :param float end: the end time in seconds
+        :param dict args: the details of the span
+        :return:
+        """
+        self.spans.append((name, begin, end, args or {}, os.getpid(), threading.current_thread().ident))
+
+    def count(self, name, value=1):
+        """
+        Add to a counter
+        :param str name: the counter
+        :param int value: the increment
+        :return:
+        """
+        self.counters[name] += value
+
+    def merge(self, spans, counters):
+        """
+        Add the spans and the counters recorded by a worker process, its spans keep the pid of the worker
+        :param list spans: the spans of the worker
+        :param dict counters: the counters of the worker
+        :return:
+        """
+        self.spans.extend(spans)
+        for name, value in counters.iteritems():
+            self.counters[name] += value
+
+    def to_dict(self):
+        """
+        Get the recorded data
+        :return: {'spans': [...], 'totals': {name: seconds}, 'counters': {name: value}}, the start of a span is
+                 relative to the creation of the recorder
+        :rtype dict
+        """
+        spans = []
+        totals = defaultdict(float)
+        for name, begin, end, args, _, _ in self.spans:
+            spans.append({'name': name, 'start': begin - self._origin, 'duration': end - begin, 'args': args})
+            totals[name] += end - begin
+
+        return {'spans': spans, 'totals': dict(totals), 'counters': dict(self.counters)}
+
+    def chrome_trace(self):
+        """
+        Get the recorded data in the Chrome trace event format, see chrome://tracing
+        :return: the trace
+        :rtype dict
+        """
+        events = []
+        for name, begin, end, args, pid, tid in self.spans:
+            events.append({
+                'name': name,
+                'cat': name.split('.')[0],
+                'ph': 'X',
+                'ts': (begin - self._origin) * 1e6,
+                'dur': (end - begin) * 1e6,
+                'pid': pid,
+                'tid': tid,
+                'args': args,
+            })
+
+        end = max([span[2] for span in self.spans] or [self._origin])
+        for name in sorted(self.counters):
+            events.append({
+                'name': name,
+                'cat': 'counter',
+                'ph': 'C',
+                'ts': (end - self._origin) * 1e6,
+                'pid': os.getpid(),
+                'args': {'value': self.counters[name]},
+            })
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save_chrome_trace(self, filename):
+        """
+        Save the Chrome trace JSON file
+        :param str filename: the output filename
+        :return:
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+class _Span(object):
+    def __init__(self, recorder, name, args):
+        self._recorder = recorder
+        self._name = name
+        self.args = args
+        self._begin = None
+
+    def __enter__(self):
+        self._begin = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._recorder.add_span(self._name, self._begin, time.time(), self.args)
+
+
+class _NullSpan(object):
+    @property
+    def args(self):
+        # the details given to a span which isn't recorded are dropped
+        return {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def start(recorder=None):
+    """
+    Start recording
+    :param Recorder recorder: the recorder, a new one when None
+    :return: the recorder
+    :rtype Recorder
+    """
+    global _recorder
+    _recorder = recorder or Recorder()
+    return _recorder
+
+
+def stop():
+    """
+    Stop recording
+    :return: the recorder which was recording
+    :rtype Recorder
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+
+def recording():
+    """
+    Check whether the instrumentation is on
+    :rtype bool
+    """
+    return _recorder is not None
+
+
+def run_job(task):
+    """
+    Run a job in a worker process. The worker records into its own recorder, which is returned with the result
+    for the parent to merge, see merge_job.
+    :param tuple task: (the module level function which runs the job, the job, whether the parent records)
+    :return: the result and the (spans, counters) of the job, None when the parent doesn't record
+    :rtype tuple
+    """
+    func, job, record = task
+    if not record:
+        return func(job), None
+
+    recorder = start()
+    try:
+        result = func(job)
+    finally:
+        stop()
+
+    return result, (recorder.spans, dict(recorder.counters))
+
+
+def merge_job(output):
+    """
+    Merge what a worker recorded into the running recorder
+    :param tuple output: the output of run_job
+    :return: the result of the job
+    """
+    result, recorded = output
+    if recorded is not None and _recorder is not None:
+        _recorder.merge(*recorded)
+
+    return result
+
+
+def span(name, **args):
+    """
+    Time a block, nothing is recorded when the instrumentation is off:
+
+        with span('package.save', sym=name):
+            ...
+    :param str name: the name of the span
+    :return: the context manager
+    """
+    if _recorder is None:
+        return _NULL_SPAN
+
+    return _Span(_recorder, name, args)
+
+
+def add_span(name, begin, **args):
+    """
+    Record a span which started at begin and ends now
+    :param str name: the name of the span
+    :param float begin: the start time, see now
+    :return:
+    """
+    if _recorder is not None:
+        _recorder.add_span(name, begin, time.time(), args)
+
+
+def now():
+    return time.time()
+
+
+def count(name, value=1):
+    """
+    Add to a counter
+    :param str name: the counter
+    :param int value: the increment
+    :return:
+    """
+    if _recorder is not None:
+        _recorder.count(name, value)
+
+
+def count_file(filename):
+    """
+    Count the bytes of a written file
+    :param str filename: the file
+    :return:
+    """
+    if _recorder is not None and os.path.isfile(filename):
+        _recorder.count('bytes_written', os.path.getsize(filename))
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+from package import model_names
+import setting
+
+# Bump it when the exported files change for the same board
+MANIFEST_VERSION = 5
+MANIFEST_FILENAME = 'manifest.json'
+
+
+def _update_points(digest, points):
+    if points is not None:
+        digest.update(np.ascontiguousarray(points, dtype=np.float64).tostring())
+    digest.update('|')
+
+
+def _update_polygon(digest, geometry):
+    _update_points(digest, geometry.points)
+    for hole in geometry.holes:
+        _update_points(digest, hole.points)
+
+
+def package_digest(component, pads):
+    """
+    Get the digest of everything the package STL of a component is built from. The geometry is hashed in the
+    canonical orientation of the footprint, see Package.mesh_key, so moving or rotating a component doesn't
+    change it. The digests of two components are the same when their packages share a mesh in PackageLibrary.
+    :param Component component: the component which has the package info
+    :param dict pads: the pads of the board
+    :return: the hex digest
+    :rtype str
+    """
+    package = component.package.geometry_copy()
+    package.canonicalize(component.SYM_ROTATE, component.SYM_MIRROR)
+    digest = hashlib.sha1(package.mesh_key(component.height))
+
+    # the pins are in the key, the pads only by their name
+    for name in sorted(set(pin.PAD_STACK_NAME for pin in package.pin.itervalues())):
+        digest.update(repr(name))
+        for pad in pads.get(name, []):
+            digest.update(repr(sorted(pad.fields().iteritems())))
+
+    return digest.hexdigest()
+
+
+def component_digest(component, pads, package=None):
+    """
+    Get the digest of everything the SVG model and the ComponentConfigs entry of a component are built from
+    :param Component component: the component which has the package info
+    :param dict pads: the pads of the board
+    :param str package: the package digest of the component, see package_digest
+    :return: the hex digest
+    :rtype str
+    """
+    digest = hashlib.sha1(package or package_digest(component, pads))
+    digest.update(repr((component.REFDES, component.package.center(), component.SYM_ROTATE, component.SYM_MIRROR)))
+
+    for num in sorted(component.pin):
+        pin = component.pin[num]
+        digest.update(repr((num, pin.NET_NAME, pin.PIN_NAME)))
+
+    for num in sorted(component.package.pin):
+        digest.update(repr(component.package.pin[num].PIN_NAME))
+
+    return digest.hexdigest()
+
+
+def net_digest(copper):
+    """
+    Get the digest of the copper of a net on a layer
+    :param dict copper: {'POLYGON': [Copper], 'LINE': [Copper]}
+    :return: the hex digest
+    :rtype str
+    """
+    digest = hashlib.sha1()
+    for kind in ['POLYGON', 'LINE']:
+        digest.update(kind)
+        for c in copper[kind]:
+            if c.geometry is not None:
+                _update_polygon(digest, c.geometry)
+                if kind == 'LINE':
+                    digest.update(repr(c.width))
+
+    return digest.hexdigest()
+
+
+class Manifest(object):
+    def __init__(self):
+        """
+        The content digests of an export, compared with the previous export to find what has to be rebuilt
+        """
+        self.settings = None
+        self.outline = None
+        self.layers = dict()
+        self.components = dict()
+        self.packages = dict()
+
+    @classmethod
+    def build(cls, fab):
+        """
+        Build the manifest of a parsed board, before anything is scaled for the export
+        :param FabMaster fab: the board
+        :rtype Manifest
+        """
+        manifest = cls()
+
+        digest = hashlib.sha1()
+        digest.update(repr(MANIFEST_VERSION))
+        digest.update(repr([(k, getattr(setting, k)) for k in sorted(dir(setting))
+                            if k.isupper() and not k.startswith('CACHE_')]))
+        manifest.settings = digest.hexdigest()
+
+        digest = hashlib.sha1()
+        _update_polygon(digest, fab.outline.geometry)
+        manifest.outline = digest.hexdigest()
+
+        for layer in fab.copper:
+            nets = dict((net, net_digest(fab.copper[layer][net])) for net in fab.copper[layer])
+            digest = hashlib.sha1()
+            for net in sorted(nets):
+                digest.update(repr((net, nets[net])))
+            manifest.layers[layer] = {'digest': digest.hexdigest(), 'nets': nets}
+
+        # a package STL is written for each mesh of a SYM_NAME, named as PackageLibrary names them
+        meshes = dict()
+        for ref in fab.components:
+            component = fab.components[ref]
+            if not component.package:
+                continue
+
+            package = package_digest(component, fab.pads)
+            manifest.components[ref] = component_digest(component, fab.pads, package)
+
+            sym = component.SYM_NAME
+            meshes[(sym, package)] = min(meshes.get((sym, package), ref), ref)
+
+        names = model_names([(sym, (sym, package), ref) for (sym, package), ref in meshes.iteritems()])
+        for (sym, package), name in names.iteritems():
+            manifest.packages.setdefault(sym, dict())[name] = package
+
+        return manifest
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load the manifest of the previous export
+        :param str path: the export path
+        :return: the manifest, an empty one if there was no export
+        :rtype Manifest
+        """
+        manifest = cls()
+        filename = os.path.join(path, MANIFEST_FILENAME)
+        if not os.path.isfile(filename):
+            return manifest
+
+        with open(filename, 'rb') as f:
+            data = json.load(f)
+
+        manifest.settings = data['settings']
+        manifest.outline = data['outline']
+        manifest.layers = data['layers']
+        manifest.components = data['components']
+        # the packages of the earlier versions are one digest of each SYM_NAME, its STL is named SYM_NAME
+        manifest.packages = dict((sym, models if isinstance(models, dict) else {sym: models})
+                                 for sym, models in data['packages'].iteritems())
+        return manifest
+
+    def save(self, path):
+        """
+        Save the manifest to the export path
+        :param str path: the export path
+        :return:
+        """
+        data = {
+            'settings': self.settings,
+            'outline': self.outline,
+            'layers': self.layers,
+            'components': self.components,
+            'packages': self.packages,
+        }
+
+        with open(os.path.join(path, MANIFEST_FILENAME), 'wb') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+
+    def changed_layers(self, previous):
+        """
+        Get the copper layers whose UV map has to be rendered again
+        :param Manifest previous: the manifest of the previous export
+        :rtype set
+        """
+        if self.settings != previous.settings or self.outline != previous.outline:
+            return set(self.layers)
+
+        return set(
+            layer for layer in self.layers
+            if layer not in previous.layers or self.layers[layer]['digest'] != previous.layers[layer]['digest']
+        )
+
+    def changed_components(self, previous):
+        """
+        Get the components whose SVG model has to be exported again
+        :param Manifest previous: the manifest of the previous export
+        :rtype set
+        """
+        return self._changed(self.components, previous.components, previous)
+
+    def changed_packages(self, previous):
+        """
+        Get the packages whose STL files have to be exported again, a SYM_NAME changes when any of its meshes
+        changes
+        :param Manifest previous: the manifest of the previous export
+        :rtype set
+        """
+        return self._changed(self.packages, previous.packages, previous)
+
+    def _changed(self, current, before, previous):
+        if self.settings != previous.settings:
+            return set(current)
+
+        return set(key for key in current if before.get(key) != current[key])
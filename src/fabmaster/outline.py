@@ -1,14 +1,29 @@
+import assembly
 import shape
 from stl import mesh
 from PIL import Image, ImageChops, ImageDraw
 import numpy as np
 import datetime
+import json
 import os
 import shutil
-import pyassimp
 from setting import __author__, __version__, __title__
-from setting import UV_MAP_SIZE, UV_MAP_OFFSET, UV_MAP_BG_COLOR, UV_MAP_SPACE
-from setting import BOARD_HEIGHT, SCALE_RATE
+from setting import UV_MAP_SIZE, UV_MAP_OFFSET, UV_MAP_BG_COLOR, UV_MAP_SPACE, UV_TILE_SIZE, UV_MAP_NAME
+from setting import BOARD_HEIGHT, SCALE_RATE, OBJ_FLOAT_FORMAT, OUTLINE_ASSIMP
+import instrument
+
+# The rows of the OBJ file formatted at once and the buffer of the file
+OBJ_BLOCK_ROWS = 1 << 14
+OBJ_WRITE_BUFFER = 1 << 20
+
+# A trace is split into pieces which are at most twice as long as its width or this many pixels, see
+# _layer_traces
+TRACE_PIECE_LENGTH = 32
+
+# The most pixels _stroke_traces tests at once
+TRACE_CHUNK_SIZE = 1 << 20
+
+_NO_TRACES = np.zeros((0, 5))
 
 
 class OutLine(object):
@@ -37,7 +52,7 @@ class OutLine(object):
             end = [float(data['GRAPHIC_DATA_3']), float(data['GRAPHIC_DATA_4'])]
 
             line = shape.Line(start, end)
-            self.geometry.append(line)
+            self.append_shape(line)
         elif data['GRAPHIC_DATA_NAME'] == 'ARC':
             start = [float(data['GRAPHIC_DATA_1']), float(data['GRAPHIC_DATA_2'])]
             end = [float(data['GRAPHIC_DATA_3']), float(data['GRAPHIC_DATA_4'])]
@@ -46,19 +61,84 @@ class OutLine(object):
             cw = True if data['GRAPHIC_DATA_9'] == 'CLOCKWISE' else False
 
             arc = shape.Arc(start, end, center, radius, cw)
-            self.geometry.append(arc)
+            self.append_shape(arc)
         else:
             pass
 
-    def _save_to_obj(self, filename, height=10):
+    def append_shape(self, line):
+        """
+        Append a parsed Line or Arc to the outline
+        :param line: the Line or Arc, None for the unsupported records
+        :return:
+        """
+        if line is not None:
+            self.geometry.append(line)
+
+    def _save_to_obj(self, filename, height=10, float_format=OBJ_FLOAT_FORMAT, material=UV_MAP_NAME):
         """
-        Export the obj file
+        Export the obj file and its material file. The layout is the one of the Assimp OBJ exporter: the
+        positions, texcoords and normals are shared by the faces, a face has one normal and the faces are one
+        group of one material.
         :param str filename: the output filename
         :param float height: the height of the board
+        :param str float_format: the % format of the coordinates
+        :param str material: the name of the material, the texture is the UV map of this name
         :return:
         """
-        triangles = self.geometry.triangulate()
-        geometry = self.geometry.extrude(height)
+        vertices, faces, texcoords, normals = self.build_mesh(height)
+
+        begin = instrument.now()
+
+        # the shared positions, texcoords and normals, and their 1 based indices at each corner of the faces
+        positions, position_indices = assembly.unique_rows(vertices[faces.reshape(-1)])
+        texcoords, texcoord_indices = assembly.unique_rows(texcoords)
+        normals, normal_indices = assembly.unique_rows(normals)
+        corners = np.empty((len(faces), 9), dtype=np.int64)
+        corners[:, 0::3] = position_indices.reshape(-1, 3) + 1
+        corners[:, 1::3] = texcoord_indices.reshape(-1, 3) + 1
+        corners[:, 2::3] = normal_indices[:, np.newaxis] + 1
+
+        # write to file
+        with open(filename, "wb", OBJ_WRITE_BUFFER) as fh:
+            fh.write("# {} {}\n".format(__title__, __version__))
+            fh.write("# {}\n".format(datetime.datetime.now()))
+            fh.write("# {}\n".format(__author__))
+            fh.write("\n")
+            fh.write("mtllib {}.mtl\n".format(os.path.splitext(os.path.basename(filename))[0]))
+            fh.write("\n")
+            fh.write("# {} vertex positions\n".format(len(positions)))
+            _write_rows(fh, "v {0} {0} {0}\n".format(float_format), positions)
+            fh.write("\n")
+            fh.write("# {} UV coordinates\n".format(len(texcoords)))
+            _write_rows(fh, "vt {0} {0}\n".format(float_format), texcoords)
+            fh.write("\n")
+            fh.write("# {} vertex normals\n".format(len(normals)))
+            _write_rows(fh, "vn {0} {0} {0}\n".format(float_format), normals)
+            fh.write("\n")
+            fh.write("# Mesh '{}' with {} faces\n".format(material, len(faces)))
+            fh.write("g {}\n".format(material))
+            fh.write("usemtl {}\n".format(material))
+            _write_rows(fh, "f %d/%d/%d %d/%d/%d %d/%d/%d\n", corners)
+
+        self._save_to_mtl(os.path.splitext(filename)[0] + '.mtl', material)
+        instrument.add_span('outline.obj_write', begin)
+        instrument.count_file(filename)
+
+    def build_mesh(self, height):
+        """
+        Build the mesh of the board, centered on z = 0
+        :param float height: the height of the board
+        :return: (vertices, faces, texcoords, normals), the (n, 3) vertices, the (m, 3) vertex indices of the
+                 faces, the (3m, 2) texcoords of each corner of the faces in the UV map and the (m, 3) normals of
+                 the faces
+        :rtype tuple
+        """
+        with instrument.span('outline.triangulate'):
+            triangles = self.geometry.triangulate()
+            geometry = self.geometry.extrude(height)
+        instrument.count('polygons')
+        instrument.count('triangles', len(geometry["faces"]))
+
         texcoords = np.zeros((3 * len(geometry["faces"]), 2), dtype=np.float32)
 
         if not self._normalized:
@@ -68,71 +148,32 @@ class OutLine(object):
 
         dpi = UV_MAP_OFFSET / self.height if self.width > self.height else UV_MAP_OFFSET / self.width
 
-        # calculate the texcoords
-        for k in range(2):
-            o = k * len(triangles)
-            for i in range(len(triangles)):
-                for j in range(3):
-                    point = vertices[geometry["faces"][i + o][j]]
-                    y = point[0] * dpi / UV_MAP_SIZE
-                    x = (point[1] * dpi + k * (UV_MAP_OFFSET + 50)) / UV_MAP_SIZE
-
-                    texcoords[3 * (i + o) + j] = np.array([x, y])
+        # calculate the texcoords of the top and bottom faces
+        faces = geometry["faces"]
+        caps = assembly.triangles(vertices, faces[:2 * len(triangles)]).reshape(-1, 3)
+        shift = np.repeat([0, UV_MAP_OFFSET + 50], 3 * len(triangles))
+        texcoords[:len(caps), 0] = (caps[:, 1] * dpi + shift) / UV_MAP_SIZE
+        texcoords[:len(caps), 1] = caps[:, 0] * dpi / UV_MAP_SIZE
 
         # calculate the normals
-        vectors = np.zeros((len(geometry["faces"]), 3, 3), dtype=np.float32)
-        for i, face in enumerate(geometry["faces"]):
-            vectors[i] = np.array([vertices[face[0]], vertices[face[1]], vertices[face[2]]])
+        vectors = assembly.triangles(vertices, faces).astype(np.float32)
+        normals = assembly.face_normals(vectors)
 
-        # update the normals
-        v0 = vectors[:, 0, :3]
-        v1 = vectors[:, 1, :3]
-        v2 = vectors[:, 2, :3]
-        normals = np.cross(v1 - v0, v2 - v0)
+        return vertices, faces, texcoords, normals
 
-        for i in range(len(normals)):
-            norm = np.linalg.norm(normals[i])
-            if norm != 0:
-                normals[i] /= np.linalg.norm(normals[i])
-
-        # write to file
-        with open(filename, "wb") as fh:
-            fh.write("# {} {}\n".format(__title__, __version__))
-            fh.write("# {}\n".format(datetime.datetime.now()))
-            fh.write("# {}\n".format(__author__))
-            fh.write("\n")
-            fh.write("mtllib {}.mtl\n".format(os.path.splitext(os.path.basename(filename))[0]))
-            fh.write("\n")
-            for v in vertices:
-                fh.write("v {} {} {}\n".format(v[0], v[1], v[2]))
-            for vn in normals:
-                fh.write("vn {} {} {}\n".format(vn[0], vn[1], vn[2]))
-            for vt in texcoords:
-                fh.write("vt {} {}\n".format(vt[0], vt[1]))
-            for i, face in enumerate(geometry["faces"]):
-                fh.write("f {}/{}/{} {}/{}/{} {}/{}/{}\n".format(
-                    face[0] + 1, 3 * i + 1, i + 1,
-                    face[1] + 1, 3 * i + 2, i + 1,
-                    face[2] + 1, 3 * i + 3, i + 1,
-                ))
-
-        self._save_to_mtl(os.path.splitext(filename)[0] + '.mtl')
-
-    def _save_to_mtl(self, filename):
+    def _save_to_mtl(self, filename, material=UV_MAP_NAME):
         """
         Export the material file
         :param str filename: the output filename
+        :param str material: the name of the material, the texture is the UV map of this name
         :return:
         """
-        basename = os.path.basename(filename)
-        name = os.path.splitext(basename)[0]
-
         with open(filename, 'wb') as fh:
             fh.write("# Fabmaster Exporter\n")
             fh.write("# File Created: {}\n".format(datetime.datetime.now()))
             fh.write("# Author: {}\n".format(__author__))
             fh.write("\n")
-            fh.write("newmtl {}\n".format(name))
+            fh.write("newmtl {}\n".format(material))
             fh.write("Ns {}\n".format(10))
             fh.write("Ni {}\n".format(1.0000))
             fh.write("d {}\n".format(1.0000))
@@ -143,26 +184,34 @@ class OutLine(object):
             fh.write("Kd {} {} {}\n".format(0.5882, 0.5882, 0.5882))
             fh.write("Ks {} {} {}\n".format(0.0000, 0.0000, 0.0000))
             fh.write("Ke {} {} {}\n".format(0.0000, 0.0000, 0.0000))
-            fh.write("map_Ka {}.jpg\n".format(name))
-            fh.write("map_Kd {}.jpg\n".format(name))
+            fh.write("map_Ka {}.jpg\n".format(material))
+            fh.write("map_Kd {}.jpg\n".format(material))
 
-    def save(self, basepath):
+    def save(self, basepath, assimp=OUTLINE_ASSIMP):
         """
         Save the outline to a obj file
         :param str basepath: the base path of output
+        :param bool assimp: standardize the obj file by loading and exporting it again with pyassimp, instead of
+                            writing it directly
         :return:
         """
         path = os.path.join(basepath, 'meshes')
         if not os.path.exists(path):
             os.makedirs(path)
 
-        _obj_filename = os.path.join(path, '_outline_.obj')
-        self._save_to_obj(_obj_filename, BOARD_HEIGHT)
+        if assimp:
+            _obj_filename = os.path.join(path, '_outline_.obj')
+            self._save_to_obj(_obj_filename, BOARD_HEIGHT)
 
-        # standardize the obj file by pyassimp
-        scene = pyassimp.load(_obj_filename)
-        pyassimp.export(scene, os.path.join(path, 'outline.obj'), file_type='obj')
-        pyassimp.release(scene)
+            # standardize the obj file by pyassimp
+            import pyassimp
+            with instrument.span('outline.assimp'):
+                scene = pyassimp.load(_obj_filename)
+                pyassimp.export(scene, os.path.join(path, 'outline.obj'), file_type='obj')
+                pyassimp.release(scene)
+        else:
+            self._save_to_obj(os.path.join(path, 'outline.obj'), BOARD_HEIGHT)
+        instrument.count_file(os.path.join(path, 'outline.obj'))
 
         # compatible with Assimp 3 and 4
         if os.path.isfile(os.path.join(path, 'outline.mtl')):
@@ -215,73 +264,560 @@ class OutLine(object):
 
         return self._offset
 
-    def uv_map(self, copper_obj, basepath, mode='JPEG'):
+    def uv_map(self, copper_obj, basepath, mode='JPEG', reuse_layers=None):
         """
         Calculate the UV map of the board
         :param dict copper_obj: the dict includes the Copper objects on top and bottom side
         :param str basepath: output path of the picture
         :param str mode: the format of the picture, the default is JPEG
+        :param set reuse_layers: the layers whose raster of the previous export is still valid, they are loaded
+                                 instead of rendered again
+        :return:
+        """
+        dpi, img_width, img_height, places = self._uv_layout(UV_MAP_SIZE, len(copper_obj))
+        tx, ty = self._uv_origin()
+
+        raster_path = os.path.join(basepath, 'meshes', 'uv')
+        if not os.path.exists(raster_path):
+            os.makedirs(raster_path)
+
+        uv_im = Image.new("RGB", (UV_MAP_SIZE, UV_MAP_SIZE))
+        for layer, (x, y) in zip(copper_obj, places):
+            raster = os.path.join(raster_path, layer + '.png')
+            if reuse_layers and layer in reuse_layers and os.path.isfile(raster):
+                with instrument.span('uv.load_layer', layer=layer):
+                    bg_im = Image.open(raster)
+                    bg_im.load()
+            else:
+                with instrument.span('uv.render_layer', layer=layer):
+                    bg_im = self._render_layer(copper_obj[layer], img_width, img_height, dpi, tx, ty)
+                    bg_im.save(raster)
+                instrument.count_file(raster)
+
+            if self.width > self.height:
+                bg_im = bg_im.rotate(90, expand=True)
+            uv_im.paste(bg_im, (x, y))
+
+        with instrument.span('uv.save'):
+            uv_im = _uv_color(uv_im)
+            uv_im.save(os.path.join(basepath, 'meshes', UV_MAP_NAME + '.jpg'), mode, optimize=True)
+        instrument.count_file(os.path.join(basepath, 'meshes', UV_MAP_NAME + '.jpg'))
+
+    def uv_tiles(self, copper_obj, basepath, size, pool, tile=UV_TILE_SIZE):
+        """
+        Render the UV map of the board at any size as a pyramid of PNG tiles, for the textures which are too
+        large for one picture. The tiles of level 0 are the map at size x size, every next level halves the
+        previous one until a single tile is left:
+
+            meshes/uv_tiles/<level>/<column>_<row>.png
+            meshes/uv_tiles/tiles.json
+
+        A tile is rendered from the copper polygons which touch it and a tile of the next level from the four
+        tiles under it, so the memory of a job doesn't depend on the size. At UV_MAP_SIZE the tiles of level 0
+        have the same pixels as the map of uv_map before the JPEG compression.
+        :param dict copper_obj: the dict includes the Copper objects on top and bottom side
+        :param str basepath: the target path
+        :param int size: the width and height of the map in pixels
+        :param JobPool pool: the pool which renders the tiles
+        :param int tile: the width and height of a tile in pixels
         :return:
         """
+        assert size > 0 and tile > 0, "The sizes should be positive"
+
+        begin = instrument.now()
+        dpi, img_width, img_height, places = self._uv_layout(size, len(copper_obj))
+        tx, ty = self._uv_origin()
+        rotated = self.width > self.height
+
+        tiles_path = os.path.join(basepath, 'meshes', 'uv_tiles')
+        if os.path.exists(tiles_path):
+            shutil.rmtree(tiles_path)
+
+        columns = rows = -(-size // tile)
+        buckets = {}
+        layers = []
+        for layer, (x, y) in zip(copper_obj, places):
+            placement = (x, y, img_width, img_height, rotated)
+            polygons = _layer_polygons(copper_obj[layer], dpi, tx, ty)
+            traces = _layer_traces(copper_obj[layer], dpi, tx, ty)
+            i = len(layers)
+            layers.append(placement)
+
+            # the tiles which the box of each polygon and trace touches on the map
+            lo = np.array([outer.min(axis=0) for outer, _ in polygons]).reshape(-1, 2)
+            hi = np.array([outer.max(axis=0) for outer, _ in polygons]).reshape(-1, 2)
+            for key, indices in _bucket(_map_boxes(lo, hi, placement) // tile, columns, rows):
+                buckets.setdefault(key, {}).setdefault(i, [[], _NO_TRACES])[0] = [polygons[k] for k in indices]
+
+            lo, hi = _trace_bounds(traces)
+            for key, indices in _bucket(_map_boxes(lo, hi, placement) // tile, columns, rows):
+                buckets.setdefault(key, {}).setdefault(i, [[], _NO_TRACES])[1] = traces[indices]
+
+        levels = [(columns, rows)]
+        os.makedirs(os.path.join(tiles_path, '0'))
+        jobs = []
+        for column in range(columns):
+            for row in range(rows):
+                box = (column * tile, row * tile, min((column + 1) * tile, size), min((row + 1) * tile, size))
+                copper = buckets.pop((column, row), {})
+                placed = [(layers[i], polygons, traces) for i, (polygons, traces) in sorted(copper.items())]
+                jobs.append((_tile_filename(tiles_path, 0, column, row), box, placed))
+        pool.map(_tile_job, jobs)
+
+        level_size = size
+        while columns > 1 or rows > 1:
+            level = len(levels)
+            level_size = -(-level_size // 2)
+            columns, rows = -(-columns // 2), -(-rows // 2)
+            os.makedirs(os.path.join(tiles_path, str(level)))
+
+            jobs = []
+            for column in range(columns):
+                for row in range(rows):
+                    width = min(tile, level_size - column * tile)
+                    height = min(tile, level_size - row * tile)
+                    children = [(_tile_filename(tiles_path, level - 1, 2 * column + i, 2 * row + j), i * tile, j * tile)
+                                for i in range(2) for j in range(2)
+                                if 2 * column + i < levels[-1][0] and 2 * row + j < levels[-1][1]]
+                    jobs.append((_tile_filename(tiles_path, level, column, row), (width, height), tile, children))
+            pool.map(_reduce_job, jobs)
+            levels.append((columns, rows))
+
+        with open(os.path.join(tiles_path, 'tiles.json'), 'w') as f:
+            json.dump({'size': size, 'tile': tile, 'format': 'png', 'levels': levels}, f)
+        instrument.add_span('uv.tiles', begin, size=size, tiles=sum(c * r for c, r in levels))
+
+    def _uv_origin(self):
+        """
+        Get the origin of the copper in board units
+        :return: (tx, ty)
+        :rtype tuple
+        """
         tx, ty = self.offset()
-        tx /= SCALE_RATE
-        ty /= SCALE_RATE
+        return tx / SCALE_RATE, ty / SCALE_RATE
+
+    def _uv_layout(self, size, count):
+        """
+        Get the place of the layers on the UV map, the layers are side by side at the bottom of the map and
+        rotated by 90 degrees when the board is wider than high
+        :param int size: the width and height of the map in pixels
+        :param int count: the number of layers
+        :return: (dpi, img_width, img_height, places), the size of a layer before the rotation and the list of
+                 the (x, y) of the upper left corner of each layer
+        :rtype tuple
+        """
+        rate = float(size) / UV_MAP_SIZE
         dpi = UV_MAP_OFFSET / self.height if self.width > self.height else UV_MAP_OFFSET / self.width
+        dpi *= rate
         img_width = int(dpi * self.width)
         img_height = int(dpi * self.height)
 
-        uv_im = Image.new("RGB", (UV_MAP_SIZE, UV_MAP_SIZE))
-        l = 0
-        for layer in copper_obj:
-            bg_im = Image.new("L", (img_width, img_height))
-            # d = ImageDraw.Draw(bg_im)
-            #
-            # data = np.array(self.outline.geometry.points)
-            # data = data.reshape(-1, 2)
-            # data = data * DPI
-            #
-            # d.polygon(list(data.reshape(-1)), fill=UV_MAP_BG_COLOR)
-            # del d
-
-            for name in copper_obj[layer]:
-                copper = copper_obj[layer][name]
-
-                for polygon in copper['POLYGON']:
-                    if polygon.geometry.points is None:
-                        continue
-
-                    im = Image.new("L", (img_width, img_height))
-                    d = ImageDraw.Draw(im)
-
-                    data = polygon.geometry.points
-                    data = data.reshape(-1, 2) - np.array([tx, ty])
-                    data = data * (dpi * SCALE_RATE)
-
-                    if len(data):
-                        d.polygon(list(data.reshape(-1)), fill="#fff")
-
-                    for hole in polygon.geometry.holes:
-                        if hole.points is None:
-                            continue
-
-                        data = hole.points
-                        data = data.reshape(-1, 2) - np.array([tx, ty])
-                        data = data * (dpi * SCALE_RATE)
-
-                        if len(data):
-                            d.polygon(list(data.reshape(-1)), fill=UV_MAP_BG_COLOR)
-
-                    bg_im = ImageChops.add(bg_im, im)
-                    del d
-                    del im
+        places = []
+        for l in range(count):
+            space = int(l * UV_MAP_SPACE * rate)
             if self.width > self.height:
-                bg_im = bg_im.rotate(90, expand=True)
-                uv_im.paste(bg_im, (int(l * img_height) + l * UV_MAP_SPACE, int(UV_MAP_SIZE - img_width)))
+                places.append((int(l * img_height) + space, int(size - img_width)))
             else:
-                uv_im.paste(bg_im, (int(l * img_width) + l * UV_MAP_SPACE, int(UV_MAP_SIZE - img_height)))
+                places.append((int(l * img_width) + space, int(size - img_height)))
 
-            l += 1
+        return dpi, img_width, img_height, places
 
-        im = Image.new('RGB', (UV_MAP_SIZE, UV_MAP_SIZE), color=(40, 80, 255))
-        uv_im = ImageChops.subtract(uv_im, im)
-        uv_im.save(os.path.join(basepath, 'meshes', '_outline_.jpg'), mode, optimize=True)
\ No newline at end of file
+    def _render_layer(self, layer, img_width, img_height, dpi, tx, ty):
+        """
+        Render the copper polygons and traces of a layer
+        :param dict layer: the dict of the Copper objects of each net
+        :param int img_width: the width of the picture
+        :param int img_height: the height of the picture
+        :param float dpi: the pixels of a unit
+        :param float tx: the x offset of the origin
+        :param float ty: the y offset of the origin
+        :return: the picture of the layer
+        :rtype Image.Image
+        """
+        box = (0, 0, img_width, img_height)
+        pixels = _fill_polygons(_layer_polygons(layer, dpi, tx, ty), box)
+        _stroke_traces(pixels, _layer_traces(layer, dpi, tx, ty), box)
+        return Image.fromarray(pixels, "L")
+
+
+def _write_rows(fh, template, values):
+    """
+    Write the rows of an array, each block of rows is formatted by one call
+    :param file fh: the output file
+    :param str template: the % format of a row
+    :param np.ndarray values: the n x m values
+    :return:
+    """
+    for start in range(0, len(values), OBJ_BLOCK_ROWS):
+        block = values[start:start + OBJ_BLOCK_ROWS]
+        fh.write((template * len(block)) % tuple(block.reshape(-1).tolist()))
+
+
+def _layer_polygons(layer, dpi, tx, ty):
+    """
+    Get the copper polygons of a layer in pixels
+    :param dict layer: the dict of the Copper objects of each net
+    :param float dpi: the pixels of a unit
+    :param float tx: the x offset of the origin
+    :param float ty: the y offset of the origin
+    :return: the list of (outer, holes), the n x 2 points of the outer ring and the list of the points of the
+             holes
+    :rtype list
+    """
+    polygons = []
+    origin = np.array([tx, ty])
+
+    for name in layer:
+        copper = layer[name]
+
+        for polygon in copper['POLYGON']:
+            if polygon.geometry.points is None:
+                continue
+
+            instrument.count('polygons')
+
+            data = polygon.geometry.points
+            data = (data.reshape(-1, 2) - origin) * (dpi * SCALE_RATE)
+            if not len(data):
+                continue
+
+            holes = []
+            for hole in polygon.geometry.holes:
+                if hole.points is None:
+                    continue
+
+                points = (hole.points.reshape(-1, 2) - origin) * (dpi * SCALE_RATE)
+                if len(points):
+                    holes.append(points)
+
+            polygons.append((data, holes))
+
+    return polygons
+
+
+def _fill_polygons(polygons, box, bounds=None):
+    """
+    Render the polygons inside a box of the layer, each polygon is drawn into an image of its own bounding box
+    and merged into the pixels of the box
+    :param list polygons: the list of (outer, holes) in pixels, see _layer_polygons
+    :param tuple box: (x0, y0, x1, y1) the pixels to render
+    :param tuple bounds: (x0, y0, x1, y1) the pixels of the layer, the box when None
+    :return: the pixels of the box, 255 for copper
+    :rtype np.ndarray
+    """
+    bounds = bounds or box
+    pixels = np.zeros((box[3] - box[1], box[2] - box[0]), dtype=np.uint8)
+
+    for data, holes in polygons:
+        polygon_box = _pixel_box(data, box)
+        if polygon_box is None:
+            continue
+
+        # PIL fills the spans which are left or right of the picture into its first or last column, the
+        # margin keeps them out of the box unless the layer ends there
+        x0, y0 = max(polygon_box[0] - 1, bounds[0]), max(polygon_box[1] - 1, bounds[1])
+        x1, y1 = min(polygon_box[2] + 1, bounds[2]), min(polygon_box[3] + 1, bounds[3])
+        im = Image.new("L", (x1 - x0, y1 - y0))
+        d = ImageDraw.Draw(im)
+
+        # the picture of the whole polygon starts here, the pixels of a box are the same as in the whole layer
+        layer_box = _pixel_box(data, bounds)
+        origin = (max(layer_box[0] - 1, bounds[0]), max(layer_box[1] - 1, bounds[1]))
+        d.polygon(_picture_points(data, origin, (x0, y0)), fill="#fff")
+
+        for points in holes:
+            d.polygon(_picture_points(points, origin, (x0, y0)), fill=UV_MAP_BG_COLOR)
+
+        px0, py0, px1, py1 = polygon_box
+        region = pixels[py0 - box[1]:py1 - box[1], px0 - box[0]:px1 - box[0]]
+        np.maximum(region, np.asarray(im)[py0 - y0:py1 - y0, px0 - x0:px1 - x0], out=region)
+        del d
+        del im
+
+    return pixels
+
+
+def _picture_points(points, origin, corner):
+    """
+    Get the points of a polygon in a picture as PIL draws them. PIL truncates the points toward zero, so the
+    points left of or above the picture would fall on other pixels in a picture which starts elsewhere. They are
+    truncated in the picture of the whole polygon and moved to the picture by whole pixels.
+    :param np.ndarray points: the n x 2 points in the pixels of the layer
+    :param tuple origin: (x, y) the corner of the picture of the whole polygon
+    :param tuple corner: (x, y) the corner of the picture
+    :return: the flat points
+    :rtype list
+    """
+    return list((np.trunc(points - origin) + np.subtract(origin, corner)).reshape(-1))
+
+
+def _layer_traces(layer, dpi, tx, ty):
+    """
+    Get the copper traces of a layer in pixels, the segments of the lines and of the chords of the arcs are
+    split into short pieces, so a piece touches only the tiles near it
+    :param dict layer: the dict of the Copper objects of each net
+    :param float dpi: the pixels of a unit
+    :param float tx: the x offset of the origin
+    :param float ty: the y offset of the origin
+    :return: the n x 5 array of the (x0, y0, x1, y1, width) of each piece
+    :rtype np.ndarray
+    """
+    lines = []
+    widths = []
+    for name in layer:
+        for copper in layer[name]['LINE']:
+            if copper.geometry is None or copper.geometry.points is None or len(copper.geometry.points) < 4:
+                continue
+
+            lines.append(copper.geometry.points)
+            widths.append(copper.width)
+
+    if not lines:
+        return _NO_TRACES
+
+    instrument.count('traces', len(lines))
+
+    # the segments between the consecutive points of each line
+    counts = np.array([len(points) // 2 for points in lines])
+    points = (np.concatenate(lines).reshape(-1, 2) - np.array([tx, ty])) * (dpi * SCALE_RATE)
+    starts = np.ones(len(points), dtype=bool)
+    starts[np.cumsum(counts) - 1] = False
+    starts = np.flatnonzero(starts)
+    widths = np.repeat(np.array(widths) * (dpi * SCALE_RATE), counts)[starts]
+
+    # the pieces of each segment
+    vectors = points[starts + 1] - points[starts]
+    pieces = np.ceil(np.hypot(vectors[:, 0], vectors[:, 1]) / np.maximum(2 * widths, TRACE_PIECE_LENGTH))
+    pieces = np.maximum(pieces, 1).astype(np.intp)
+    segment = np.repeat(np.arange(len(starts)), pieces)
+    k = np.arange(len(segment)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+
+    origins = points[starts][segment]
+    vectors = vectors[segment] / pieces[segment][:, np.newaxis].astype(float)
+    traces = np.empty((len(segment), 5))
+    traces[:, 0:2] = origins + vectors * k[:, np.newaxis]
+    traces[:, 2:4] = origins + vectors * (k + 1)[:, np.newaxis]
+    traces[:, 4] = widths[segment]
+    return traces
+
+
+def _trace_bounds(traces):
+    """
+    Get the boxes of the traces
+    :param np.ndarray traces: the pieces of the traces, see _layer_traces
+    :return: (lo, hi) the n x 2 lower and upper corners in pixels
+    :rtype tuple
+    """
+    radius = _trace_radius(traces)[:, np.newaxis]
+    lo = np.minimum(traces[:, 0:2], traces[:, 2:4]) - radius
+    hi = np.maximum(traces[:, 0:2], traces[:, 2:4]) + radius
+    return lo, hi
+
+
+def _trace_radius(traces):
+    # a trace is at least a pixel wide, so the traces which are thinner than a pixel stay visible
+    return np.maximum(traces[:, 4] / 2, 0.5)
+
+
+def _stroke_traces(pixels, traces, box):
+    """
+    Draw the round capped traces into the pixels of a box, a pixel is copper when its center is within half the
+    width of a piece. A piece is walked along its longer axis, only the pixels of each column which are within
+    the band of the piece are tested, and the pixels of many pieces are tested at once.
+    :param np.ndarray pixels: the pixels of the box
+    :param np.ndarray traces: the pieces of the traces in the pixels of the layer, see _layer_traces
+    :param tuple box: (x0, y0, x1, y1) the pixels of the layer in pixels
+    :return:
+    """
+    if not len(traces):
+        return
+
+    radius = _trace_radius(traces)
+
+    # (u, v) is (x, y) for the pieces which are wider than high and (y, x) for the others, ua <= ub
+    steep = np.abs(traces[:, 3] - traces[:, 1]) > np.abs(traces[:, 2] - traces[:, 0])
+    a = np.where(steep[:, np.newaxis], traces[:, 1::-1], traces[:, 0:2])
+    b = np.where(steep[:, np.newaxis], traces[:, 3:1:-1], traces[:, 2:4])
+    swap = a[:, 0] > b[:, 0]
+    a[swap], b[swap] = b[swap], a[swap].copy()
+    du, dv = b[:, 0] - a[:, 0], b[:, 1] - a[:, 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(du > 0, dv / du, 0)
+
+    # the half height of the band of a piece in a column
+    half = radius * np.sqrt(1 + slope * slope)
+    u_box = np.where(steep[:, np.newaxis], [box[1], box[3]], [box[0], box[2]])
+    v_box = np.where(steep[:, np.newaxis], [box[0], box[2]], [box[1], box[3]])
+    u0 = np.maximum(np.ceil(a[:, 0] - radius - 0.5), u_box[:, 0]).astype(np.intp)
+    columns = np.maximum(np.minimum(np.floor(b[:, 0] + radius - 0.5) + 1, u_box[:, 1]).astype(np.intp) - u0, 0)
+
+    # about the pixels of each piece, to keep the arrays of a chunk small
+    sizes = columns * np.ceil(2 * half + 1).astype(np.intp)
+    ends = np.cumsum(sizes)
+    bounds = np.searchsorted(ends, np.arange(TRACE_CHUNK_SIZE, ends[-1], TRACE_CHUNK_SIZE), side='right')
+
+    for chunk in np.split(np.arange(len(traces)), bounds):
+        chunk = chunk[columns[chunk] > 0]
+        if not len(chunk):
+            continue
+
+        # the columns of the pieces and the rows of the band in each column
+        piece = np.repeat(chunk, columns[chunk])
+        u = u0[piece] + np.arange(len(piece)) - np.repeat(np.cumsum(columns[chunk]) - columns[chunk], columns[chunk])
+        middle = a[piece, 1] + (np.clip(u + 0.5, a[piece, 0], b[piece, 0]) - a[piece, 0]) * slope[piece]
+        v0 = np.maximum(np.ceil(middle - half[piece] - 0.5), v_box[piece, 0]).astype(np.intp)
+        rows = np.maximum(np.minimum(np.floor(middle + half[piece] - 0.5) + 1, v_box[piece, 1]).astype(np.intp) - v0, 0)
+
+        column = np.repeat(np.arange(len(piece)), rows)
+        piece = piece[column]
+        u = u[column]
+        v = v0[column] + np.arange(len(column)) - np.repeat(np.cumsum(rows) - rows, rows)
+
+        # the distance between the center of the pixel and the piece
+        cu, cv = u + 0.5 - a[piece, 0], v + 0.5 - a[piece, 1]
+        length = du[piece] ** 2 + dv[piece] ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip(np.where(length > 0, (cu * du[piece] + cv * dv[piece]) / length, 0), 0, 1)
+        cu -= t * du[piece]
+        cv -= t * dv[piece]
+
+        inside = cu * cu + cv * cv <= radius[piece] ** 2
+        x, y = np.where(steep[piece], v, u)[inside], np.where(steep[piece], u, v)[inside]
+        pixels[y - box[1], x - box[0]] = 255
+
+
+def _pixel_box(data, box):
+    """
+    Get the pixels a polygon can cover, a pixel of margin is kept around the points
+    :param np.ndarray data: the n x 2 points of the polygon in pixels
+    :param tuple box: (x0, y0, x1, y1) the pixels of the picture
+    :return: (x0, y0, x1, y1) clipped to the picture, None when the polygon is empty or outside of it
+    :rtype tuple
+    """
+    if not len(data):
+        return None
+
+    x0, y0 = np.floor(data.min(axis=0)).astype(int) - 1
+    x1, y1 = np.ceil(data.max(axis=0)).astype(int) + 2
+    x0, y0 = max(x0, box[0]), max(y0, box[1])
+    x1, y1 = min(x1, box[2]), min(y1, box[3])
+    if x1 <= x0 or y1 <= y0:
+        return None
+
+    return int(x0), int(y0), int(x1), int(y1)
+
+
+def _map_boxes(lo, hi, placement):
+    """
+    Get the pixels of the UV map the boxes of a layer can cover
+    :param np.ndarray lo: the n x 2 lower corners of the boxes in the pixels of the layer
+    :param np.ndarray hi: the n x 2 upper corners
+    :param tuple placement: (x, y, img_width, img_height, rotated) of the layer on the map
+    :return: the n x 4 (x0, y0, x1, y1) of the first and last pixel of each box
+    :rtype np.ndarray
+    """
+    x, y, img_width, img_height, rotated = placement
+    lo, hi = np.floor(lo) - 1, np.ceil(hi) + 1
+    if rotated:
+        # the layer is turned counterclockwise, see Image.rotate
+        boxes = [x + lo[:, 1], y + img_width - hi[:, 0] - 1, x + hi[:, 1], y + img_width - lo[:, 0] - 1]
+    else:
+        boxes = [x + lo[:, 0], y + lo[:, 1], x + hi[:, 0], y + hi[:, 1]]
+
+    return np.column_stack(boxes).astype(np.int64).reshape(-1, 4)
+
+
+def _bucket(cells, columns, rows):
+    """
+    Group the items by the tiles they touch
+    :param np.ndarray cells: the n x 4 (first column, first row, last column, last row) of the tiles of each item
+    :param int columns: the number of columns of the tiles
+    :param int rows: the number of rows of the tiles
+    :return: the list of ((column, row), indices of the items) in the order of the items
+    :rtype list
+    """
+    valid = (cells[:, 2] >= 0) & (cells[:, 3] >= 0) & (cells[:, 0] < columns) & (cells[:, 1] < rows)
+    if not valid.any():
+        return []
+
+    c0, r0 = np.maximum(cells[:, 0], 0), np.maximum(cells[:, 1], 0)
+    c1, r1 = np.minimum(cells[:, 2], columns - 1), np.minimum(cells[:, 3], rows - 1)
+
+    keys = []
+    items = []
+    for dc in range((c1 - c0)[valid].max() + 1):
+        for dr in range((r1 - r0)[valid].max() + 1):
+            k = np.flatnonzero(valid & (c0 + dc <= c1) & (r0 + dr <= r1))
+            keys.append((c0[k] + dc) * rows + r0[k] + dr)
+            items.append(k)
+
+    keys = np.concatenate(keys)
+    items = np.concatenate(items)
+    order = np.lexsort((items, keys))
+    keys, items = keys[order], items[order]
+    tiles, starts = np.unique(keys, return_index=True)
+    return [((int(key) // rows, int(key) % rows), indices)
+            for key, indices in zip(tiles, np.split(items, starts[1:]))]
+
+
+def _uv_color(im):
+    """
+    Color the copper of the UV map
+    :param Image.Image im: the RGB picture of the copper
+    :return: the colored picture
+    :rtype Image.Image
+    """
+    return ImageChops.subtract(im, Image.new('RGB', im.size, color=(40, 80, 255)))
+
+
+def _tile_filename(path, level, column, row):
+    return os.path.join(path, str(level), '%d_%d.png' % (column, row))
+
+
+def _tile_job(job):
+    """
+    Render a tile of the UV map
+    :param tuple job: (filename, box, placed), the box is the (x0, y0, x1, y1) of the tile on the map and placed
+                      is the list of the (placement, polygons, traces) of each layer, see _map_boxes,
+                      _layer_polygons and _layer_traces
+    :return:
+    """
+    filename, (x0, y0, x1, y1), placed = job
+    tile_im = Image.new("L", (x1 - x0, y1 - y0))
+
+    for (x, y, img_width, img_height, rotated), polygons, traces in placed:
+        width, height = (img_height, img_width) if rotated else (img_width, img_height)
+        u0, v0 = max(x0, x) - x, max(y0, y) - y
+        u1, v1 = min(x1, x + width) - x, min(y1, y + height) - y
+        if u1 <= u0 or v1 <= v0:
+            continue
+
+        # the pixel (u, v) of the turned layer is the pixel (img_width - 1 - v, u) of the layer
+        box = (img_width - v1, u0, img_width - v0, u1) if rotated else (u0, v0, u1, v1)
+        pixels = _fill_polygons(polygons, box, (0, 0, img_width, img_height))
+        _stroke_traces(pixels, traces, box)
+        im = Image.fromarray(pixels, "L")
+        if rotated:
+            im = im.rotate(90, expand=True)
+        tile_im.paste(im, (x + u0 - x0, y + v0 - y0))
+
+    _uv_color(tile_im.convert("RGB")).save(filename)
+
+
+def _reduce_job(job):
+    """
+    Render a tile of the next level of the pyramid from the four tiles under it
+    :param tuple job: (filename, size, tile, children), children is the list of the (filename, x, y) of the
+                      tiles under it
+    :return:
+    """
+    filename, size, tile, children = job
+    im = Image.new("RGB", (2 * tile, 2 * tile))
+
+    for child, x, y in children:
+        child_im = Image.open(child)
+        im.paste(child_im, (x, y))
+        child_im.close()
+
+    width, height = size
+    im.crop((0, 0, 2 * width, 2 * height)).resize(size, Image.BOX).save(filename)
@@ -1,12 +1,18 @@
+import assembly
+import geometry
 import shape
+from pad import extrude_pad
 from pin import PackagePin
 from stl import mesh
 import numpy as np
 import os
+import hashlib
 import json
+from itertools import izip
 
 from setting import __author__, __version__
-from setting import BOARD_HEIGHT, PAD_HEIGHT
+from setting import BOARD_HEIGHT, PAD_HEIGHT, PACKAGE_KEY_PRECISION, SCALE_RATE
+import instrument
 
 try:
     import xml.etree.cElementTree as ET
@@ -29,6 +35,10 @@ class Package(object):
         self._center = None
         self.mesh = None
         self.pads = None
+        # the name of the model files, there is one model of each mesh, see model_names
+        self.model = None
+        # the pending (matrix, offset) of the geometries and the pins, see apply_transform
+        self._transform = None
 
         if data:
             if data['SUBCLASS'] == "BODY_CENTER":
@@ -61,13 +71,40 @@ class Package(object):
         # SUBCLASS: LAYER
         self._append_geometry_data(data)
 
+    def append_geometry_shape(self, line, sym_name, refdes, layer):
+        """
+        Append a parsed Line or Arc to the current geometry
+        :param line: the Line or Arc, None for the unsupported records
+        :param str sym_name: the SYM_NAME of the record
+        :param str refdes: the REFDES of the record
+        :param str layer: the SUBCLASS of the record
+        :return:
+        """
+        if not self.SYM_NAME:
+            self.SYM_NAME = sym_name
+
+        if not self.REFDES:
+            self.REFDES = refdes
+
+        if not self.LAYER and layer != "BODY_CENTER":
+            self.LAYER = layer
+
+        if len(self.geometries) == 0:
+            self.add_geometry()
+
+        if line is not None:
+            self.geometry.append(line)
+
     def update_body_center(self, data):
+        start = [float(data['GRAPHIC_DATA_1']), float(data['GRAPHIC_DATA_2'])]
+        end = [float(data['GRAPHIC_DATA_3']), float(data['GRAPHIC_DATA_4'])]
+        self.append_body_center(shape.Line(start, end))
+
+    def append_body_center(self, line):
         if not self._center:
             self._center = []
 
-        start = [float(data['GRAPHIC_DATA_1']), float(data['GRAPHIC_DATA_2'])]
-        end = [float(data['GRAPHIC_DATA_3']), float(data['GRAPHIC_DATA_4'])]
-        self._center.append(shape.Line(start, end))
+        self._center.append(line)
 
     def _append_geometry_data(self, data):
         # GRAPHIC_DATA_NAME: TYPE
@@ -89,36 +126,62 @@ class Package(object):
         else:
             pass
 
+    def merge(self, other):
+        """
+        Append the records of the same package which were parsed separately, e.g. in another chunk
+        :param Package other: the package parsed from the later records
+        :return:
+        """
+        if other._center:
+            self._center = (self._center or []) + other._center
+
+        if other.geometries:
+            self.geometries.extend(other.geometries)
+            self.geometry = self.geometries[-1]
+
+        if not self.SYM_NAME:
+            self.SYM_NAME = other.SYM_NAME
+
+        if not self.REFDES:
+            self.REFDES = other.REFDES
+
+        if not self.LAYER:
+            self.LAYER = other.LAYER
+
+        self.pin.update(other.pin)
+
     def add_pin(self, data):
         pin = PackagePin(data)
         pin_number = data['PIN_NUMBER']
         self.pin[pin_number] = pin
 
     def save(self, basepath, height=10, pads=None):
-        path = os.path.join(basepath, 'meshes', 'packages')
-        if not os.path.exists(path):
-            os.makedirs(path)
-
-        filename = os.path.join(path, self.SYM_NAME + '.stl')
-        for g in self.geometries:
-            if len(g._shapes) == 1 and g._shapes[0].__class__.__name__ == "Line":
-                self.geometries.remove(g)
-
-        for g in self.geometries:
-            if g is None:
-                continue
-
-            geometry = g.extrude(height)
-            vertices = geometry["vertices"]
-            m = mesh.Mesh(np.zeros(geometry["faces"].shape[0], dtype=mesh.Mesh.dtype))
-            for i in range(len(geometry["faces"])):
-                for j in range(3):
-                    m.vectors[i][j] = vertices[geometry["faces"][i][j]]
-
-            if self.mesh is None:
-                self.mesh = m.data
-            else:
-                self.mesh = np.concatenate([self.mesh, m.data])
+        self.build_mesh(height)
+        self.write(basepath)
+
+    def build_mesh(self, height):
+        """
+        Build the mesh of the body and the pads
+        :param float height: the height of the body
+        :return:
+        """
+        begin = instrument.now()
+        meshes = assembly.MeshAccumulator()
+        meshes.append(self.mesh)
+        meshes.append(package_mesh(height, *self.mesh_args()))
+
+        self.mesh = meshes.data()
+        instrument.add_span('package.extrude', begin, sym=self.SYM_NAME)
+
+    def mesh_args(self):
+        """
+        Get the geometry the mesh is built from as plain arrays, see package_mesh
+        :return: the rings of the bodies, the pins and the rings of the pads
+        :rtype tuple
+        """
+        bodies = [g.rings() for g in self.geometries if g is not None]
+        pins = []
+        pads = {}
 
         for num in self.pin:
             # sometimes the pin-num maybe ''
@@ -140,33 +203,154 @@ class Package(object):
                 height = PAD_HEIGHT * 0.75
                 offset = 0
 
-            # Extrude PAD unsuccessfully
-            pad_mesh = self.pads[pin.PAD_STACK_NAME][0].extrude(height, offset)
-            if not pad_mesh:
+            pad = self.pads[pin.PAD_STACK_NAME][0]
+            if pad.geometry is None:
                 continue
 
-            pad_mesh.rotate([0, 0, 1], np.radians(pin.PIN_ROTATION))
-            pad_mesh.translate((pin.PIN_X, pin.PIN_Y, 0))
-            if self.mesh is None:
-                self.mesh = pad_mesh.data
-            else:
-                self.mesh = np.concatenate([self.mesh, pad_mesh.data])
+            pads[pin.PAD_STACK_NAME] = pad.geometry.rings()
+            pins.append((pin.PAD_STACK_NAME, height, offset, pin.PIN_ROTATION, pin.PIN_X, pin.PIN_Y))
 
-        combined = mesh.Mesh(self.mesh)
-        combined.save(filename)
+        return bodies, pins, pads
+
+    def write(self, basepath):
+        """
+        Write the STL file of the mesh
+        :param str basepath: the target path to export
+        :return:
+        """
+        path = os.path.join(basepath, 'meshes', 'packages')
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        filename = os.path.join(path, self.model_name() + '.stl')
+        with instrument.span('package.write', sym=self.SYM_NAME):
+            assembly.write_stl(filename, self.mesh)
+        instrument.count('triangles', len(self.mesh))
+        instrument.count_file(filename)
+
+    def remove_lines(self):
+        """
+        Remove the geometries which are only a line before the package is saved, they have no body to extrude
+        :return:
+        """
+        for g in self.geometries:
+            if len(g._shapes) == 1 and g._shapes[0].__class__.__name__ == "Line":
+                self.geometries.remove(g)
+
+    def mesh_key(self, height):
+        """
+        Get the key of the mesh of the placed package, the packages with the same key have the same mesh. The
+        coordinates are compared at PACKAGE_KEY_PRECISION, so the same footprint matches in every placement.
+        :param float height: the height of the package
+        :return: the key
+        :rtype str
+        """
+        digest = hashlib.sha1()
+        digest.update(repr((self.SYM_NAME, height)))
+
+        for g in self.geometries:
+            if g is None:
+                continue
+
+            digest.update(_quantize(g.points))
+            for hole in g.holes:
+                digest.update(_quantize(hole.points))
+            digest.update('|')
+
+        for num in sorted(self.pin):
+            pin = self.pin[num]
+            rotation = pin.PIN_ROTATION
+            if rotation is not None:
+                rotation = round(rotation, 6) % 360
+            digest.update(repr((num, pin.PAD_STACK_NAME, rotation)))
+            digest.update(_quantize([pin.PIN_X, pin.PIN_Y]))
+
+        return digest.hexdigest()
+
+    def geometry_copy(self):
+        """
+        Get a copy with the geometries, the pins and the body center, it can be moved without moving this package
+        :return: the package
+        :rtype Package
+        """
+        self.apply_transform()
+
+        package = Package()
+        package.SYM_NAME = self.SYM_NAME
+        package.REFDES = self.REFDES
+        package.LAYER = self.LAYER
+        package._center = self._center
+        package.geometries = [shape.Polygon.from_points(g.points.copy(), [h.points.copy() for h in g.holes])
+                              for g in self.geometries if g is not None]
+        package.pin = dict((num, pin.copy()) for num, pin in self.pin.iteritems())
+
+        return package
+
+    def canonicalize(self, rotation, mirror):
+        """
+        Move the package of a placed component to the orientation its footprint is meshed in, see PackageLibrary:
+        in meters, the center at the origin, not rotated and not mirrored, and the pin rotations relative to the
+        component
+        :param float rotation: the SYM_ROTATE of the component
+        :param bool mirror: the SYM_MIRROR of the component
+        :return:
+        """
+        cx, cy = self.center()
+
+        self.scale(SCALE_RATE)
+        self.translate([-cx * SCALE_RATE, -cy * SCALE_RATE])
+
+        if rotation > 0:
+            self.rotate(rotation)
+
+        if mirror:
+            self.mirror()
+
+        self.ccw()
+
+        # the pads are placed with the component, so their rotation becomes relative to it
+        for pin in self.pin.itervalues():
+            if pin.PIN_ROTATION is None:
+                continue
+
+            angle = pin.PIN_ROTATION - rotation if rotation > 0 else pin.PIN_ROTATION
+            pin.PIN_ROTATION = (-angle if mirror else angle) % 360
+
+    def file_copy(self):
+        """
+        Get a copy with only what the files of the package are written from, it is cheap to send to a worker
+        :return: the package with the name, the pins and the mesh
+        :rtype Package
+        """
+        package = Package()
+        package.SYM_NAME = self.SYM_NAME
+        package.model = self.model
+        package.pin = self.pin
+        package.mesh = self.mesh
+
+        return package
+
+    def model_name(self):
+        """
+        Get the name of the STL file and of the model of the package
+        :return: the model name, the SYM_NAME until the package is added to a PackageLibrary
+        :rtype str
+        """
+        return self.model or self.SYM_NAME
 
     def sdf(self, basepath):
-        path = os.path.join(basepath, 'models', self.SYM_NAME)
+        name = self.model_name()
+        path = os.path.join(basepath, 'models', name)
         if not os.path.exists(path):
             os.makedirs(path)
 
-        package_uri = "file://" + os.path.abspath(os.path.join(basepath, 'meshes', 'packages', self.SYM_NAME + '.stl'))
+        package_uri = "file://" + os.path.abspath(os.path.join(basepath, 'meshes', 'packages', name + '.stl'))
         pad_uri = "file://" + os.path.abspath(os.path.join(basepath, 'meshes', 'pads')) + '/'
         filename = os.path.join(path, 'model.sdf')
 
         root_node = ET.Element('sdf')
         model_node = ET.SubElement(root_node, 'model')
-        model_node.set('name', self.SYM_NAME)
+        model_node.set('name', name)
 
         pose_node = ET.SubElement(model_node, 'pose')
         pose_node.text = "{} {} {} {} {} {}".format(0, 0, 0, 0, 0, 0)
@@ -174,17 +358,17 @@ class Package(object):
         static_node.text = 'true'
 
         link_node = ET.SubElement(model_node, 'link')
-        link_node.set('name', self.SYM_NAME + '_link')
+        link_node.set('name', name + '_link')
 
         collision_node = ET.SubElement(link_node, 'collision')
-        collision_node.set('name', self.SYM_NAME + '_collision')
+        collision_node.set('name', name + '_collision')
         geometry_node = ET.SubElement(collision_node, 'geometry')
         mesh_node = ET.SubElement(geometry_node, 'mesh')
         uri_node = ET.SubElement(mesh_node, 'uri')
         uri_node.text = package_uri
 
         visual_node = ET.SubElement(link_node, 'visual')
-        visual_node.set('name', self.SYM_NAME + '_visual')
+        visual_node.set('name', name + '_visual')
         geometry_node = ET.SubElement(visual_node, 'geometry')
         mesh_node = ET.SubElement(geometry_node, 'mesh')
         uri_node = ET.SubElement(mesh_node, 'uri')
@@ -219,7 +403,7 @@ class Package(object):
         root_node = ET.Element('model')
 
         name_node = ET.SubElement(root_node, 'name')
-        name_node.text = self.SYM_NAME
+        name_node.text = self.model_name()
 
         version_node = ET.SubElement(root_node, 'version')
         version_node.text = __version__
@@ -241,53 +425,77 @@ class Package(object):
     def translate(self, offset):
         assert isinstance(offset, (list, tuple)), "Parameter should be a list or tuple"
 
-        for geometry in self.geometries:
-            geometry.translate(offset)
-
-        for n in self.pin:
-            self.pin[n].PIN_X += offset[0]
-            self.pin[n].PIN_Y += offset[1]
+        self._compose(np.identity(2), offset)
 
     def scale(self, rate):
-        for geometry in self.geometries:
-            geometry.scale(rate)
-
-        for n in self.pin:
-            self.pin[n].PIN_X *= rate
-            self.pin[n].PIN_Y *= rate
+        self._compose(np.identity(2) * rate)
 
     def mirror(self):
-        for geometry in self.geometries:
-            geometry.mirror()
-
-        for n in self.pin:
-            self.pin[n].PIN_X *= (-1)
+        self._compose(np.diag([-1.0, 1.0]))
 
     def rotate(self, deg):
-        for geometry in self.geometries:
-            geometry.rotate(deg)
-
         theta = np.radians(deg)
         c, s = np.cos(theta), np.sin(theta)
-        mat = np.array([[c, -s], [s, c]])
-
-        for n in self.pin:
-            point = np.array([self.pin[n].PIN_X, self.pin[n].PIN_Y])
-            point = point.dot(mat)
+        self._compose(np.array([[c, -s], [s, c]]))
+
+    def _compose(self, matrix, offset=(0, 0)):
+        """
+        Append a transform to the pending one, the points are transformed by apply_transform
+        :param numpy.ndarray matrix: the 2x2 matrix, a point is the row vector p and moves to p.dot(matrix) + offset
+        :param offset: the translation
+        :return:
+        """
+        if self._transform is None:
+            self._transform = (np.identity(2), np.zeros(2))
+
+        current, current_offset = self._transform
+        self._transform = (current.dot(matrix), current_offset.dot(matrix) + offset)
+
+    def apply_transform(self):
+        """
+        Move the geometries and the pins by the pending transform in one pass over all their points
+        :return:
+        """
+        if self._transform is None:
+            return
+
+        matrix, offset = self._transform
+        self._transform = None
+
+        rings = []
+        for geometry in self.geometries:
+            if geometry is not None:
+                rings.append(geometry)
+                rings.extend(geometry.holes)
 
-            self.pin[n].PIN_X = point[0]
-            self.pin[n].PIN_Y = point[1]
+        pins = self.pin.values()
+        points = [ring._points for ring in rings]
+        points.append(np.array([[pin.PIN_X, pin.PIN_Y] for pin in pins], dtype=np.float64).reshape(-1))
+        points = np.concatenate(points).reshape(-1, 2).dot(matrix) + offset
 
-    def ccw(self):
-        for geometry in self.geometries:
-            points = geometry.points.reshape(-1, 2)
-            if len(points) < 3:
-                continue
+        pos = 0
+        for ring in rings:
+            size = len(ring._points) // 2
+            ring._points = points[pos:pos + size].reshape(-1)
+            pos += size
 
-            points = points[:3]
-            noraml = np.cross(points[1] - points[0], points[2] - points[0])
+        for pin, (x, y) in zip(pins, points[pos:].tolist()):
+            pin.PIN_X = x
+            pin.PIN_Y = y
 
-            if noraml < 0:
+    def ccw(self):
+        """
+        Make the outer ring of each geometry counterclockwise, the winding is the sign of its area
+        :return:
+        """
+        self.apply_transform()
+
+        geometries = [g for g in self.geometries if g is not None and len(g.points) >= 6]
+        if not geometries:
+            return
+
+        for geometry, area in zip(geometries, shape.signed_areas([g.points for g in geometries])):
+            if area < 0:
                 geometry.reverse()
 
     def reverse(self):
@@ -295,6 +503,8 @@ class Package(object):
             geometry.reverse()
 
     def center(self):
+        self.apply_transform()
+
         if self._center:
             start = self._center[0].start
             end = self._center[0].end
@@ -313,3 +523,135 @@ class Package(object):
             max_y = max(y_points)
 
             return (max_x + min_x) / 2, (max_y + min_y) / 2
+
+
+class PackageLibrary(object):
+    def __init__(self):
+        """
+        The meshes of the packages. The components with the same footprint share one mesh in the canonical
+        orientation, the rotation and the mirror of a component are only its placement. Each footprint is
+        meshed once by build and the files of each mesh are written once by flush, see model_names.
+        """
+        self._meshes = {}
+        self._pending = {}
+        self._files = {}
+
+    def save(self, package, height, sim=False):
+        """
+        Add a placed package, its mesh is set by build
+        :param Package package: the package in the canonical orientation
+        :param float height: the height of the package
+        :param bool sim: write the model files for simulation
+        :return:
+        """
+        key = package.mesh_key(height)
+        self._pending.setdefault(key, (height, []))[1].append(package)
+        self._files[key] = (package, sim)
+
+    def build(self, pool):
+        """
+        Mesh the footprints which were added since the last build
+        :param JobPool pool: the pool which runs the jobs
+        :return:
+        """
+        keys = [key for key in self._pending if key not in self._meshes]
+        jobs = []
+        for key in keys:
+            height, packages = self._pending[key]
+            jobs.append((packages[0].SYM_NAME, height) + packages[0].mesh_args())
+
+        for key, data in izip(keys, pool.map(_mesh_job, jobs)):
+            self._meshes[key] = data
+
+        names = model_names([(packages[0].SYM_NAME, key, min(package.REFDES for package in packages))
+                             for key, (height, packages) in self._pending.iteritems()])
+        for key, (height, packages) in self._pending.iteritems():
+            for package in packages:
+                package.mesh = self._meshes[key]
+                package.model = names[key]
+
+        self._pending = {}
+
+    def flush(self, basepath, pool):
+        """
+        Write the files of the packages
+        :param str basepath: the target path to export
+        :param JobPool pool: the pool which runs the jobs
+        :return:
+        """
+        pool.map(_write_job, [(basepath, package.file_copy(), sim) for package, sim in self._files.itervalues()])
+        self._files = {}
+
+
+def model_names(meshes):
+    """
+    Name the models of the meshes. The components of a SYM_NAME can have more than one mesh, e.g. with different
+    heights, the mesh of the first REFDES is named SYM_NAME and the others SYM_NAME_1, SYM_NAME_2 and so on.
+    :param list meshes: the (SYM_NAME, key, the first REFDES) of each mesh, all the meshes of a SYM_NAME
+    :return: the model name of each key
+    :rtype dict
+    """
+    names = {}
+    syms = {}
+    for sym, key, ref in sorted(meshes, key=lambda mesh: (mesh[0], mesh[2])):
+        n = syms.get(sym, 0)
+        names[key] = sym + '_' + str(n) if n else sym
+        syms[sym] = n + 1
+
+    return names
+
+
+def package_mesh(height, bodies, pins, pads):
+    """
+    Build the mesh of a package from plain arrays, it runs in the export workers as well
+    :param float height: the height of the body
+    :param list bodies: the rings of each body geometry, see Polygon.rings
+    :param list pins: the (PAD_STACK_NAME, height, z offset, rotation, x, y) of each pin
+    :param dict pads: the rings of the pad of each PAD_STACK_NAME
+    :return: the triangles, None when the package has no mesh
+    :rtype numpy.ndarray
+    """
+    meshes = assembly.MeshAccumulator()
+
+    for body in geometry.extrude_many(bodies, height):
+        instrument.count('polygons')
+        meshes.append(assembly.stl_mesh(body["vertices"], body["faces"]).data)
+
+    pad_meshes = {}
+    for name, pad_height, offset, rotation, x, y in pins:
+        key = (name, pad_height, offset)
+        if key not in pad_meshes:
+            pad_meshes[key] = extrude_pad(pads[name], pad_height, offset).data
+
+        # Extrude PAD unsuccessfully
+        if not len(pad_meshes[key]):
+            continue
+
+        # the pin rotation is counterclockwise, Mesh.rotate turns clockwise, see place_instances
+        pad_mesh = mesh.Mesh(pad_meshes[key].copy(), calculate_normals=False)
+        pad_mesh.rotate([0, 0, 1], np.radians(-rotation))
+        pad_mesh.translate((x, y, 0))
+        meshes.append(pad_mesh.data)
+
+    return meshes.data()
+
+
+def _mesh_job(job):
+    begin = instrument.now()
+    data = package_mesh(*job[1:])
+    instrument.add_span('package.extrude', begin, sym=job[0])
+
+    return data
+
+
+def _write_job(job):
+    basepath, package, sim = job
+    package.write(basepath)
+
+    if sim:
+        package.sdf(basepath)
+
+
+def _quantize(points):
+    points = np.round(np.asarray(points, dtype=np.float64) / PACKAGE_KEY_PRECISION)
+    return points.astype(np.int64).tostring()
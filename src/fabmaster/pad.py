@@ -1,12 +1,12 @@
+import assembly
+from geometry import extrude
 import shape
-from stl import mesh
+from record import Record
 import numpy as np
 import os
 
 
-class Pad(object):
-    geometry = None
-    mesh = None
+class Pad(Record):
     _whitelist = [
         'PAD_NAME',
         'LAYER',
@@ -16,13 +16,16 @@ class Pad(object):
         'PADXOFF',
         'PADYOFF',
     ]
+    _fields = tuple(_whitelist)
+    _interned = frozenset(['PAD_NAME', 'LAYER', 'PADSHAPE1', 'PADWIDTH', 'PADHGHT', 'PADXOFF', 'PADYOFF'])
+    __slots__ = _fields + ('geometry', 'mesh')
 
     def __init__(self, data):
-        if data:
-            for key in data:
-                if key in self._whitelist:
-                    self.__dict__[key] = data[key]
+        self.geometry = None
+        self.mesh = None
 
+        if data:
+            self._set_fields(data)
             self._set_geometry(data)
 
     def _set_geometry(self, data):
@@ -87,15 +90,21 @@ class Pad(object):
         if self.geometry is None:
             return None
 
-        geometry = self.geometry.extrude(height)
-        vertices = geometry["vertices"] + np.array([0, 0, offset])
-        m = mesh.Mesh(np.zeros(geometry["faces"].shape[0], dtype=mesh.Mesh.dtype))
-        for i in range(len(geometry["faces"])):
-            for j in range(3):
-                m.vectors[i][j] = vertices[geometry["faces"][i][j]]
+        self.mesh = extrude_pad(self.geometry.rings(), height, offset)
+
+        return self.mesh
 
-        del geometry
 
-        self.mesh = m
+def extrude_pad(rings, height, offset=0):
+    """
+    Extrude the geometry of a pad
+    :param list rings: the rings of the geometry, see Polygon.rings
+    :param float height: the height of the pad
+    :param float offset: the z of the bottom of the pad
+    :return: the mesh
+    :rtype mesh.Mesh
+    """
+    geometry = extrude([list(ring) for ring in rings], height)
+    vertices = geometry["vertices"] + np.array([0, 0, offset])
 
-        return m
+    return assembly.stl_mesh(vertices, geometry["faces"])
@@ -0,0 +1,351 @@
+from itertools import chain, izip
+import gc
+import multiprocessing
+import numpy as np
+
+from cache import Rings, dump_copper, dump_packages, dump_pads, dump_pins, load_column, load_copper, load_packages
+from cache import load_pads, load_pins, store_column
+from componet import Component
+from index import open_mapped, mapped_lines
+from outline import OutLine
+from package import Package
+from pin import ComponentPin, PackagePin
+from shape import Arc, Line
+import instrument
+
+# The sections parsed by the workers, the others are parsed by the calling process
+POOLED_SECTIONS = ['component_pin', 'pad_definition', 'package_geometry', 'package_pins', 'copper_etch']
+
+# A chunk of these sections only starts where all the fields change, so a geometry never spans two chunks
+GROUP_FIELDS = {
+    'package_geometry': ['RECORD_TAG', 'REFDES'],
+    'copper_etch': ['RECORD_TAG'],
+}
+
+MIN_CHUNK_SIZE = 1 << 20
+
+
+class Placeholders(dict):
+    def __init__(self, with_package=False):
+        """
+        The components of a worker, which never reads the components section. A component is created on
+        first use and the records are merged into the real one afterwards.
+        :param bool with_package: give every component an empty package
+        """
+        super(Placeholders, self).__init__()
+        self._with_package = with_package
+
+    def __contains__(self, ref):
+        return True
+
+    def __missing__(self, ref):
+        component = Component()
+        component.REFDES = ref
+        if self._with_package:
+            component.package = Package()
+
+        self[ref] = component
+        return component
+
+
+class OutlineShapes(OutLine):
+    def __init__(self):
+        """
+        Keep the outline shapes of a worker in order, the ring is only built when they are merged
+        """
+        super(OutlineShapes, self).__init__()
+        self.shapes = []
+
+    def append_shape(self, line):
+        if line is not None:
+            self.shapes.append(line)
+
+
+class JobPool(object):
+    def __init__(self, workers=1):
+        """
+        Run the export jobs in a process pool, or in this process for one worker. The jobs should be plain
+        values, they are pickled to the workers. What the workers record is merged into the running recorder.
+        :param int workers: the number of processes
+        """
+        self.workers = workers
+        self._pool = multiprocessing.Pool(workers) if workers > 1 else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._pool is None:
+            return
+
+        if exc_type is None:
+            self._pool.close()
+        else:
+            self._pool.terminate()
+        self._pool.join()
+
+    def map(self, func, jobs):
+        """
+        Run the jobs
+        :param func: the module level function which runs a job
+        :param list jobs: the jobs
+        :return: the results in the order of the jobs
+        :rtype list
+        """
+        if self._pool is None:
+            return [func(job) for job in jobs]
+
+        record = instrument.recording()
+        outputs = self._pool.map(instrument.run_job, [(func, job, record) for job in jobs],
+                                 max(1, len(jobs) // (self.workers * 4)))
+
+        return [instrument.merge_job(output) for output in outputs]
+
+
+def parse_parallel(fab, filename, names, columnar=False, workers=2):
+    """
+    Parse the sections of a FabMaster file in a process pool
+    :param FabMaster fab: the board to fill
+    :param str filename: the FabMaster file
+    :param set names: the sections to load
+    :param bool columnar: see FabMaster.parse
+    :param int workers: the number of processes
+    :return:
+    """
+    index = fab.index()
+    f = open(filename, 'rb')
+    mm = open_mapped(f)
+    if mm is None:
+        f.close()
+        return
+
+    try:
+        pooled = [name for name, _, _ in index if name in names and name in POOLED_SECTIONS]
+        size = sum(end - start for name, start, end in index if name in pooled)
+        chunk_size = max(size // (workers * 4), MIN_CHUNK_SIZE)
+
+        tasks = []
+        local = []
+        for sec_index, (name, start, end) in enumerate(index):
+            if name not in names:
+                continue
+
+            if name not in pooled:
+                local.append((sec_index, name, start, end))
+                continue
+
+            body = _next_line(mm, start, end)
+            header = mm[start:body].split('!')
+            fields = GROUP_FIELDS.get(name, [])
+            columns = [header.index(field) for field in fields if field in header]
+            if len(columns) < len(fields):
+                # without the grouping fields the section can't be split safely
+                ranges = [(body, end)]
+            else:
+                ranges = split_section(mm, body, end, chunk_size, columns)
+
+            for chunk_start, chunk_end in ranges:
+                tasks.append((filename, name, sec_index, (start, body), (chunk_start, chunk_end), columnar))
+
+        pool = multiprocessing.Pool(workers)
+        try:
+            record = instrument.recording()
+            results = pool.imap(instrument.run_job, [(parse_chunk, task, record) for task in tasks])
+
+            # the components are needed by the merge, parse them while the workers are busy
+            for sec_index, name, start, end in local:
+                fab._parse_lines(mapped_lines(mm, start, end), columnar, sec_index)
+                fab._loaded_sections.add(name)
+
+            # the merge only creates new objects, see cache.load_board
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                for task, result in izip(tasks, results):
+                    merge_chunk(fab, task[1], instrument.merge_job(result))
+            finally:
+                if gc_enabled:
+                    gc.enable()
+
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        fab._loaded_sections.update(pooled)
+    finally:
+        mm.close()
+        f.close()
+
+
+def split_section(mm, start, end, chunk_size, columns=None):
+    """
+    Split the records of a section into chunks at line boundaries
+    :param mmap.mmap mm: the mapped FabMaster file
+    :param int start: the offset of the first record
+    :param int end: the offset after the last record
+    :param int chunk_size: the approximate size of a chunk in bytes
+    :param list columns: only split where the values of all these columns change
+    :return: the list of (start, end)
+    :rtype list
+    """
+    bounds = [start]
+
+    while end - bounds[-1] > chunk_size:
+        pos = _next_line(mm, bounds[-1] + chunk_size, end)
+        if columns:
+            pos = _next_group(mm, pos, end, columns)
+
+        if pos >= end:
+            break
+        bounds.append(pos)
+
+    bounds.append(end)
+    return zip(bounds[:-1], bounds[1:])
+
+
+def _next_line(mm, pos, end):
+    i = mm.find('\n', pos, end)
+    return end if i < 0 else i + 1
+
+
+def _group_key(line, columns):
+    a = line.split('!')
+    return [a[i].split(' ')[0] if i < len(a) else None for i in columns]
+
+
+def _next_group(mm, pos, end, columns):
+    prev_start = mm.rfind('\n', 0, pos - 1) + 1
+    prev = _group_key(mm[prev_start:pos], columns)
+
+    while pos < end:
+        line_end = _next_line(mm, pos, end)
+        key = _group_key(mm[pos:line_end], columns)
+        if all(a != b for a, b in zip(prev, key)):
+            return pos
+
+        prev = key
+        pos = line_end
+
+    return end
+
+
+def parse_chunk(task):
+    """
+    Parse a chunk of a section in a worker
+    :param tuple task: (filename, name, sec_index, header range, chunk range, columnar)
+    :return: the part of the model built from the chunk as the arrays of cache.py, the parent creates the
+             objects from them instead of unpickling the objects of the worker
+    :rtype dict
+    """
+    from fabmaster import FabMaster
+
+    filename, name, sec_index, header, chunk, columnar = task
+    fab = FabMaster(filename)
+    fab.components = Placeholders(with_package=(name == 'package_pins'))
+    fab.outline = OutlineShapes()
+
+    if columnar:
+        gc.disable()
+
+    f = open(filename, 'rb')
+    mm = open_mapped(f)
+    try:
+        lines = chain(mapped_lines(mm, header[0], header[1]), mapped_lines(mm, chunk[0], chunk[1]))
+        fab._parse_lines(lines, columnar, sec_index)
+    finally:
+        mm.close()
+        f.close()
+
+    arrays = dict()
+    rings = Rings()
+    refs = fab.components.keys()
+    components = [fab.components[ref] for ref in refs]
+    store_column(arrays, 'component.key', refs)
+
+    if name == 'component_pin':
+        dump_pins(arrays, 'component_pin', ComponentPin, [c.pin for c in components])
+    elif name == 'package_geometry':
+        packages = [(i, c.package) for i, c in enumerate(components) if c.package]
+        arrays['package.owner'] = np.array([i for i, _ in packages], dtype=np.int32)
+        dump_packages(arrays, [package for _, package in packages], rings)
+    elif name == 'package_pins':
+        dump_pins(arrays, 'package_pin', PackagePin, [c.package.pin for c in components])
+    elif name == 'pad_definition':
+        dump_pads(arrays, fab.pads)
+    elif name == 'copper_etch':
+        dump_copper(arrays, fab.copper, rings)
+        _dump_shapes(arrays, fab.outline.shapes, rings)
+
+    rings.store(arrays)
+    return arrays
+
+
+def _dump_shapes(arrays, shapes, rings):
+    """
+    Store the Lines and Arcs of the outline with their points
+    """
+    store_column(arrays, 'outline_shape.kind', ['ARC' if isinstance(s, Arc) else 'LINE' for s in shapes])
+    arrays['outline_shape.ring'] = np.array([rings.append(s.points) for s in shapes], dtype=np.int64)
+    arrays['outline_shape.line'] = np.array([
+        list(s.start) + list(s.end) + (list(s.center) + [s.radius] if isinstance(s, Arc) else [0.0, 0.0, 0.0])
+        for s in shapes], dtype=np.float64).reshape(-1, 7)
+    arrays['outline_shape.cw'] = np.array([getattr(s, 'cw', False) for s in shapes], dtype=bool)
+    arrays['outline_shape.width'] = np.array([s.width for s in shapes], dtype=np.float64)
+
+
+def _load_shapes(data, rings):
+    shapes = []
+    for kind, i, line, cw, width in izip(load_column(data, 'outline_shape.kind'),
+                                         data['outline_shape.ring'].tolist(), data['outline_shape.line'].tolist(),
+                                         data['outline_shape.cw'].tolist(), data['outline_shape.width'].tolist()):
+        if kind == 'ARC':
+            s = Arc(line[0:2], line[2:4], line[4:6], line[6], cw, width)
+            s._points = rings.ring(i)
+        else:
+            s = Line(line[0:2], line[2:4], width)
+        shapes.append(s)
+
+    return shapes
+
+
+def merge_chunk(fab, name, data):
+    """
+    Merge the result of a chunk into the board, the chunks must be merged in the order of the file
+    :param FabMaster fab: the board
+    :param str name: the section of the chunk
+    :param dict data: the result of parse_chunk
+    :return:
+    """
+    rings = Rings(data)
+    refs = load_column(data, 'component.key')
+
+    if name == 'component_pin':
+        load_pins(data, 'component_pin', ComponentPin, [fab.components[ref].pin for ref in refs])
+    elif name == 'package_geometry':
+        for owner, package in izip(data['package.owner'].tolist(), load_packages(data, rings)):
+            component = fab.components[refs[owner]]
+            if component.package:
+                component.package.merge(package)
+            else:
+                component.package = package
+    elif name == 'package_pins':
+        # the pins of an unknown component or of one without a package are dropped
+        owners = [fab.components[ref].package.pin if ref in fab.components and fab.components[ref].package
+                  else dict() for ref in refs]
+        load_pins(data, 'package_pin', PackagePin, owners)
+    elif name == 'pad_definition':
+        for pad_name, pads in load_pads(data).iteritems():
+            fab.pads.setdefault(pad_name, []).extend(pads)
+    elif name == 'copper_etch':
+        copper = load_copper(data, rings)
+        for layer in copper:
+            for net in copper[layer]:
+                target_object = fab.copper.setdefault(layer, dict()).setdefault(net, {'POLYGON': [], 'LINE': []})
+                target_object['POLYGON'].extend(copper[layer][net]['POLYGON'])
+                target_object['LINE'].extend(copper[layer][net]['LINE'])
+
+        for line in _load_shapes(data, rings):
+            fab.outline.append_shape(line)
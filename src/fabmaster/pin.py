@@ -1,4 +1,5 @@
 import shape
+from record import Record
 
 COMPONENT_PIN_WHITE_LIST = [
         'NET_NAME',
@@ -13,19 +14,30 @@ PACKAGE_PIN_WHITE_LIST = [
     ]
 
 
-class ComponentPin(object):
-    def __init__(self, data):
-        for key in data:
-            if key in COMPONENT_PIN_WHITE_LIST:
-                self.__dict__[key] = data[key]
+class ComponentPin(Record):
+    _fields = tuple(COMPONENT_PIN_WHITE_LIST)
+    _interned = frozenset(COMPONENT_PIN_WHITE_LIST)
+    __slots__ = _fields
 
+    def __init__(self, data):
+        self._set_fields(data)
 
-class PackagePin(object):
 
+class PackagePin(Record):
+    # 6  package_pins          'SYM_NAME', 'SYM_MIRROR', 'PIN_NAME', 'PIN_NUMBER', 'PIN_X', 'PIN_Y',
+    #                          'PAD_STACK_NAME', 'REFDES', 'PIN_ROTATION', 'TEST_POINT'
+    _fields = (
+        'SYM_NAME', 'SYM_MIRROR', 'PIN_NAME', 'PIN_NUMBER', 'PIN_X', 'PIN_Y', 'PAD_STACK_NAME', 'REFDES',
+        'PIN_ROTATION', 'TEST_POINT'
+    )
+    _interned = frozenset([
+        'SYM_NAME', 'SYM_MIRROR', 'PIN_NAME', 'PIN_NUMBER', 'PAD_STACK_NAME', 'REFDES', 'TEST_POINT'
+    ])
+    __slots__ = _fields
 
     def __init__(self, data):
-        for key in data:
-            if key in PACKAGE_PIN_WHITE_LIST:
-                self.__dict__[key] = float(data[key])
-            else:
-                self.__dict__[key] = data[key]
+        self._set_fields(data)
+
+        for key in PACKAGE_PIN_WHITE_LIST:
+            if data.get(key) is not None:
+                setattr(self, key, float(data[key]))
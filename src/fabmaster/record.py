@@ -0,0 +1,66 @@
+class Record(object):
+    """
+    The base of the records with a fixed layout, a record keeps only the fields of its section in slots
+    instead of a dict per instance. The values of the fields in _interned are repeated over many records
+    (net names, package names...), they share one string.
+    """
+    __slots__ = ()
+    _fields = ()
+    _interned = frozenset()
+
+    def _set_fields(self, data):
+        """
+        Set the fields from the raw data, the missing fields are None
+        :param dict data: raw data
+        :return:
+        """
+        interned = self._interned
+        for key in self._fields:
+            value = data.get(key)
+            if key in interned and type(value) is str:
+                value = intern(value)
+
+            setattr(self, key, value)
+
+    def fields(self):
+        """
+        Get the fields of the record
+        :return: the dict of the fields
+        :rtype dict
+        """
+        return dict((key, getattr(self, key, None)) for key in self._fields)
+
+    def update(self, fields):
+        """
+        Set the fields which were already converted, e.g. loaded from the cache
+        :param dict fields: the fields
+        :return:
+        """
+        for key in fields:
+            setattr(self, key, fields[key])
+
+    def copy(self):
+        """
+        Get a shallow copy of the record
+        :return: the record with the same fields
+        :rtype Record
+        """
+        record = object.__new__(type(self))
+        for key in self._fields:
+            setattr(record, key, getattr(self, key, None))
+
+        return record
+
+    def __getstate__(self):
+        return dict((key, getattr(self, key)) for key in _slot_names(type(self)) if hasattr(self, key))
+
+    def __setstate__(self, state):
+        self.update(state)
+
+
+def _slot_names(cls):
+    names = []
+    for klass in cls.__mro__:
+        names.extend(klass.__dict__.get('__slots__', ()))
+
+    return names
@@ -1,3 +1,5 @@
+import os
+
 __title__ = "outline"
 __versioninfo__ = (0, 0, 1)
 __version__ = ".".join(map(str, __versioninfo__))
@@ -7,10 +9,38 @@ UV_MAP_SIZE = 4096
 UV_MAP_OFFSET = 2000
 UV_MAP_SPACE = 50
 UV_MAP_BG_COLOR = "#000"
+# The name of the UV map picture and of the material of the outline which uses it
+UV_MAP_NAME = "_outline_"
+
+# The width and height of a tile of the tiled UV map, see OutLine.uv_tiles
+UV_TILE_SIZE = 2048
 
 # The unit is 1 meter
 SCALE_RATE = 0.0254 / 1000
 
+# The % format of the coordinates of the board OBJ file, '%s' writes them as str(float)
+OBJ_FLOAT_FORMAT = '%s'
+
+# Standardize the outline OBJ file by an Assimp load and export, it needs pyassimp. False writes the layout of
+# the Assimp OBJ exporter directly, see test/test_outline.py
+OUTLINE_ASSIMP = False
+
 BOARD_HEIGHT = 0.002
 PAD_HEIGHT = 0.001
 DEFAULT_COMPONENT_HEIGHT = 0.001
+
+# The RGBA base color of the packages in the binary glTF file, see FabMaster.export_glb
+GLB_PACKAGE_COLOR = (0.2, 0.2, 0.2, 1.0)
+
+# The placed packages whose canonical coordinates match within this distance share one mesh
+PACKAGE_KEY_PRECISION = 1e-7
+
+# The maximum distance between an arc and its chords in board units (mil), an arc has at most
+# ARC_MAX_SEGMENTS chords and a circle at least CIRCLE_MIN_SEGMENTS
+ARC_CHORD_ERROR = 0.25
+ARC_MAX_SEGMENTS = 360
+CIRCLE_MIN_SEGMENTS = 6
+
+# The cache of the parsed boards, the size is in bytes
+CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'fabmaster')
+CACHE_SIZE = 2 * 1024 * 1024 * 1024
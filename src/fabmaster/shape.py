@@ -1,5 +1,6 @@
 import numpy
 import geometry
+from setting import ARC_CHORD_ERROR, ARC_MAX_SEGMENTS, CIRCLE_MIN_SEGMENTS
 
 ## LINE
 ## ARC
@@ -14,6 +15,115 @@ import geometry
 ## SQUARE
 
 
+def arc_segments(radius, sweep, tolerance=ARC_CHORD_ERROR):
+    """
+    Get the number of segments of arcs, so the distance between a chord and its arc is within the tolerance
+    :param radius: the radius of each arc
+    :param sweep: the swept angle of each arc in radians
+    :param float tolerance: the maximum chord error in board units
+    :return: the number of segments of each arc
+    :rtype numpy.ndarray
+    """
+    radius = numpy.abs(numpy.atleast_1d(numpy.asarray(radius, dtype=numpy.float64)))
+    sweep = numpy.abs(numpy.atleast_1d(numpy.asarray(sweep, dtype=numpy.float64)))
+
+    # the angle of the chord whose sagitta is the tolerance
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        step = 2 * numpy.arccos(numpy.clip(1 - tolerance / radius, -1, 1))
+        segments = numpy.ceil(sweep / step)
+
+    segments[~numpy.isfinite(segments)] = 1
+    return numpy.clip(segments, 1, ARC_MAX_SEGMENTS).astype(numpy.intp)
+
+
+def tessellate_arcs(starts, ends, centers, radii, cw, tolerance=ARC_CHORD_ERROR, segments=None):
+    """
+    Discretize many arcs at once, an arc whose start is its end is a full circle
+    :param starts: the start points, (n, 2)
+    :param ends: the end points, (n, 2)
+    :param centers: the centers, (n, 2)
+    :param radii: the radius of each arc, a radius which isn't positive is measured from the center to the start
+    :param cw: whether each arc is clockwise
+    :param float tolerance: the maximum chord error in board units
+    :param segments: the number of segments of each arc instead of the tolerance
+    :return: the flat points of each arc, from its start to its end
+    :rtype list
+    """
+    starts = numpy.asarray(starts, dtype=numpy.float64).reshape(-1, 2)
+    ends = numpy.asarray(ends, dtype=numpy.float64).reshape(-1, 2)
+    centers = numpy.asarray(centers, dtype=numpy.float64).reshape(-1, 2)
+    radii = numpy.asarray(radii, dtype=numpy.float64).reshape(-1)
+    cw = numpy.asarray(cw, dtype=bool).reshape(-1)
+    if len(starts) == 0:
+        return []
+
+    radii = numpy.where(radii > 0, radii, numpy.hypot(*(starts - centers).T))
+    start_angles = numpy.arctan2(starts[:, 1] - centers[:, 1], starts[:, 0] - centers[:, 0])
+    end_angles = numpy.arctan2(ends[:, 1] - centers[:, 1], ends[:, 0] - centers[:, 0])
+
+    # the counterclockwise sweep is in (0, 2pi], the clockwise one in [-2pi, 0)
+    sweeps = numpy.mod(end_angles - start_angles, 2 * numpy.pi)
+    full = numpy.all(starts == ends, axis=1) | (sweeps == 0)
+    sweeps = numpy.where(cw, sweeps - 2 * numpy.pi, sweeps)
+    sweeps[full] = numpy.where(cw[full], -2 * numpy.pi, 2 * numpy.pi)
+
+    if segments is None:
+        segments = arc_segments(radii, sweeps, tolerance)
+    else:
+        segments = numpy.broadcast_to(numpy.asarray(segments, dtype=numpy.intp), radii.shape)
+
+    # every arc has segments + 1 points, the first and the last ones are kept exact
+    counts = segments + 1
+    offsets = numpy.cumsum(counts) - counts
+    arc = numpy.repeat(numpy.arange(len(counts)), counts)
+    k = numpy.arange(counts.sum()) - offsets[arc]
+    angles = start_angles[arc] + sweeps[arc] * k / segments[arc]
+
+    points = numpy.empty((len(arc), 2))
+    points[:, 0] = centers[arc, 0] + radii[arc] * numpy.cos(angles)
+    points[:, 1] = centers[arc, 1] + radii[arc] * numpy.sin(angles)
+    points[offsets] = starts
+    points[offsets + segments] = ends
+
+    return [p.reshape(-1) for p in numpy.split(points, offsets[1:])]
+
+
+def arc_points(start, end, center, radius, cw, segments=None):
+    """
+    Discretize one arc, see tessellate_arcs
+    :param list start: the start point
+    :param list end: the end point
+    :param list center: the center
+    :param float radius: the radius
+    :param bool cw: whether the arc is clockwise
+    :param int segments: the number of segments instead of ARC_CHORD_ERROR
+    :return: the flat points from the start to the end
+    :rtype numpy.ndarray
+    """
+    return tessellate_arcs([start], [end], [center], [radius], [cw], segments=segments)[0]
+
+
+def signed_areas(rings):
+    """
+    Get the signed area of rings, it is positive for a counterclockwise ring
+    :param list rings: the flat points of each ring, a ring has at least 3 points
+    :return: the area of each ring
+    :rtype numpy.ndarray
+    """
+    sizes = numpy.array([len(ring) // 2 for ring in rings])
+    starts = numpy.concatenate([[0], numpy.cumsum(sizes)[:-1]])
+    points = numpy.concatenate(rings).reshape(-1, 2)
+
+    # the index of the next point of each point in its ring
+    following = numpy.arange(1, len(points) + 1)
+    following[starts + sizes - 1] = starts
+
+    x, y = points[:, 0], points[:, 1]
+    cross = x * y[following] - x[following] * y
+
+    return numpy.add.reduceat(cross, starts) / 2
+
+
 class BaseShape(object):
     _points = numpy.array([])
 
@@ -92,37 +202,13 @@ class Arc(BaseShape):
         self.center = center
         self.radius = radius
         self.cw = cw
-        self._precision = 6
         self.width = width
 
     def _update_points(self):
         if self.radius <= 0:
             self._calc_radius()
 
-        start_angle = numpy.arctan2(
-            self.start[1] - self.center[1],
-            self.start[0] - self.center[0]
-        )
-
-        if self.start[0] == self.end[0] and self.start[1] == self.end[1]:
-            end_angle = 2 * numpy.pi - start_angle
-        else:
-            end_angle = numpy.arctan2(
-                self.end[1] - self.center[1],
-                self.end[0] - self.center[0]
-            )
-        precision = self._precision if abs(end_angle - start_angle) < numpy.pi else self._precision * 2
-        prefix = -1 if self.cw else 1
-        step_angle = abs(end_angle - start_angle) / precision
-        points = numpy.array(self.start)
-
-        for n in xrange(1, precision):
-            x = self.center[0] + self.radius * numpy.cos(start_angle + prefix * n * step_angle)
-            y = self.center[1] + self.radius * numpy.sin(start_angle + prefix * n * step_angle)
-            points = numpy.append(points, [x, y])
-
-        points = numpy.append(points, self.end)
-        self._points = points
+        self._points = arc_points(self.start, self.end, self.center, self.radius, self.cw)
 
     def _calc_radius(self):
         self.radius = numpy.sqrt(
@@ -136,7 +222,67 @@ class Cross(BaseShape):
         super(Cross, self).__init__()
 
 
-class Polygon(BaseShape):
+class RingShape(BaseShape):
+    def __init__(self):
+        """
+        A closed ring built from Lines and Arcs. The shapes are kept as arrays while they are appended and the
+        point buffer is built once, when the points are read.
+        """
+        super(RingShape, self).__init__()
+        self._buffer = numpy.array([])
+        self._pending = []
+        self._first = None
+        self._last = None
+
+    def _get_points(self):
+        if self._pending:
+            self._buffer = numpy.concatenate([self._buffer] + self._pending)
+            self._pending = []
+
+        return self._buffer
+
+    def _set_points(self, points):
+        self._buffer = points
+        self._pending = []
+        self._first = None
+        self._last = None
+
+    _points = property(_get_points, _set_points)
+
+    def append(self, shape):
+        """
+        Append a shape, the start of a shape which continues the ring is dropped, and so is a shape which
+        closes the ring
+        :param shape: the Line or Arc
+        :return:
+        """
+        shape_points = shape.points
+
+        if self._last is None:
+            if len(self._buffer) == 0 and not self._pending:
+                self._set_points(shape_points)
+                self._first = tuple(shape_points[:2])
+                self._last = tuple(shape_points[-2:])
+                return
+
+            self._first = tuple(self._buffer[:2])
+            self._last = tuple(self._buffer[-2:])
+
+        if self._last == tuple(shape_points[:2]):
+            end = tuple(shape_points[-2:])
+            if self._first != end:
+                self._pending.append(shape_points[2:])
+                self._last = end
+        else:
+            self._pending.append(shape_points)
+            self._last = tuple(shape_points[-2:])
+
+    @property
+    def points(self):
+        return self._points
+
+
+class Polygon(RingShape):
     def __init__(self):
         super(Polygon, self).__init__()
         self._holes = []
@@ -144,27 +290,29 @@ class Polygon(BaseShape):
         self._hole_vertex_indices = []
         self._geometry_inst = None
 
+    @classmethod
+    def from_points(cls, points, holes=()):
+        """
+        Create a polygon from the points which were built before
+        :param numpy.ndarray points: the flat points of the polygon
+        :param list holes: the flat points of each hole
+        :rtype Polygon
+        """
+        polygon = cls()
+        polygon._points = points
+
+        for hole_points in holes:
+            polygon.add_hole()
+            polygon._holes[-1]._points = hole_points
+
+        return polygon
+
     def append(self, shape):
         assert isinstance(shape, (Line, Arc)), "Parameter should be an instance of Line or Arc"
 
         # self._shapes.append(shape)
 
-        if len(self._points) == 0:
-            self._points = shape.points
-        else:
-            points = list(self._points)
-            shape_points = list(shape.points)
-            if cmp(points[-2:], shape_points[:2]) == 0:
-                if cmp(points[:2], shape_points[-2:]) != 0:
-                    points.extend(shape_points[2:])
-            else:
-                points.extend(shape_points)
-
-            self._points = numpy.array(points)
-
-    @property
-    def points(self):
-        return self._points
+        super(Polygon, self).append(shape)
 
     def add_hole(self):
         self._holes.append(Hole())
@@ -178,22 +326,18 @@ class Polygon(BaseShape):
         return self._holes
 
     def extrude(self, z):
-        data = [list(self._points)]
-
-        for hole in self._holes:
-            if hole.points:
-                data.extend([list(hole.points)])
-
-        return geometry.extrude(data, z)
+        return geometry.extrude([list(ring) for ring in self.rings()], z)
 
     def triangulate(self):
-        data = [list(self._points)]
+        return geometry.triangulate([list(ring) for ring in self.rings()])
 
-        for hole in self._holes:
-            if hole.points:
-                data.extend([list(hole.points)])
-
-        return geometry.triangulate(data)
+    def rings(self):
+        """
+        Get the rings of the polygon, the outer ring first and then the holes
+        :return: the flat point arrays of the rings
+        :rtype list
+        """
+        return [self._points] + [hole.points for hole in self._holes if len(hole.points) > 0]
 
     def translate(self, offset):
         assert isinstance(offset, (list, tuple)), "Parameter should be a list or tuple"
@@ -228,31 +372,11 @@ class Polygon(BaseShape):
             hole.scale(rate)
 
 
-class Hole(BaseShape):
+class Hole(RingShape):
     def __init__(self):
         super(Hole, self).__init__()
         self._shape = []
 
-    def append(self, shape):
-        # self._shape.append(shape)
-
-        if len(self._points) == 0:
-            self._points = shape.points
-        else:
-            points = list(self._points)
-            shape_points = list(shape.points)
-            if cmp(points[-2:], shape_points[:2]) == 0:
-                if cmp(points[:2], shape_points[-2:]) != 0:
-                    points.extend(shape_points[2:])
-            else:
-                points.extend(shape_points)
-
-            self._points = numpy.array(points)
-
-    @property
-    def points(self):
-        return self._points
-
 
 class OblongX(Polygon):
     def __init__(self, start, end):
@@ -313,27 +437,17 @@ class Circle(Polygon):
 
         self.start = start
         self.center = center
-        self._precision = 12
         self.cw = cw
 
         self._calc_radius()
         self._update_points()
 
     def _update_points(self):
-        start_angle = numpy.arctan2(
-            self.start[1] - self.center[1],
-            self.start[0] - self.center[0]
-        )
-        prefix = -1 if self.cw else 1
-        step_angle = 2 * numpy.pi / self._precision
-        points = numpy.array(self.start)
-
-        for n in xrange(1, self._precision):
-            x = self.center[0] + self.radius * numpy.cos(start_angle + prefix * n * step_angle)
-            y = self.center[1] + self.radius * numpy.sin(start_angle + prefix * n * step_angle)
-            points = numpy.append(points, [x, y])
+        segments = max(int(arc_segments(self.radius, 2 * numpy.pi)[0]), CIRCLE_MIN_SEGMENTS)
+        points = arc_points(self.start, self.start, self.center, self.radius, self.cw, segments)
 
-        self._points = points
+        # the last point is the start again
+        self._points = points[:-2]
 
     def _calc_radius(self):
         self.radius = numpy.sqrt(
@@ -0,0 +1,128 @@
+import io
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# The size of the reads of the compressed file and of the buffer of the decompressed stream
+READ_SIZE = 1 << 20
+
+# The leading bytes of each supported compression
+MAGIC = [
+    ('gzip', '\x1f\x8b'),
+    ('xz', '\xfd7zXZ\x00'),
+    ('zstd', '\x28\xb5\x2f\xfd'),
+]
+
+
+def compression(filename):
+    """
+    Detect the compression of a file from its leading bytes
+    :param str filename: the file
+    :return: 'gzip', 'xz', 'zstd', or None for a plain file
+    :rtype str
+    """
+    with open(filename, 'rb') as f:
+        head = f.read(6)
+
+    for name, magic in MAGIC:
+        if head.startswith(magic):
+            return name
+
+    return None
+
+
+def open_source(filename):
+    """
+    Open a FabMaster file for reading, a compressed file is decompressed while it is read
+    :param str filename: the file
+    :return: the file object, a buffered decompressed stream for a compressed file
+    """
+    kind = compression(filename)
+    if kind is None:
+        return open(filename, 'rb')
+
+    return io.BufferedReader(DecompressedReader(open(filename, 'rb'), kind), READ_SIZE)
+
+
+class DecompressedReader(io.RawIOBase):
+    def __init__(self, f, kind):
+        """
+        The raw stream of the decompressed content of a file, the concatenated members or frames are read
+        one after another
+        :param file f: the compressed file opened in binary mode
+        :param str kind: the compression, see MAGIC
+        """
+        super(DecompressedReader, self).__init__()
+        self._file = f
+        self._kind = kind
+        self._decompressor = _decompressor(kind)
+        self._data = ''
+        self._pos = 0
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while self._pos >= len(self._data) and not self._eof:
+            self._fill()
+
+        n = min(len(b), len(self._data) - self._pos)
+        b[:n] = self._data[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super(DecompressedReader, self).close()
+
+    def _fill(self):
+        chunk = self._file.read(READ_SIZE)
+        if not chunk:
+            self._data = self._decompressor.flush() if hasattr(self._decompressor, 'flush') else ''
+            self._pos = 0
+            self._eof = True
+            return
+
+        if getattr(self._decompressor, 'eof', False):
+            self._decompressor = _decompressor(self._kind)
+
+        data = self._decompressor.decompress(chunk)
+        unused = getattr(self._decompressor, 'unused_data', '')
+        while unused:
+            # the next member or frame
+            self._decompressor = _decompressor(self._kind)
+            data += self._decompressor.decompress(unused)
+            unused = getattr(self._decompressor, 'unused_data', '')
+
+        self._data = data
+        self._pos = 0
+
+
+def _decompressor(kind):
+    if kind == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    if kind == 'xz':
+        if lzma is None:
+            raise ImportError("Reading .xz files needs the lzma module (backports.lzma on Python 2)")
+        return lzma.LZMADecompressor()
+
+    if kind == 'zstd':
+        if zstandard is None:
+            raise ImportError("Reading .zst files needs the zstandard module")
+        return zstandard.ZstdDecompressor().decompressobj()
+
+    raise ValueError("Unknown compression %s" % kind)
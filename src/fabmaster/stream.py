@@ -0,0 +1,117 @@
+from collections import namedtuple
+
+from index import SECTION_NAMES, open_mapped, scan_sections, mapped_lines, stream_sections
+from source import compression, open_source
+
+
+def iter_records(filename, section, where=None):
+    """
+    Iterate the records of a section without building the board, only one record is held at a time
+    :param str filename: the FabMaster file
+    :param str section: the section name, see SECTION_NAMES
+    :param where: only yield the matching records, a dict of {field: value or list of values} which is tested
+                  before the record is split, or a function which takes the record
+    :return: the generator of namedtuples, the fields are the columns of the section and the missing cells are
+             None
+    """
+    assert section in SECTION_NAMES, "Unknown section %s" % section
+    assert where is None or isinstance(where, dict) or callable(where), "Parameter should be a dict or function"
+
+    sec_index = SECTION_NAMES.index(section)
+    f = open_source(filename)
+    mm = None
+    try:
+        if compression(filename):
+            lines = _section_lines(f, sec_index)
+        else:
+            mm = open_mapped(f)
+            ranges = scan_sections(mm)
+            lines = mapped_lines(mm, *ranges[sec_index]) if sec_index < len(ranges) else None
+
+        if lines is None:
+            return
+
+        fields = _split(next(lines))[1:]
+        record_type = namedtuple(_type_name(section), fields, rename=True)
+        size = len(fields)
+
+        tests = None
+        if isinstance(where, dict):
+            tests = _compile_where(where, fields)
+            where = None
+
+        for line in lines:
+            if not line.startswith('S!'):
+                continue
+
+            if tests is not None and not _match(line, tests):
+                continue
+
+            values = _split(line)[1:size + 1]
+            if len(values) < size:
+                values.extend([None] * (size - len(values)))
+
+            record = record_type._make(values)
+            if where is None or where(record):
+                yield record
+    finally:
+        if mm is not None:
+            mm.close()
+        f.close()
+
+
+def _section_lines(f, sec_index):
+    for i, lines in stream_sections(f):
+        if i == sec_index:
+            return lines
+
+    return None
+
+
+def _split(line):
+    a = line.split('!')
+    a.pop()
+    return a
+
+
+def _type_name(section):
+    return ''.join(word.capitalize() for word in section.split('_')) + 'Record'
+
+
+def _compile_where(where, fields):
+    """
+    Compile the field conditions into the tests of the raw lines
+    :param dict where: {field: value or list of values}
+    :param list fields: the fields of the section
+    :return: the list of (column, values, needle), needle is the text a matching line must contain
+    :rtype list
+    """
+    tests = []
+    for field in where:
+        assert field in fields, "Unknown field %s" % field
+
+        values = where[field]
+        if isinstance(values, basestring):
+            values = [values]
+        values = frozenset(values)
+
+        needle = '!%s!' % next(iter(values)) if len(values) == 1 else None
+        tests.append((fields.index(field) + 1, values, needle))
+
+    # the cheap substring tests reject most lines first
+    tests.sort(key=lambda test: test[2] is None)
+    return tests
+
+
+def _match(line, tests):
+    for column, values, needle in tests:
+        if needle is not None and needle not in line:
+            return False
+
+    # only split up to the last tested column
+    a = line.split('!', max(column for column, _, _ in tests) + 1)
+    for column, values, needle in tests:
+        if column >= len(a) - 1 or a[column] not in values:
+            return False
+
+    return True
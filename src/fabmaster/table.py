@@ -0,0 +1,198 @@
+from itertools import izip_longest
+import numpy as np
+import shape
+
+
+def to_floats(values):
+    """
+    Convert a sequence of raw strings to a float64 array
+    :param list values: the raw strings, empty or invalid cells become NaN
+    :return: the converted values
+    :rtype numpy.ndarray
+    """
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array([_to_float(v) for v in values], dtype=np.float64)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def graphic_shapes(table, rows, width=False):
+    """
+    Build the shapes of the GRAPHIC_DATA records of a section
+    :param SectionTable table: the section which has the GRAPHIC_DATA_n fields
+    :param rows: the row indices
+    :param bool width: whether to keep the width of LINE and ARC
+    :return: the Line or Arc of each row, None for the other kinds
+    :rtype list
+    """
+    rows = np.asarray(rows, dtype=np.intp)
+    kinds = table.categorical('GRAPHIC_DATA_NAME')
+    shapes = [None] * len(rows)
+
+    # LINE: start, end, width
+    idx = np.flatnonzero(kinds.equal('LINE')[rows])
+    if len(idx):
+        line_rows = rows[idx]
+        x1, y1, x2, y2 = [table.floats('GRAPHIC_DATA_%d' % n, line_rows).tolist() for n in range(1, 5)]
+        widths = table.floats('GRAPHIC_DATA_5', line_rows).tolist() if width else [0] * len(idx)
+        for k, i in enumerate(idx.tolist()):
+            shapes[i] = shape.Line([x1[k], y1[k]], [x2[k], y2[k]], widths[k])
+
+    # ARC: start, end, center, radius, width, direction
+    idx = np.flatnonzero(kinds.equal('ARC')[rows])
+    if len(idx):
+        arc_rows = rows[idx]
+        x1, y1, x2, y2, cx, cy, r = [table.floats('GRAPHIC_DATA_%d' % n, arc_rows).tolist() for n in range(1, 8)]
+        widths = table.floats('GRAPHIC_DATA_8', arc_rows).tolist() if width else [0.0] * len(idx)
+        cw = (table.categorical('GRAPHIC_DATA_9').equal('CLOCKWISE')[arc_rows]).tolist()
+
+        # the points of all arcs are built at once instead of on the first use of each arc
+        arc_points = shape.tessellate_arcs(
+            np.column_stack([x1, y1]), np.column_stack([x2, y2]), np.column_stack([cx, cy]), r, cw
+        )
+        for k, i in enumerate(idx.tolist()):
+            arc = shape.Arc([x1[k], y1[k]], [x2[k], y2[k]], [cx[k], cy[k]], r[k], cw[k], widths[k])
+            arc._points = arc_points[k]
+            shapes[i] = arc
+
+    return shapes
+
+
+class Categorical(object):
+    def __init__(self, values):
+        """
+        Encode a column as integer codes into its distinct values
+        :param list values: the raw column values
+        """
+        index = dict()
+        self.codes = np.array([index.setdefault(v, len(index)) for v in values], dtype=np.int32)
+        self.categories = [None] * len(index)
+        for value, code in index.iteritems():
+            self.categories[code] = value
+        self._index = index
+
+    def __len__(self):
+        return len(self.codes)
+
+    def equal(self, value):
+        """
+        Get the mask of rows equal to value
+        :param str value:
+        :return: the boolean mask
+        :rtype numpy.ndarray
+        """
+        if value not in self._index:
+            return np.zeros(len(self.codes), dtype=bool)
+
+        return self.codes == self._index[value]
+
+    def isin(self, values):
+        """
+        Get the mask of rows whose value is one of values
+        :param list values:
+        :return: the boolean mask
+        :rtype numpy.ndarray
+        """
+        codes = [self._index[v] for v in values if v in self._index]
+        return np.in1d(self.codes, codes)
+
+    def take(self, rows):
+        """
+        Decode the values of the given rows
+        :param rows: the row indices
+        :return: the values
+        :rtype list
+        """
+        categories = self.categories
+        return [categories[c] for c in self.codes[rows]]
+
+
+class SectionTable(object):
+    def __init__(self, name, fields, rows):
+        """
+        The rows of one section stored column by column
+        :param str name: the section name
+        :param list fields: the field names of the 'A' record
+        :param list rows: the split 'S' records without the leading record type
+        """
+        self.name = name
+        self.fields = list(fields)
+        self._size = len(rows)
+        self._columns = dict()
+        self._categorical = dict()
+
+        # A short row leaves its missing fields as None
+        columns = list(izip_longest(*rows)) if rows else []
+        for i, field in enumerate(self.fields):
+            self._columns[field] = columns[i] if i < len(columns) else (None,) * self._size
+
+    def __len__(self):
+        return self._size
+
+    def column(self, field):
+        """
+        Get the raw values of a column
+        :param str field: the field name
+        :return: the values, None for missing cells
+        :rtype tuple
+        """
+        if field not in self._columns:
+            return (None,) * self._size
+
+        return self._columns[field]
+
+    def categorical(self, field):
+        """
+        Get a column encoded as a Categorical, the result is cached
+        :param str field: the field name
+        :rtype Categorical
+        """
+        if field not in self._categorical:
+            self._categorical[field] = Categorical(self.column(field))
+
+        return self._categorical[field]
+
+    def floats(self, field, rows=None):
+        """
+        Get a column converted to float64
+        :param str field: the field name
+        :param rows: only convert the given row indices
+        :rtype numpy.ndarray
+        """
+        values = self.column(field)
+        if rows is not None:
+            values = [values[i] for i in rows]
+
+        return to_floats(values)
+
+    def take(self, field, rows):
+        """
+        Get the raw values of a column at the given rows
+        :param str field: the field name
+        :param rows: the row indices
+        :rtype list
+        """
+        values = self.column(field)
+        return [values[i] for i in rows]
+
+    def records(self, fields=None, rows=None):
+        """
+        Iterate the rows as dicts, for the consumers which need the raw record
+        :param list fields: only include these fields
+        :param rows: only yield the given row indices
+        :return: the generator of dicts, missing cells are left out
+        """
+        fields = [f for f in (fields or self.fields) if f in self._columns]
+        columns = [self._columns[f] for f in fields]
+        if rows is None:
+            rows = xrange(self._size)
+
+        for i in rows:
+            yield dict((f, c[i]) for f, c in zip(fields, columns) if c[i] is not None)
@@ -1,8 +1,14 @@
 import shape
+from record import Record
 
 
-class VIA(object):
+class VIA(Record):
+    # 7  vias                  'VIA_X', 'VIA_Y', 'PAD_STACK_NAME', 'NET_NAME', 'TEST_POINT', 'VIA_MIRROR',
+    #                          'VIA_ROTATION'
+    _fields = ('VIA_X', 'VIA_Y', 'PAD_STACK_NAME', 'NET_NAME', 'TEST_POINT', 'VIA_MIRROR', 'VIA_ROTATION')
+    _interned = frozenset(['PAD_STACK_NAME', 'NET_NAME', 'TEST_POINT', 'VIA_MIRROR', 'VIA_ROTATION'])
+    __slots__ = _fields
+
     def __init__(self, data=None):
         if data:
-            for key in data:
-                self.__dict__[key] = data[key]
\ No newline at end of file
+            self._set_fields(data)
@@ -3,6 +3,7 @@
 #include "earcut.hpp"
 #include "numpy/arrayobject.h"
 
+#include <algorithm>
 #include <array>
 #include <vector>
 #include <iostream>
@@ -335,6 +336,240 @@ static PyGetSetDef Geometry_GetSeters[] = {
     {NULL}  /* Sentinel */
 };
 
+/*
+    batch triangulation and extrusion of many polygons, the rings of all polygons are in one buffer.
+ */
+struct PolygonMesh {
+    std::vector<double> vertices;   // x, y, z
+    std::vector<uint32_t> faces;    // the indices of the vertices of this polygon
+};
+
+static bool Batch_ParseBuffers(PyObject* pArgs, const char* format, PyArrayObject** coords,
+                               PyArrayObject** ringOffsets, PyArrayObject** polygonOffsets, double* height) {
+    PyObject* coordsObj = NULL;
+    PyObject* ringOffsetsObj = NULL;
+    PyObject* polygonOffsetsObj = NULL;
+
+    bool parsed = height ?
+        PyArg_ParseTuple(pArgs, format, &coordsObj, &ringOffsetsObj, &polygonOffsetsObj, height) :
+        PyArg_ParseTuple(pArgs, format, &coordsObj, &ringOffsetsObj, &polygonOffsetsObj);
+    if (!parsed) return false;
+
+    // no copy when the buffers are already contiguous arrays of the right type
+    *coords = (PyArrayObject*)PyArray_FROMANY(coordsObj, NPY_DOUBLE, 1, 1, NPY_ARRAY_IN_ARRAY);
+    *ringOffsets = (PyArrayObject*)PyArray_FROMANY(ringOffsetsObj, NPY_INTP, 1, 1, NPY_ARRAY_IN_ARRAY);
+    *polygonOffsets = (PyArrayObject*)PyArray_FROMANY(polygonOffsetsObj, NPY_INTP, 1, 1, NPY_ARRAY_IN_ARRAY);
+
+    if (*coords && *ringOffsets && *polygonOffsets) {
+        npy_intp numPoints = PyArray_SIZE(*coords) / 2;
+        npy_intp numRings = PyArray_SIZE(*ringOffsets) - 1;
+        npy_intp* rings = (npy_intp*)PyArray_DATA(*ringOffsets);
+        npy_intp* polygons = (npy_intp*)PyArray_DATA(*polygonOffsets);
+        npy_intp numPolygons = PyArray_SIZE(*polygonOffsets) - 1;
+
+        bool valid = numRings >= 0 && numPolygons >= 0 && rings[0] == 0 && polygons[0] == 0
+                     && rings[numRings] <= numPoints && polygons[numPolygons] <= numRings;
+        for (npy_intp i = 0; valid && i < numRings; i++) valid = rings[i] <= rings[i + 1];
+        for (npy_intp i = 0; valid && i < numPolygons; i++) valid = polygons[i] <= polygons[i + 1];
+
+        if (valid) return true;
+        PyErr_SetString(PyExc_ValueError, "The offsets don't match the coordinates");
+    }
+
+    Py_XDECREF(*coords);
+    Py_XDECREF(*ringOffsets);
+    Py_XDECREF(*polygonOffsets);
+    return false;
+}
+
+static void Batch_Triangulate(const double* coords, const npy_intp* rings, npy_intp firstRing, npy_intp lastRing,
+                              PolygonMesh& mesh) {
+    Polygon polygon;
+    Points points;
+    Point point;
+
+    for (npy_intp r = firstRing; r < lastRing; r++) {
+        for (npy_intp p = rings[r]; p < rings[r + 1]; p++) {
+            point[0] = coords[2 * p];
+            point[1] = coords[2 * p + 1];
+            points.push_back(point);
+        }
+
+        polygon.push_back(points);
+        points.clear();
+    }
+
+    if (!polygon.empty()) {
+        mesh.faces = mapbox::earcut<N>(polygon);
+    }
+}
+
+// the same layout as Geometry.extrude: the extruded vertices, the bottom faces, the extruded faces
+// and the side faces
+static void Batch_Extrude(const double* coords, const npy_intp* rings, npy_intp firstRing, npy_intp lastRing,
+                          double height, PolygonMesh& mesh) {
+    Batch_Triangulate(coords, rings, firstRing, lastRing, mesh);
+
+    uint32_t num = rings[lastRing] - rings[firstRing];
+    uint32_t first = rings[firstRing];
+    if (num == 0) return;
+
+    std::vector<double>& vertices = mesh.vertices;
+    vertices.resize(num * 6);
+
+    double* lower = &vertices[height > 0 ? num * 3 : 0];
+    double* upper = &vertices[height > 0 ? 0 : num * 3];
+    for (uint32_t i = 0; i < num; i++) {
+        lower[3 * i] = upper[3 * i] = coords[2 * (first + i)];
+        lower[3 * i + 1] = upper[3 * i + 1] = coords[2 * (first + i) + 1];
+        lower[3 * i + 2] = 0.0;
+        upper[3 * i + 2] = height;
+    }
+
+    std::vector<uint32_t>& faces = mesh.faces;
+    size_t numIndices = faces.size();
+    faces.reserve(numIndices * 2 + num * 6);
+
+    for (size_t i = 0; i < numIndices; i += 3) {
+        faces.push_back(faces[i + 2] + num);
+        faces.push_back(faces[i + 1] + num);
+        faces.push_back(faces[i] + num);
+    }
+
+    uint32_t vertexIndex = 0;
+    for (npy_intp r = firstRing; r < lastRing; r++) {
+        uint32_t size = rings[r + 1] - rings[r];
+
+        for (uint32_t j = 0; j < size; j++) {
+            uint32_t next = j + 1 >= size ? vertexIndex - j : vertexIndex + 1;
+
+            faces.push_back(next);
+            faces.push_back(vertexIndex);
+            faces.push_back(vertexIndex + num);
+
+            faces.push_back(vertexIndex + num);
+            faces.push_back(next + num);
+            faces.push_back(next);
+
+            vertexIndex++;
+        }
+    }
+}
+
+static PyObject* Batch_Run(PyObject* pArgs, bool extrude) {
+    PyArrayObject* coordsArr = NULL;
+    PyArrayObject* ringOffsetsArr = NULL;
+    PyArrayObject* polygonOffsetsArr = NULL;
+    double height = 0;
+
+    if (!Batch_ParseBuffers(pArgs, extrude ? "OOOd" : "OOO", &coordsArr, &ringOffsetsArr, &polygonOffsetsArr,
+                            extrude ? &height : NULL)) {
+        return NULL;
+    }
+
+    const double* coords = (const double*)PyArray_DATA(coordsArr);
+    const npy_intp* rings = (const npy_intp*)PyArray_DATA(ringOffsetsArr);
+    const npy_intp* polygons = (const npy_intp*)PyArray_DATA(polygonOffsetsArr);
+    npy_intp numPolygons = PyArray_SIZE(polygonOffsetsArr) - 1;
+
+    std::vector<PolygonMesh> meshes(numPolygons);
+    bool failed = false;
+
+    // only the buffers are read below, other threads may run meanwhile
+    Py_BEGIN_ALLOW_THREADS
+    try {
+        for (npy_intp i = 0; i < numPolygons; i++) {
+            // a polygon without rings has an empty mesh
+            if (polygons[i] == polygons[i + 1]) continue;
+
+            if (extrude) {
+                Batch_Extrude(coords, rings, polygons[i], polygons[i + 1], height, meshes[i]);
+            } else {
+                Batch_Triangulate(coords, rings, polygons[i], polygons[i + 1], meshes[i]);
+            }
+        }
+    } catch (...) {
+        failed = true;
+    }
+    Py_END_ALLOW_THREADS
+
+    Py_DECREF(coordsArr);
+    Py_DECREF(ringOffsetsArr);
+    Py_DECREF(polygonOffsetsArr);
+
+    if (failed) {
+        PyErr_SetString(PyExc_MemoryError, "Failed to triangulate the polygons");
+        return NULL;
+    }
+
+    npy_intp offsetsDims[1] = {numPolygons + 1};
+    PyObject* vertexOffsets = PyArray_SimpleNew(1, offsetsDims, NPY_INTP);
+    PyObject* faceOffsets = PyArray_SimpleNew(1, offsetsDims, NPY_INTP);
+    if (!vertexOffsets || !faceOffsets) {
+        Py_XDECREF(vertexOffsets);
+        Py_XDECREF(faceOffsets);
+        return NULL;
+    }
+
+    npy_intp* vertexOffsetsPtr = (npy_intp*)PyArray_DATA(vertexOffsets);
+    npy_intp* faceOffsetsPtr = (npy_intp*)PyArray_DATA(faceOffsets);
+
+    vertexOffsetsPtr[0] = 0;
+    faceOffsetsPtr[0] = 0;
+    for (npy_intp i = 0; i < numPolygons; i++) {
+        vertexOffsetsPtr[i + 1] = vertexOffsetsPtr[i] + meshes[i].vertices.size() / 3;
+        faceOffsetsPtr[i + 1] = faceOffsetsPtr[i] + meshes[i].faces.size() / 3;
+    }
+
+    npy_intp vertexDims[2] = {vertexOffsetsPtr[numPolygons], 3};
+    npy_intp faceDims[2] = {faceOffsetsPtr[numPolygons], 3};
+    PyObject* vertices = PyArray_SimpleNew(2, vertexDims, NPY_DOUBLE);
+    PyObject* faces = PyArray_SimpleNew(2, faceDims, NPY_UINT32);
+    if (!vertices || !faces) {
+        Py_XDECREF(vertices);
+        Py_XDECREF(faces);
+        Py_DECREF(vertexOffsets);
+        Py_DECREF(faceOffsets);
+        return NULL;
+    }
+
+    double* verticesPtr = (double*)PyArray_DATA(vertices);
+    uint32_t* facesPtr = (uint32_t*)PyArray_DATA(faces);
+
+    for (npy_intp i = 0; i < numPolygons; i++) {
+        std::copy(meshes[i].vertices.begin(), meshes[i].vertices.end(), verticesPtr + vertexOffsetsPtr[i] * 3);
+        std::copy(meshes[i].faces.begin(), meshes[i].faces.end(), facesPtr + faceOffsetsPtr[i] * 3);
+    }
+
+    if (extrude) {
+        return Py_BuildValue("NNNN", vertices, vertexOffsets, faces, faceOffsets);
+    }
+
+    Py_DECREF(vertices);
+    Py_DECREF(vertexOffsets);
+    return Py_BuildValue("NN", faces, faceOffsets);
+}
+
+static PyObject* Batch_TriangulateMany(PyObject* self, PyObject* pArgs) {
+    return Batch_Run(pArgs, false);
+}
+
+static PyObject* Batch_ExtrudeMany(PyObject* self, PyObject* pArgs) {
+    return Batch_Run(pArgs, true);
+}
+
+static PyMethodDef Module_Methods[] =
+{
+    {"triangulate_many", (PyCFunction)Batch_TriangulateMany, METH_VARARGS,
+     "triangulate_many(coords, ring_offsets, polygon_offsets) -> (faces, face_offsets)\n"
+     "Triangulate many polygons, the faces of a polygon index the points of its own rings"},
+    {"extrude_many", (PyCFunction)Batch_ExtrudeMany, METH_VARARGS,
+     "extrude_many(coords, ring_offsets, polygon_offsets, height) -> (vertices, vertex_offsets, faces, face_offsets)\n"
+     "Extrude many polygons, the faces of a polygon index its own vertices"},
+
+    {NULL}
+};
+
 static PyTypeObject Geometry_ClassInfo =
 {
     PyVarObject_HEAD_INIT(NULL, 0)
@@ -384,7 +619,7 @@ PyMODINIT_FUNC init_geometry() {
     if(PyType_Ready(&Geometry_ClassInfo) < 0)
         return;
 
-    pReturn = Py_InitModule3("_geometry", Geometry_MethodMembers, "extension for geometry methods");
+    pReturn = Py_InitModule3("_geometry", Module_Methods, "extension for geometry methods");
     Py_INCREF(&Geometry_ClassInfo);
     PyModule_AddObject(pReturn, "Geometry", (PyObject*)&Geometry_ClassInfo); //将这个类加入到模块的Dictionary中.
 
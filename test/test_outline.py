@@ -0,0 +1,118 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'fabmaster'))
+
+import shape
+from outline import OutLine
+from setting import BOARD_HEIGHT, SCALE_RATE, UV_MAP_NAME
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def sample_outline():
+    """
+    Build a board of 1000 x 600 mil with a rounded corner, scaled as FabMaster.export_outline does
+    :rtype OutLine
+    """
+    outline = OutLine()
+    for line in [shape.Line([0.0, 0.0], [1000.0, 0.0]),
+                 shape.Line([1000.0, 0.0], [1000.0, 400.0]),
+                 shape.Arc([1000.0, 400.0], [800.0, 600.0], [800.0, 400.0], 200.0, False),
+                 shape.Line([800.0, 600.0], [0.0, 600.0]),
+                 shape.Line([0.0, 600.0], [0.0, 0.0])]:
+        outline.append_shape(line)
+    outline.scale(SCALE_RATE)
+
+    return outline
+
+
+def read_obj(filename):
+    """
+    Read the statements of an OBJ file
+    :param str filename: the OBJ file
+    :return: the v, vt and vn rows, the faces as the (v, vt, vn) indices of their corners and the g and usemtl
+             names
+    :rtype dict
+    """
+    obj = dict((key, []) for key in ['v', 'vt', 'vn', 'f', 'g', 'usemtl'])
+    with open(filename) as fh:
+        for line in fh:
+            a = line.split()
+            if not a or a[0] not in obj:
+                continue
+
+            if a[0] == 'f':
+                obj['f'].append([[int(i) for i in corner.split('/')] for corner in a[1:]])
+            elif a[0] in ['g', 'usemtl']:
+                obj[a[0]].append(' '.join(a[1:]))
+            else:
+                obj[a[0]].append([float(v) for v in a[1:]])
+
+    return obj
+
+
+def corner_values(obj):
+    """
+    Get the position, texcoord and normal at each corner of the faces
+    :param dict obj: see read_obj
+    :return: the (3m, 8) values
+    :rtype numpy.ndarray
+    """
+    corners = np.array(obj['f']).reshape(-1, 3) - 1
+    v = np.array(obj['v'])[corners[:, 0]]
+    vt = np.array(obj['vt'])[corners[:, 1], :2]
+    vn = np.array(obj['vn'])[corners[:, 2]]
+
+    return np.hstack([v, vt, vn])
+
+
+class OutlineObjTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_assimp_layout(self):
+        """
+        The reference is the outline.obj of the previous OutLine.save: the OBJ file of _save_to_obj loaded and
+        exported again by Assimp 5.2, i.e. pyassimp.load and pyassimp.export with their default processing
+        """
+        filename = os.path.join(self.path, 'outline.obj')
+        sample_outline()._save_to_obj(filename, BOARD_HEIGHT)
+        obj = read_obj(filename)
+        reference = read_obj(os.path.join(DATA_PATH, 'outline.obj'))
+
+        # the positions, texcoords and normals are shared by the faces
+        for key in ['v', 'vt', 'vn', 'f']:
+            self.assertEqual(len(obj[key]), len(reference[key]), key)
+
+        # a face has one normal
+        for face in obj['f']:
+            self.assertEqual(len(face), 3)
+            self.assertEqual(len(set(corner[2] for corner in face)), 1)
+
+        # the faces are one group of one material
+        self.assertEqual(obj['g'], reference['g'])
+        self.assertEqual(obj['usemtl'], reference['usemtl'])
+        self.assertEqual(obj['usemtl'], [UV_MAP_NAME])
+
+        # Assimp writes the values as float32
+        np.testing.assert_allclose(corner_values(obj), corner_values(reference), rtol=1e-6, atol=1e-9)
+
+    def test_save_without_assimp(self):
+        sample_outline().save(self.path)
+
+        self.assertTrue(os.path.isfile(os.path.join(self.path, 'meshes', 'outline.obj')))
+        self.assertTrue(os.path.isfile(os.path.join(self.path, 'meshes', 'outline.mtl')))
+        self.assertNotIn('pyassimp', sys.modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'fabmaster'))
+
+import shape
+from copper import Copper
+from outline import OutLine, _tile_filename, _uv_color
+from parallel import JobPool
+from setting import SCALE_RATE, UV_MAP_SIZE
+
+
+def sample_board(seed=2):
+    """
+    Build a board of 4100 x 3100 mil with copper pours on both layers, the pours have round holes of two arcs
+    :param int seed: the seed of the pours
+    :return: the outline scaled as FabMaster.export_outline does and the copper of each layer
+    :rtype tuple
+    """
+    outline = OutLine()
+    for start, end in [([0.0, 0.0], [4100.0, 0.0]), ([4100.0, 0.0], [4100.0, 3100.0]),
+                       ([4100.0, 3100.0], [0.0, 3100.0]), ([0.0, 3100.0], [0.0, 0.0])]:
+        outline.append_shape(shape.Line(start, end))
+    outline.scale(SCALE_RATE)
+
+    rng = random.Random(seed)
+    copper_obj = {}
+    for layer in ['TOP', 'BOTTOM']:
+        pours = []
+        for _ in range(30):
+            x0, y0 = rng.uniform(10, 3790), rng.uniform(10, 2790)
+            x1, y1 = min(x0 + rng.uniform(150, 1500), 4090), min(y0 + rng.uniform(150, 1500), 3090)
+
+            copper = Copper()
+            for start, end in [((x0, y0), (x1, y0)), ((x1, y0), (x1, y1)), ((x1, y1), (x0, y1)), ((x0, y1), (x0, y0))]:
+                copper.append_shape(shape.Line(list(start), list(end)))
+
+            for _ in range(rng.randint(1, 8)):
+                r = rng.uniform(3, 40)
+                if x1 - x0 < 2 * r + 6 or y1 - y0 < 2 * r + 6:
+                    continue
+
+                cx, cy = rng.uniform(x0 + r + 2, x1 - r - 2), rng.uniform(y0 + r + 2, y1 - r - 2)
+                copper.add_hole()
+                copper.append_hole_shape(shape.Arc([cx - r, cy], [cx + r, cy], [cx, cy], r, False))
+                copper.append_hole_shape(shape.Arc([cx + r, cy], [cx - r, cy], [cx, cy], r, False))
+
+            pours.append(copper)
+
+        copper_obj[layer] = {'GND': {'POLYGON': pours, 'LINE': []}}
+
+    return outline, copper_obj
+
+
+class UvTilesTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def uv_picture(self, outline, copper_obj):
+        """
+        Render the UV map and get its picture before the JPEG compression, from the rasters of the layers
+        :rtype np.ndarray
+        """
+        outline.uv_map(copper_obj, self.path)
+
+        _, _, _, places = outline._uv_layout(UV_MAP_SIZE, len(copper_obj))
+        uv_im = Image.new("RGB", (UV_MAP_SIZE, UV_MAP_SIZE))
+        for layer, place in zip(copper_obj, places):
+            im = Image.open(os.path.join(self.path, 'meshes', 'uv', layer + '.png'))
+            if outline.width > outline.height:
+                im = im.rotate(90, expand=True)
+            uv_im.paste(im, place)
+
+        return np.asarray(_uv_color(uv_im))
+
+    def stitched_tiles(self, outline, copper_obj, tile):
+        """
+        Render the tiles of the UV map at UV_MAP_SIZE and stitch the tiles of level 0
+        :rtype np.ndarray
+        """
+        with JobPool(1) as pool:
+            outline.uv_tiles(copper_obj, self.path, UV_MAP_SIZE, pool, tile)
+
+        tiles_path = os.path.join(self.path, 'meshes', 'uv_tiles')
+        columns = -(-UV_MAP_SIZE // tile)
+        uv_im = Image.new("RGB", (UV_MAP_SIZE, UV_MAP_SIZE))
+        for column in range(columns):
+            for row in range(columns):
+                uv_im.paste(Image.open(_tile_filename(tiles_path, 0, column, row)), (column * tile, row * tile))
+
+        return np.asarray(uv_im)
+
+    def test_tiles_equal_uv_map(self):
+        """
+        The polygons cross the edges of the tiles, every tile has the pixels of the map
+        """
+        outline, copper_obj = sample_board()
+        expected = self.uv_picture(outline, copper_obj)
+
+        for tile in [256, 333, 1000]:
+            differ = np.argwhere((self.stitched_tiles(outline, copper_obj, tile) != expected).any(axis=2))
+            self.assertEqual(len(differ), 0, 'tile %d differs at %s' % (tile, differ[:5].tolist()))
+
+
+if __name__ == '__main__':
+    unittest.main()